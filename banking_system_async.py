@@ -0,0 +1,212 @@
+"""
+An asyncio front-end for the banking system.
+
+AsyncBankingSystem: Awaitable versions of the `BankingSystem` methods, run by a single
+    writer task that applies queued calls in batches, so that many in-flight requests
+    share one commit.
+
+Example:
+    async with AsyncBankingSystem() as bank:
+        await bank.create_account(1, 'account1')
+        balances = await asyncio.gather(*(bank.deposit(t, 'account1', 10) for t in range(2, 1002)))
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from banking_system_impl import create_banking_system
+
+
+class AsyncBankingSystem:
+    """
+    Awaitable banking operations with group commits.
+
+    Every call is put on a queue and resolved by one writer task. Whenever the writer is
+    free it takes everything queued so far (up to `max_batch` calls) and applies it on a
+    dedicated thread with `apply_batch`, which runs the whole group as one unit of work and
+    one commit. While that commit is in progress new calls collect in the queue and form
+    the next group, so the number of commits follows the database rather than the number
+    of callers. Calls are applied in the order they were made, exactly as if they had been
+    made one by one on the underlying system, and a call only returns once its group has
+    been committed.
+
+    If a group fails it is rolled back and its calls are retried one at a time, so an
+    error only reaches the call that caused it. Engines without `apply_batch` cannot roll
+    a group back, so their calls are applied one by one, once each, and every call gets
+    its own result or exception.
+
+    Attributes:
+        system (BankingSystem): The system the calls are applied to.
+        max_batch (int): The most calls applied in one group.
+        batches (int): The number of groups applied so far.
+        operations (int): The number of calls applied so far.
+    """
+
+    def __init__(self, system=None, max_batch=1000, **options):
+        """
+        Args:
+            system (BankingSystem | None): The system to front. A new one is made with
+                `create_banking_system(**options)` if None.
+            max_batch (int): The most calls applied in one group.
+        """
+        self.system = system if system is not None else create_banking_system(**options)
+        self.max_batch = max_batch
+        self.batches = 0
+        self.operations = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="banking-writer")
+        self._queue = None
+        self._writer = None
+
+    async def __aenter__(self):
+        self._start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _start(self):
+        """
+        Starts the writer task on the running event loop if it is not running yet.
+        """
+        if self._writer is None:
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    async def close(self):
+        """
+        Waits for every queued call to be applied, then stops the writer task and thread.
+        """
+        if self._writer is not None:
+            self._queue.put_nowait(None)
+            await self._writer
+            self._writer = None
+        self._executor.shutdown()
+
+    def _submit(self, op, args):
+        """
+        Queues a call and returns the future its result is delivered to.
+        """
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, args, future))
+        return future
+
+    def _apply(self, operations):
+        """
+        Applies a group of (op, args) calls as one unit of work on the writer thread.
+        """
+        return self.system.apply_batch(operations, len(operations))
+
+    def _apply_each(self, operations):
+        """
+        Applies a group of (op, args) calls one by one on the writer thread, for engines
+        that cannot roll a group back.
+
+        Returns:
+            list[tuple[bool, object]]: For each call, whether it returned and its result or
+            the exception it raised.
+        """
+        outcomes = []
+        for op, args in operations:
+            try:
+                outcomes.append((True, getattr(self.system, op)(*args)))
+            except Exception as error:
+                outcomes.append((False, error))
+        return outcomes
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            group = [item]
+            while len(group) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                group.append(item)
+
+            operations = [(op, args) for op, args, _ in group]
+            if getattr(self.system, "apply_batch", None) is None:
+                outcomes = await loop.run_in_executor(self._executor, self._apply_each, operations)
+                for (_, _, future), (returned, value) in zip(group, outcomes):
+                    if not future.done():
+                        if returned:
+                            future.set_result(value)
+                        else:
+                            future.set_exception(value)
+            else:
+                try:
+                    results = await loop.run_in_executor(self._executor, self._apply, operations)
+                except Exception:
+                    await self._apply_one_by_one(loop, group)
+                else:
+                    for (_, _, future), result in zip(group, results):
+                        if not future.done():
+                            future.set_result(result)
+            self.batches += 1
+            self.operations += len(group)
+
+    async def _apply_one_by_one(self, loop, group):
+        """
+        Retries the calls of a failed group separately, delivering each outcome to its caller.
+        """
+        for op, args, future in group:
+            try:
+                results = await loop.run_in_executor(self._executor, self._apply, [(op, args)])
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                if not future.done():
+                    future.set_result(results[0])
+
+    async def create_account(self, timestamp: int, account_id: str) -> bool:
+        """
+        Awaitable `BankingSystem.create_account`.
+        """
+        return await self._submit("create_account", (timestamp, account_id))
+
+    async def deposit(self, timestamp: int, account_id: str, amount: int) -> int | None:
+        """
+        Awaitable `BankingSystem.deposit`.
+        """
+        return await self._submit("deposit", (timestamp, account_id, amount))
+
+    async def transfer(self, timestamp: int, source_account_id: str, target_account_id: str, amount: int) -> int | None:
+        """
+        Awaitable `BankingSystem.transfer`.
+        """
+        return await self._submit("transfer", (timestamp, source_account_id, target_account_id, amount))
+
+    async def top_spenders(self, timestamp: int, n: int) -> list[str]:
+        """
+        Awaitable `BankingSystem.top_spenders`.
+        """
+        return await self._submit("top_spenders", (timestamp, n))
+
+    async def pay(self, timestamp: int, account_id: str, amount: int) -> str | None:
+        """
+        Awaitable `BankingSystem.pay`.
+        """
+        return await self._submit("pay", (timestamp, account_id, amount))
+
+    async def get_payment_status(self, timestamp: int, account_id: str, payment: str) -> str | None:
+        """
+        Awaitable `BankingSystem.get_payment_status`.
+        """
+        return await self._submit("get_payment_status", (timestamp, account_id, payment))
+
+    async def merge_accounts(self, timestamp: int, account_id_1: str, account_id_2: str) -> bool:
+        """
+        Awaitable `BankingSystem.merge_accounts`.
+        """
+        return await self._submit("merge_accounts", (timestamp, account_id_1, account_id_2))
+
+    async def get_balance(self, timestamp: int, account_id: str, time_at: int) -> int | None:
+        """
+        Awaitable `BankingSystem.get_balance`.
+        """
+        return await self._submit("get_balance", (timestamp, account_id, time_at))
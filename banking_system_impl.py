@@ -1,8 +1,14 @@
+import inspect
 import os
 import sqlite3
+import threading
+import weakref
 import banking_system
 from banking_system import *
-import math
+from banking_system_memory import CASHBACK_DELAY, InMemoryBankingSystem, cashback_for
+from banking_system_indexes import AccountAliases, AccountCache, BalanceIndex, CashbackQueue, SpenderLeaderboard
+from banking_system_metrics import InstrumentedCursor, Metrics, instrumented
+from contextlib import contextmanager
 
 
 """
@@ -10,29 +16,88 @@ SQL Statements Documentation
 
 creates tables: This SQL script creates the necessary tables for the banking system. 
 insert_user_data: Inserts a new user into the user_data table. The values to be inserted are provided as parameters.
+register_account: Gives a newly created account a new integer surrogate key in the accounts table.
+current_account_key: Retrieves the surrogate key of the latest account created with an account id.
+account_of_key: Retrieves the account id a surrogate key was given to.
+link_account: Records in the accounts table which account a merged away account was merged into.
+account_links: Retrieves every (merged away key, surviving key) pair, used to load the account aliases.
 new_balance: Inserts a new balance record into the balances table. The values to be inserted are provided as parameters.
 record_transaction: Records a transaction in the transactions table. The values to be inserted are provided as parameters.
-top_spenders: Retrieves the top spenders based on the outgoing transactions. The result is organized by the total outgoing transactions in descending order.
+live_account_keys: Retrieves the surrogate key of every existing account.
+outgoing_totals: Retrieves the total outgoing transactions recorded under each surrogate key, used to load the top spenders leaderboard.
 update_balance: Updates the balance for a specific account in the balances table.
-check_cashbacks: Checks the total cashback amount for a specific account up to a given date.
-merge_cashbacks: Retrieves the individual cashback amounts for a specific account up to a given date.
-update_transaction_id: Updates the account ID for transactions in the transactions table.
+balance_of: Retrieves the current balance of an account; no row means the account does not exist.
+store_balance: Inserts or updates the balance of an account, used to flush batched balance updates.
+pending_cashbacks: Retrieves every payment whose cashback has not been refunded yet, used to load the cashback queue.
+cashback_payment: Retrieves the payer's key and the amount of a payment whose cashback has not been refunded yet.
+settle_cashback: Marks the cashback of a payment as refunded.
+advance_sequence: Increments a named counter in the sequences table.
+sequence_value: Reads the current value of a named counter in the sequences table.
 record_balance: Records a balance history entry in the balance_history table.
 delete_account: deletes a user account from the user_data table
 delete_balance: deletes a balance record for the specific account from the balances table.
-add_merge_date: Updates the merge date for an account in the balance_history table.
+balance_history_of: Retrieves the balance history of one account in timestamp order, used to load the balance index.
+compaction_key_range: Retrieves how many account keys follow a key, up to a limit, and the last of them; used to walk the accounts in batches.
+collapse_balance_history: Deletes every balance history row of a range of account keys before a cutoff except the last one of each period.
+account_row: Retrieves the user_data row of an account.
+payment_record: Retrieves the payer's key and the cashback date of a payment.
+update_account_columns: One UPDATE per user_data column, used by `Query.update_account_info`.
+statements: The registry of every fixed statement by name, see `register_statement`.
+transaction_types: The integer code stored in transactions.type_of_transaction for each kind of transaction.
+schema_migrations: Statements that upgrade an older database to the current SCHEMA_VERSION, keyed by the version they produce.
 
 """
 
+# Stored in the database's `PRAGMA user_version` so older files can be migrated.
+SCHEMA_VERSION = 6
+
+# Where BankingSystemImpl keeps its data unless told otherwise.
+DEFAULT_DB_PATH = "chem_274B_fp.db"
+
+# The default `BankingSystemImpl.compact_balance_history` period: one checkpoint per
+# account per day, in milliseconds.
+CHECKPOINT_INTERVAL = 86400000
+
+# Tables an existing database must have (after migration) to be opened.
+required_tables = frozenset(("user_data", "balances", "accounts", "transactions", "balance_history", "sequences"))
+
+# Tables every banking database has had since version 0, which the migrations start from.
+legacy_tables = frozenset(("user_data", "balances", "transactions", "balance_history"))
+
+# Stored in transactions.type_of_transaction instead of the name of the transaction.
+transaction_types = {"deposit": 1, "transfer": 2, "payment": 3}
+
+
+def format_payment(payment_id):
+    """
+    Renders an integer payment id as the payment number returned by `pay`, e.g. "payment12".
+    """
+    return f"payment{payment_id}"
+
+
+def parse_payment(payment):
+    """
+    Returns the integer id of a payment number such as "payment12", or None if `payment`
+    is not a payment number `format_payment` could have produced.
+    """
+    digits = payment[len("payment"):] if isinstance(payment, str) and payment.startswith("payment") else ""
+    if not (digits.isascii() and digits.isdigit()) or digits.startswith("0"):
+        return None
+    return int(digits)
+
+
 create_tables = """
 BEGIN;
 -- Drop tables if they exist
 DROP TABLE IF EXISTS user_data;
 DROP TABLE IF EXISTS balances;
 DROP TABLE IF EXISTS transactions;
+DROP TABLE IF EXISTS balance_history;
+DROP TABLE IF EXISTS sequences;
+DROP TABLE IF EXISTS accounts;
 
 CREATE TABLE IF NOT EXISTS user_data (
-    account_id VARCHAR(255),
+    account_id VARCHAR(255) PRIMARY KEY,
     create_date TIMESTAMP,
     active BOOLEAN DEFAULT True,
     merge_id VARCHAR(255),
@@ -41,30 +106,246 @@ CREATE TABLE IF NOT EXISTS user_data (
 );
 
 CREATE TABLE IF NOT EXISTS balances (
-    account_id VARCHAR(255),
+    account_id VARCHAR(255) PRIMARY KEY,
     amount INT,
     account_date TIMESTAMP
 );
 
+-- Integer surrogate keys, so the transaction log and balance history store a small
+-- integer per row instead of the account id text. Every account created gets a new key,
+-- so an id created again after being merged away has several; keys are never reused or
+-- deleted. merged_into links a merged away account to the account that absorbed it.
+CREATE TABLE IF NOT EXISTS accounts (
+    account_key INTEGER PRIMARY KEY,
+    account_id VARCHAR(255) NOT NULL,
+    merged_into INT
+);
+
+-- Serves current_account_key and balance_history_of
+CREATE INDEX IF NOT EXISTS accounts_account_id
+ON accounts (account_id, account_key);
+
+-- type_of_transaction holds a code from transaction_types and payment_id the number of
+-- a payment (NULL for other transactions)
 CREATE TABLE IF NOT EXISTS transactions (
-    account_id VARCHAR(255),
+    account_key INT,
     amount INT,
     date_of_transaction TIMESTAMP,
-    type_of_transaction VARCHAR(255),
-    payment_number VARCHAR(255),
-    cashback_date TIMESTAMP
+    type_of_transaction INT,
+    payment_id INT,
+    cashback_date TIMESTAMP,
+    cashback_settled BOOLEAN DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS balance_history (
-    account_id VARCHAR(255),
+    account_key INT,
     amount INT,
     balance_date TIMESTAMP,
     merge_date TIMESTAMP
 );
 
+-- Monotonic counters, e.g. the number of payments made so far
+CREATE TABLE IF NOT EXISTS sequences (
+    name VARCHAR(255) PRIMARY KEY,
+    value INT NOT NULL
+);
+
+INSERT INTO sequences VALUES ('payment', 0);
+
+-- Serves the per-account transaction lookups
+CREATE INDEX IF NOT EXISTS transactions_account_type_cashback
+ON transactions (account_key, type_of_transaction, cashback_date);
+
+-- Serves pending_cashbacks (3 is the payment type)
+CREATE INDEX IF NOT EXISTS transactions_pending_cashbacks
+ON transactions (cashback_date)
+WHERE type_of_transaction=3 AND cashback_settled=0;
+
+-- Serves get_payment_status and the cashback lookups
+CREATE UNIQUE INDEX IF NOT EXISTS transactions_payment_id
+ON transactions (payment_id)
+WHERE payment_id IS NOT NULL;
+
+-- Serves the get_balance point-in-time lookups
+CREATE INDEX IF NOT EXISTS balance_history_account_date
+ON balance_history (account_key, balance_date);
+
 COMMIT;
 """
 
+schema_migrations = {
+    # Version 0 databases stored every table as a heap without keys or indexes.
+    1: [
+        "ALTER TABLE user_data RENAME TO user_data_v0",
+        """
+        CREATE TABLE user_data (
+            account_id VARCHAR(255) PRIMARY KEY,
+            create_date TIMESTAMP,
+            active BOOLEAN DEFAULT True,
+            merge_id VARCHAR(255),
+            merge_date TIMESTAMP,
+            account_balance INT DEFAULT 0
+        )
+        """,
+        "INSERT OR REPLACE INTO user_data SELECT * FROM user_data_v0 ORDER BY rowid",
+        "DROP TABLE user_data_v0",
+        "ALTER TABLE balances RENAME TO balances_v0",
+        """
+        CREATE TABLE balances (
+            account_id VARCHAR(255) PRIMARY KEY,
+            amount INT,
+            account_date TIMESTAMP
+        )
+        """,
+        "INSERT OR REPLACE INTO balances SELECT * FROM balances_v0 ORDER BY rowid",
+        "DROP TABLE balances_v0",
+        """
+        CREATE INDEX IF NOT EXISTS transactions_account_type_cashback
+        ON transactions (account_id, type_of_transaction, cashback_date)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS transactions_payment_number
+        ON transactions (payment_number)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS balance_history_account_date
+        ON balance_history (account_id, balance_date)
+        """,
+    ],
+    # Cashbacks used to be added on every read; they are now credited to the stored
+    # balance once. Every existing payment starts unsettled, so any refund that is
+    # already due is credited by the next operation.
+    2: [
+        "ALTER TABLE transactions ADD COLUMN cashback_settled BOOLEAN DEFAULT 0",
+        """
+        CREATE INDEX IF NOT EXISTS transactions_pending_cashbacks
+        ON transactions (cashback_date)
+        WHERE type_of_transaction='payment' AND cashback_settled=0
+        """,
+    ],
+    # Payment numbers used to be computed by counting every payment row.
+    3: [
+        """
+        CREATE TABLE IF NOT EXISTS sequences (
+            name VARCHAR(255) PRIMARY KEY,
+            value INT NOT NULL
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO sequences
+        SELECT 'payment', COUNT(*) FROM transactions WHERE type_of_transaction='payment'
+        """,
+    ],
+    # Merged away accounts are now marked by a balance_history row with a NULL amount at
+    # the merge date, instead of only by the merge_date column of their older rows.
+    4: [
+        """
+        INSERT INTO balance_history (account_id, amount, balance_date, merge_date)
+        SELECT account_id, NULL, MAX(merge_date), MAX(merge_date)
+        FROM balance_history
+        WHERE merge_date IS NOT NULL
+        GROUP BY account_id
+        """,
+    ],
+    # The transaction log and balance history stored the account id, transaction type
+    # and payment number as text in every row; they now store integers. The renamed
+    # tables take their old indexes with them when they are dropped.
+    5: [
+        """
+        CREATE TABLE IF NOT EXISTS accounts (
+            account_key INTEGER PRIMARY KEY,
+            account_id VARCHAR(255) NOT NULL UNIQUE
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO accounts (account_id)
+        SELECT account_id FROM user_data
+        UNION SELECT account_id FROM transactions
+        UNION SELECT account_id FROM balance_history
+        """,
+        "ALTER TABLE transactions RENAME TO transactions_v4",
+        """
+        CREATE TABLE transactions (
+            account_key INT,
+            amount INT,
+            date_of_transaction TIMESTAMP,
+            type_of_transaction INT,
+            payment_id INT,
+            cashback_date TIMESTAMP,
+            cashback_settled BOOLEAN DEFAULT 0
+        )
+        """,
+        """
+        INSERT INTO transactions
+        SELECT
+            A.account_key,
+            T.amount,
+            T.date_of_transaction,
+            CASE T.type_of_transaction WHEN 'deposit' THEN 1 WHEN 'transfer' THEN 2 WHEN 'payment' THEN 3 END,
+            CASE WHEN T.type_of_transaction='payment' THEN CAST(SUBSTR(T.payment_number, 8) AS INTEGER) END,
+            T.cashback_date,
+            T.cashback_settled
+        FROM transactions_v4 T JOIN accounts A ON A.account_id = T.account_id
+        ORDER BY T.rowid
+        """,
+        "DROP TABLE transactions_v4",
+        "ALTER TABLE balance_history RENAME TO balance_history_v4",
+        """
+        CREATE TABLE balance_history (
+            account_key INT,
+            amount INT,
+            balance_date TIMESTAMP,
+            merge_date TIMESTAMP
+        )
+        """,
+        """
+        INSERT INTO balance_history
+        SELECT A.account_key, H.amount, H.balance_date, H.merge_date
+        FROM balance_history_v4 H JOIN accounts A ON A.account_id = H.account_id
+        ORDER BY H.rowid
+        """,
+        "DROP TABLE balance_history_v4",
+        """
+        CREATE INDEX transactions_account_type_cashback
+        ON transactions (account_key, type_of_transaction, cashback_date)
+        """,
+        """
+        CREATE INDEX transactions_pending_cashbacks
+        ON transactions (cashback_date)
+        WHERE type_of_transaction=3 AND cashback_settled=0
+        """,
+        """
+        CREATE UNIQUE INDEX transactions_payment_id
+        ON transactions (payment_id)
+        WHERE payment_id IS NOT NULL
+        """,
+        """
+        CREATE INDEX balance_history_account_date
+        ON balance_history (account_key, balance_date)
+        """,
+    ],
+    # Merges used to move every transaction of the merged away account to the surviving
+    # one; they are now recorded as a link between the two keys. Earlier merges were
+    # already moved, so existing keys start unlinked. Keys are no longer unique per id,
+    # since an id created again after a merge gets a new one.
+    6: [
+        "ALTER TABLE accounts RENAME TO accounts_v5",
+        """
+        CREATE TABLE accounts (
+            account_key INTEGER PRIMARY KEY,
+            account_id VARCHAR(255) NOT NULL,
+            merged_into INT
+        )
+        """,
+        "INSERT INTO accounts (account_key, account_id) SELECT account_key, account_id FROM accounts_v5",
+        "DROP TABLE accounts_v5",
+        """
+        CREATE INDEX accounts_account_id
+        ON accounts (account_id, account_key)
+        """,
+    ],
+}
+
 insert_user_data = """
 INSERT INTO user_data
 VALUES (
@@ -72,32 +353,61 @@ VALUES (
 );
 """
 
+register_account="""
+INSERT INTO accounts (account_id)
+VALUES (?);
+"""
+
+current_account_key="""
+SELECT MAX(account_key)
+FROM accounts
+WHERE account_id=?;
+"""
+
+account_of_key="""
+SELECT account_id
+FROM accounts
+WHERE account_key=?;
+"""
+
+link_account="""
+UPDATE accounts
+SET merged_into=?
+WHERE account_key=?;
+"""
+
+account_links="""
+SELECT account_key, merged_into
+FROM accounts
+WHERE merged_into IS NOT NULL;
+"""
+
 new_balance="""
 INSERT INTO balances
 VALUES (?, ?, ?);
 """
 
 record_transaction="""
-INSERT INTO transactions
+INSERT INTO transactions (
+    account_key, amount, date_of_transaction, type_of_transaction, payment_id, cashback_date
+)
 VALUES (
-    ?, ?, ?, ?, ?, ?
+    (SELECT MAX(account_key) FROM accounts WHERE account_id=?), ?, ?, ?, ?, ?
 );
 """
 
-top_spenders="""
-SELECT 
-    D.account_id, 
-    COALESCE(SUM(CASE
-                    WHEN T.amount < 0 THEN -T.amount 
-                    ELSE 0
-                 END), 0) as total_outgoing_transactions
-FROM user_data D LEFT JOIN transactions T
-ON D.account_id = T.account_id
-GROUP BY D.account_id
-ORDER BY 
-    total_outgoing_transactions DESC, 
-    D.account_id ASC
-LIMIT ?;
+live_account_keys="""
+SELECT D.account_id, MAX(A.account_key)
+FROM user_data D JOIN accounts A
+ON A.account_id = D.account_id
+GROUP BY D.account_id;
+"""
+
+outgoing_totals="""
+SELECT account_key, -SUM(amount)
+FROM transactions
+WHERE amount < 0
+GROUP BY account_key;
 """
 
 update_balance="""
@@ -106,31 +416,53 @@ SET amount=?, account_date=?
 WHERE account_id=?;
 """
 
-check_cashbacks="""
-SELECT SUM(amount)
+balance_of="""
+SELECT amount
+FROM balances
+WHERE account_id=?;
+"""
+
+store_balance="""
+INSERT INTO balances
+VALUES (?, ?, ?)
+ON CONFLICT(account_id) DO UPDATE
+SET amount=excluded.amount, account_date=excluded.account_date;
+"""
+
+pending_cashbacks="""
+SELECT cashback_date, payment_id, payment_id
 FROM transactions 
-WHERE account_id=? 
-AND type_of_transaction='payment'
-AND cashback_date <= ?;
+WHERE type_of_transaction=3
+AND cashback_settled=0;
 """
 
-merge_cashbacks="""
-SELECT amount
+cashback_payment="""
+SELECT account_key, amount
 FROM transactions 
-WHERE account_id=? 
-AND type_of_transaction='payment'
-AND cashback_date <= ?;
+WHERE payment_id=? AND cashback_settled=0;
 """
 
-update_transaction_id="""
+settle_cashback="""
 UPDATE transactions
-SET account_id=?
-WHERE account_id=?;
+SET cashback_settled=1
+WHERE payment_id=?;
+"""
+
+advance_sequence="""
+UPDATE sequences
+SET value=value + 1
+WHERE name=?;
+"""
+
+sequence_value="""
+SELECT value
+FROM sequences
+WHERE name=?;
 """
 
 record_balance="""
 INSERT INTO balance_history
-VALUES (?, ?, ?, ?);
+VALUES ((SELECT MAX(account_key) FROM accounts WHERE account_id=?), ?, ?, ?);
 """
 
 delete_account="""
@@ -141,63 +473,621 @@ delete_balance="""
 DELETE FROM balances WHERE account_id =?
 """
 
-add_merge_date="""
-UPDATE balance_history
-SET merge_date=?
-WHERE account_id=?
+balance_history_of="""
+SELECT balance_date, amount
+FROM balance_history
+WHERE account_key IN (SELECT account_key FROM accounts WHERE account_id=?)
+ORDER BY balance_date, rowid;
+"""
+
+compaction_key_range="""
+SELECT COUNT(*), MAX(account_key)
+FROM (SELECT account_key FROM accounts WHERE account_key > ? ORDER BY account_key LIMIT ?);
 """
 
+# Keeps the last row (by date, then insertion order) of every account key and period, which
+# holds the balance at the end of the period. A NULL marker left by a merge is always the
+# last row of its key, since an id created again gets a new key.
+collapse_balance_history="""
+DELETE FROM balance_history
+WHERE rowid IN (
+    SELECT rowid
+    FROM (
+        SELECT rowid, ROW_NUMBER() OVER (
+            PARTITION BY account_key, balance_date / ?
+            ORDER BY balance_date DESC, rowid DESC
+        ) AS newer_rows
+        FROM balance_history
+        WHERE account_key BETWEEN ? AND ? AND balance_date < ?
+    )
+    WHERE newer_rows > 1
+)
+RETURNING 1;
+"""
+
+account_row="""
+SELECT *
+FROM user_data
+WHERE account_id=?;
+"""
+
+payment_record="""
+SELECT account_key, cashback_date
+FROM transactions
+WHERE payment_id=?;
+"""
+
+update_account_columns = {
+    column: f"""
+UPDATE user_data
+SET {column}=?
+WHERE account_id=?;
+"""
+    for column in ("create_date", "active", "merge_id", "merge_date", "account_balance")
+}
+
+# Statements that only touch user_data and sequences, which are never batched, so they can
+# run while batched rows are still waiting to be flushed.
+#
+# register_account may run before earlier buffered rows of the same id are flushed: an id
+# only gets a new key after it was merged away, and `merge_accounts` flushes the batch
+# after the last row it buffers for the merged away id.
+batch_independent = frozenset((insert_user_data, register_account, advance_sequence, sequence_value))
+
+# Every fixed statement by name. Statement texts never change, so each connection parses a
+# statement once and then reuses it from its prepared statement cache.
+statements = {
+    name: globals()[name]
+    for name in (
+        "create_tables", "insert_user_data", "register_account", "current_account_key", "account_of_key",
+        "link_account", "account_links", "new_balance", "record_transaction", "live_account_keys", "outgoing_totals",
+        "update_balance", "balance_of", "store_balance", "pending_cashbacks", "cashback_payment", "settle_cashback",
+        "advance_sequence", "sequence_value", "record_balance", "delete_account", "delete_balance",
+        "balance_history_of", "account_row", "payment_record", "compaction_key_range", "collapse_balance_history",
+    )
+}
+for column, statement in update_account_columns.items():
+    statements[f"update_account_{column}"] = statement
+
+# Template names reported by `Query.metrics`, keyed by statement text.
+statement_names = {statement: name for name, statement in statements.items()}
+
+# How many prepared statements each connection keeps; comfortably more than the registry.
+STATEMENT_CACHE_SIZE = 256
+
+
+def register_statement(name, statement):
+    """
+    Adds a fixed statement to the registry and returns it.
+    """
+    statements[name] = statement
+    statement_names[statement] = name
+    return statement
+
+# PRAGMAs applied to every new connection by each durability profile.
+#   strict:     WAL with a sync on every commit; a committed operation survives power loss.
+#   balanced:   WAL syncing only at checkpoints; a crash cannot corrupt the database, but a
+#               power loss may lose the last few commits.
+#   throughput: no syncs and larger caches, for replays and benchmarks that can be rerun.
+# In WAL mode readers see the last committed state while a writer holds its transaction
+# open, so get_balance and top_spenders traffic does not wait for writes to commit.
+durability_profiles = {
+    "strict": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+    },
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+class ConnectionManager:
+    """
+    Keeps long-lived SQLite connections so that queries do not pay for a file open
+    and schema parse on every call.
+
+    Each thread is given its own connection (and a single reusable cursor) the first
+    time it needs one and keeps it for as long as it lives. At most `pool_size`
+    connections are checked out at once; a thread asking for a connection while the
+    pool is exhausted waits until another thread hands its connection back. Threads
+    hand their connection back at the end of an operation only when somebody is
+    waiting for it, so single-threaded callers never pay for a release.
+
+    `db_name` may also be a "file:" URI. For a shared-cache in-memory database such as
+    "file:bank?mode=memory&cache=shared" an extra connection is kept open until
+    `close_all`, since SQLite drops the database as soon as its last connection closes.
+
+    Attributes:
+        db_name (str): The database the connections are opened against.
+        pool_size (int): The maximum number of connections checked out at once.
+        timeout (float): Seconds to wait for a free connection before giving up.
+        pragmas (dict): PRAGMA settings applied to each connection when it is opened.
+        cached_statements (int): The number of prepared statements each connection keeps.
+        counters (dict): Health and reuse counters, see `stats`.
+    """
+
+    def __init__(self, db_name, pool_size=8, timeout=30.0, pragmas=None, cached_statements=STATEMENT_CACHE_SIZE):
+        self.db_name = db_name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.pragmas = pragmas or {}
+        self.cached_statements = cached_statements
+        self.uri = db_name.startswith("file:")
+        self._keeper = None
+        if self.uri and "mode=memory" in db_name:
+            self._keeper = sqlite3.connect(db_name, uri=True, check_same_thread=False)
+        self.counters = {
+            "opened": 0,
+            "reused": 0,
+            "commits": 0,
+            "released": 0,
+            "discarded": 0,
+            "health_checks": 0,
+            "health_failures": 0,
+        }
+        self._local = threading.local()
+        self._idle = []
+        self._in_use = 0
+        self._waiting = 0
+        self._available = threading.Condition(threading.Lock())
+
+    def count(self, name):
+        """
+        Adds one to counter `name`, holding the pool's lock so that threads counting at
+        the same time never lose an update.
+        """
+        with self._available:
+            self.counters[name] += 1
+
+    def _open(self):
+        """
+        Opens a brand new connection and its cursor.
+        """
+        # Transactions are managed explicitly by `Query.transaction`. The timeout is also
+        # how long a write waits for another process holding the database write lock.
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=self.timeout,
+            check_same_thread=False,
+            isolation_level=None,
+            uri=self.uri,
+            cached_statements=self.cached_statements,
+        )
+        # Incremental auto vacuum can only be chosen before anything is written to a new
+        # database, so before the journal mode; it lets `Query.release_free_pages` shrink
+        # the file after `compact_balance_history`.
+        if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        for name, value in self.pragmas.items():
+            # PRAGMA values cannot be bound as parameters
+            conn.execute(f"PRAGMA {name} = {value}").fetchall()
+        self.count("opened")
+        return [conn, conn.cursor()]
+
+    def _healthy(self, entry):
+        """
+        Checks that an idle connection can still run a statement before handing it out.
+        """
+        self.count("health_checks")
+        try:
+            entry[1].execute("SELECT 1").fetchall()
+            return True
+        except sqlite3.Error:
+            self.count("health_failures")
+            return False
+
+    def _discard(self, entry):
+        """
+        Closes a connection that is no longer wanted by the pool.
+        """
+        try:
+            entry[1].close()
+            entry[0].close()
+        except sqlite3.Error:
+            pass
+        self.count("discarded")
+
+    def _checkout(self):
+        """
+        Takes an idle connection from the pool, or opens one if the pool has room.
+        Blocks while `pool_size` connections are already checked out.
+        """
+        with self._available:
+            self._waiting += 1
+            try:
+                if not self._available.wait_for(
+                    lambda: self._idle or self._in_use < self.pool_size, self.timeout
+                ):
+                    raise sqlite3.OperationalError(
+                        f"no connection to {self.db_name} became available within {self.timeout}s"
+                    )
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+            entry = self._idle.pop() if self._idle else None
+
+        if entry is not None and self._healthy(entry):
+            self.count("reused")
+            return entry
+        if entry is not None:
+            self._discard(entry)
+        return self._open()
+
+    def _checkin(self, entry):
+        """
+        Puts a connection back into the idle pool and wakes up one waiting thread.
+        """
+        with self._available:
+            self._in_use -= 1
+            if len(self._idle) < self.pool_size:
+                self._idle.append(entry)
+                entry = None
+            self._available.notify()
+        if entry is not None:
+            self._discard(entry)
+        self.count("released")
+
+    def _entry(self):
+        """
+        Returns the [connection, cursor] pair owned by the calling thread, checking
+        one out of the pool if the thread does not hold one yet.
+        """
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = _ThreadSlot()
+            # Give the connection back once the owning thread (and its slot) is gone.
+            weakref.finalize(slot, self._reclaim, slot.held)
+            self._local.slot = slot
+        if slot.held[0] is None:
+            slot.held[0] = self._checkout()
+        return slot.held[0]
+
+    def _reclaim(self, held):
+        """
+        Finalizer for thread slots; returns the connection if the thread still held one.
+        """
+        if held[0] is not None:
+            entry, held[0] = held[0], None
+            self._checkin(entry)
+
+    def connection(self):
+        """
+        Returns the calling thread's connection.
+        """
+        return self._entry()[0]
+
+    def cursor(self):
+        """
+        Returns the calling thread's reusable cursor.
+        """
+        return self._entry()[1]
+
+    def release(self, force=False):
+        """
+        Hands the calling thread's connection back to the pool.
+
+        Unless `force` is set this only happens when another thread is waiting for a
+        connection, so the common single-threaded case keeps its connection open.
+        """
+        slot = getattr(self._local, "slot", None)
+        if slot is None or slot.held[0] is None:
+            return
+        if not force and not self._waiting:
+            return
+        entry, slot.held[0] = slot.held[0], None
+        self._checkin(entry)
+
+    def close_all(self):
+        """
+        Closes every idle connection along with the calling thread's connection.
+        Connections held by other live threads are closed when those threads hand them back.
+        """
+        self.release(force=True)
+        with self._available:
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._discard(entry)
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool's health and reuse counters.
+        """
+        with self._available:
+            snapshot = dict(self.counters)
+            snapshot["in_use"] = self._in_use
+            snapshot["idle"] = len(self._idle)
+            snapshot["waiting"] = self._waiting
+        return snapshot
+
+
+class SingleConnection(ConnectionManager):
+    """
+    One connection shared by every thread, for a private ":memory:" database, which only
+    exists inside the connection that created it.
+
+    Each thread still gets a cursor of its own. The connection is opened on first use and
+    kept until `close_all`, which discards the database. Statements from different threads
+    are kept apart by `Query.lock`, which lets no thread read while another is in the
+    middle of a unit of work.
+    """
+
+    def __init__(self, db_name=":memory:", timeout=30.0, pragmas=None):
+        super().__init__(db_name, pool_size=1, timeout=timeout, pragmas=pragmas)
+        self._shared = None
+        self._opening = threading.Lock()
+
+    def _entry(self):
+        entry = getattr(self._local, "entry", None)
+        if entry is None:
+            with self._opening:
+                if self._shared is None:
+                    self._shared = self._open()
+                    self._in_use = 1
+                    entry = self._shared
+                else:
+                    entry = [self._shared[0], self._shared[0].cursor()]
+                    self.count("reused")
+            self._local.entry = entry
+        return entry
+
+    def release(self, force=False):
+        """
+        Nothing to hand back: every thread shares the one connection.
+        """
+
+    def close_all(self):
+        """
+        Closes the shared connection, discarding the database.
+        """
+        with self._opening:
+            if self._shared is not None:
+                self._shared[0].close()
+                self._shared = None
+                self._in_use = 0
+                self.count("discarded")
+        self._local = threading.local()
+
+
+class _ThreadSlot:
+    """
+    Per-thread holder for the pooled [connection, cursor] pair, if any.
+    """
+    __slots__ = ("held", "__weakref__")
+
+    def __init__(self):
+        self.held = [None]
+
+
+class _WriteBatch:
+    """
+    Rows written inside `Query.batched_writes` that have not reached the database yet.
+
+    Inserts are kept per statement so each one is flushed with a single `executemany`,
+    and balance updates are kept as the latest balance of each account.
+    """
+    __slots__ = ("chunk_size", "inserts", "balances", "size")
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.inserts = {record_transaction: [], record_balance: []}
+        self.balances = {}
+        self.size = 0
+
+
+class ReadWriteLock:
+    """
+    Lets any number of threads read at the same time, or a single thread write.
+
+    Both sides are re-entrant, and the writing thread may also take the read side. A
+    reader must not ask for the write side, since it would wait for itself. Waiting
+    writers hold back new readers so that a steady stream of reads cannot starve them.
+    """
+
+    def __init__(self):
+        mutex = threading.Lock()
+        self._can_read = threading.Condition(mutex)
+        self._can_write = threading.Condition(mutex)
+        self._local = threading.local()
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._writers_waiting = 0
+
+    def acquire_read(self, blocking=True):
+        """
+        Takes the read side. Returns False instead of waiting if `blocking` is False and
+        a writer holds or is waiting for the lock.
+        """
+        me = threading.get_ident()
+        with self._can_read:
+            if self._writer == me:
+                self._depth += 1
+                return True
+            held = getattr(self._local, "reads", 0)
+            if held == 0:
+                free = lambda: self._writer is None and not self._writers_waiting
+                if not free():
+                    if not blocking:
+                        return False
+                    self._can_read.wait_for(free)
+                self._readers += 1
+            self._local.reads = held + 1
+            return True
+
+    def release_read(self):
+        with self._can_read:
+            if self._writer == threading.get_ident():
+                self._depth -= 1
+                return
+            self._local.reads -= 1
+            if self._local.reads == 0:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._can_write.notify()
+
+    def acquire_write(self, blocking=True):
+        """
+        Takes the write side. Returns False instead of waiting if `blocking` is False and
+        another thread holds the lock.
+        """
+        me = threading.get_ident()
+        with self._can_write:
+            if self._writer == me:
+                self._depth += 1
+                return True
+            free = lambda: self._writer is None and self._readers == 0
+            if not free():
+                if not blocking:
+                    return False
+                self._writers_waiting += 1
+                try:
+                    self._can_write.wait_for(free)
+                except BaseException:
+                    self._writers_waiting -= 1
+                    if not self._writers_waiting:
+                        self._can_read.notify_all()
+                    raise
+                self._writers_waiting -= 1
+            self._writer = me
+            self._depth = 1
+            return True
+
+    def release_write(self):
+        with self._can_write:
+            self._depth -= 1
+            if self._depth == 0:
+                self._writer = None
+                # Hand over to the next writer, or let every waiting reader in at once.
+                if self._writers_waiting:
+                    self._can_write.notify()
+                else:
+                    self._can_read.notify_all()
+
+
 class Query(ABC):
     """
 A base class for database queries.
 
 Attributes:
         db_name: The name of the database.
-        conn: The connection to the database.
-        cur: The cursor to the database.
+        connections: The pool of long-lived connections to the database.
+        metrics: Per-method and per-statement counters, disabled until `metrics.enable()`.
+        lock: Taken for writing by every unit of work and for reading by `reading` blocks.
+        conn: The calling thread's connection to the database.
+        cur: The calling thread's cursor to the database.
 
 Methods:
         connect: Connects to the database.
         close: Closes the connection to the database.
         commit_and_close: Commits the changes and closes the connection to the database.
+        transaction: Groups statements into a single atomic unit of work.
+        reading: Runs a block that reads in-memory state without a unit of work in progress.
+        batched_writes: Buffers inserts and balance updates and writes them in chunks.
+        flush_writes: Writes the buffered rows to the database.
         execute_script: Executes a SQL script.
+        schema_version: Reads the schema version stored in the database.
+        table_names: Lists the tables in the database.
+        page_usage: Counts the pages of the database file and how many are free.
+        release_free_pages: Gives free pages back to the file system.
+        migrate_schema: Upgrades an older database to the current schema.
         check_if_value_exists: Checks if a value exists in a table.
         active: Checks if an account is active.
     """
-    def __init__(self):
+    def __init__(self, db_name, pool_size=8, durability="strict"):
         """
-        Closes the database connection and cursor.
+        Sets up the connection pool for the database.
+
+        Connections are opened lazily, the first time a thread runs a query.
 
-        This method checks if the cursor is open and closes it if it is. 
-        It also closes the database connection if it is open. 
+        Args:
+            db_name (str): The name of the database file, ":memory:" for a private
+                in-memory database held by one connection shared by every thread, or a
+                "file:" URI such as "file:bank?mode=memory&cache=shared".
+            pool_size (int): The maximum number of connections checked out at once.
+            durability (str): The name of the profile in `durability_profiles` applied to
+                every connection.
         """
         super().__init__()
-        self.db_name
-        self.conn = sqlite3.connect(self.db_name)
-        self.cur = self.conn.cursor()
+        if durability not in durability_profiles:
+            raise ValueError(
+                f"unknown durability profile {durability!r}, expected one of {sorted(durability_profiles)}"
+            )
+        self.db_name = db_name
+        self.durability = durability
+        if db_name == ":memory:":
+            self.connections = SingleConnection(pragmas=durability_profiles[durability])
+        else:
+            self.connections = ConnectionManager(db_name, pool_size, pragmas=durability_profiles[durability])
+        self.metrics = Metrics(statement_names, self.connections)
+        self.lock = ReadWriteLock()
+        self._units_of_work = threading.local()
+        self._instrumented = threading.local()
+
+    @property
+    def conn(self):
+        """
+        The connection owned by the calling thread.
+        """
+        return self.connections.connection()
+
+    @property
+    def cur(self):
+        """
+        The reusable cursor owned by the calling thread, wrapped so its statements are
+        counted while metrics are enabled.
+
+        Each thread keeps one wrapper for as long as its cursor lives, so rows fetched
+        after an `execute` are counted against the statement that produced them.
+        """
+        cursor = self.connections.cursor()
+        if not self.metrics.enabled:
+            return cursor
+        wrapper = getattr(self._instrumented, "cursor", None)
+        if wrapper is None or wrapper.cursor is not cursor:
+            wrapper = self._instrumented.cursor = InstrumentedCursor(cursor, self.metrics)
+        return wrapper
 
     # Methods for database management
     def connect(self):
         """
-        Establishes a connection to the SQLite database.
+        Makes sure the calling thread holds a connection to the SQLite database.
 
-        This method creates a new connection to the database and initializes the cursor for executing SQL commands.
-        Its called whenever a new connection is needed.
+        The connection is taken from the pool and kept for the lifetime of the thread,
+        so calling this repeatedly is cheap.
         """
-        self.conn = sqlite3.connect(self.db_name)
-        self.cur = self.conn.cursor()
+        self.connections.connection()
 
     def close(self):
         """
-        Closes the database connection and cursor.
+        Marks the end of a unit of database work.
 
-        This method checks if the cursor is open and closes it if it is. 
-        It also closes the database connection if it is open. 
+        The connection stays open for reuse; it is only handed back to the pool
+        if another thread is waiting for one, and never while a unit of work is open.
+        """
+        if not self.in_transaction():
+            self.connections.release()
+
+    def disconnect(self):
+        """
+        Closes the pooled connections to the database.
         """
-        if self.cur:
-            self.cur.close()
-        if self.conn:
-            self.conn.close()
+        self.connections.close_all()
 
     def commit_and_close(self):
         """
@@ -206,17 +1096,189 @@ Methods:
         This method saves any changes made during the current transaction to the database 
         and then calls the `close` method to release resources.
         It should be used when you want to ensure that all changes are saved before closing the connection.
+        Inside a unit of work the commit is left to the outermost `transaction` block.
         """
+        if self.in_transaction():
+            return
         self.conn.commit()
         self.close()
 
+    def in_transaction(self) -> bool:
+        """
+        Returns True if the calling thread is inside a `transaction` block.
+        """
+        return getattr(self._units_of_work, "depth", 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs every statement issued inside the block as one unit of work.
+
+        The outermost block opens a single BEGIN/COMMIT, so all statements of a banking
+        operation (or of many operations grouped by the caller) are made durable with one
+        commit and either all apply or none do. Nested blocks join the enclosing unit of
+        work through a savepoint, so an exception raised inside them only undoes their
+        own statements if the caller catches it.
+
+        SQLite lets one connection write at a time, so the outermost block takes `lock`
+        for writing before it begins: writers from different threads queue on the lock
+        instead of polling for the database write lock, and in-memory state updated
+        alongside the statements is only changed by one thread at a time. Inside `batched_writes` nested blocks
+        take no savepoint, because buffered rows cannot be partially undone; an exception
+        there rolls back the whole batch once it reaches the outermost block.
+
+        Example:
+            with system.transaction():
+                system.deposit(1, 'account1', 100)
+                system.transfer(2, 'account1', 'account2', 50)
+        """
+        depth = getattr(self._units_of_work, "depth", 0)
+        if depth > 0 and self.write_batch() is not None:
+            yield self
+            return
+        if depth > 0:
+            yield from self._unit_of_work(depth)
+            return
+        self._acquire(self.lock.acquire_write)
+        try:
+            yield from self._unit_of_work(depth)
+        finally:
+            self.lock.release_write()
+
+    def _unit_of_work(self, depth):
+        """
+        Body of `transaction` once the calling thread may write.
+        """
+        conn = self.conn
+        savepoint = f"unit_of_work_{depth}"
+        conn.execute("BEGIN IMMEDIATE" if depth == 0 else f"SAVEPOINT {savepoint}")
+        self._units_of_work.depth = depth + 1
+        try:
+            yield self
+            conn.execute("COMMIT" if depth == 0 else f"RELEASE {savepoint}")
+        except BaseException:
+            # A failed COMMIT can leave the transaction open, or SQLite may already
+            # have rolled it back.
+            self._units_of_work.depth = depth
+            if depth == 0:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            else:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+            self.discard_caches()
+            raise
+        self._units_of_work.depth = depth
+        if depth == 0:
+            self.connections.count("commits")
+            self.close()
+
+    def _acquire(self, acquire):
+        """
+        Takes one side of `lock`, handing the thread's connection back to the pool
+        before waiting so that the threads holding the lock are never short of one.
+        """
+        if not acquire(blocking=False):
+            self.connections.release(force=True)
+            acquire()
+
+    @contextmanager
+    def reading(self):
+        """
+        Runs the block while no unit of work is in progress in another thread.
+
+        Any number of threads can read at once. Reads of in-memory state kept alongside
+        the database go in these blocks, so they never see the changes of a unit of
+        work that has not committed yet, or that is being rolled back.
+        """
+        self._acquire(self.lock.acquire_read)
+        try:
+            yield self
+        finally:
+            self.lock.release_read()
+
+    def write_batch(self):
+        """
+        Returns the calling thread's open `_WriteBatch`, or None outside `batched_writes`.
+        """
+        return getattr(self._units_of_work, "batch", None)
+
+    @contextmanager
+    def batched_writes(self, chunk_size=10_000):
+        """
+        Runs the block as one unit of work whose inserts and balance updates are buffered.
+
+        Transactions and balance history rows are collected per statement and balance
+        updates are collapsed to the latest balance of each account; every `chunk_size`
+        rows they are written with one `executemany` per statement. Any statement that
+        could read or change those tables first flushes the buffer, so queries inside the
+        block see the same data they would without batching. If the block raises, the
+        buffer is dropped and the unit of work is rolled back.
+
+        Args:
+            chunk_size (int): The number of buffered rows that triggers a flush.
+        """
+        if self.write_batch() is not None:
+            yield self
+            return
+
+        with self.transaction():
+            self._units_of_work.batch = _WriteBatch(chunk_size)
+            try:
+                yield self
+                self.flush_writes()
+            finally:
+                self._units_of_work.batch = None
+
+    def flush_writes(self):
+        """
+        Writes the rows buffered by `batched_writes` to the database.
+        """
+        batch = self.write_batch()
+        if batch is None or batch.size == 0:
+            return
+        for script, rows in batch.inserts.items():
+            if rows:
+                self.cur.executemany(script, rows)
+                rows.clear()
+        if batch.balances:
+            self.cur.executemany(
+                store_balance,
+                ((account_id, amount, account_date) for account_id, (amount, account_date) in batch.balances.items()),
+            )
+            batch.balances.clear()
+        batch.size = 0
+
+    def discard_caches(self):
+        """
+        Drops in-memory state derived from the database.
+
+        Called whenever a unit of work is rolled back, since anything updated alongside
+        the rolled back statements may no longer match the database. Subclasses that keep
+        such state reload it lazily from the database afterwards.
+        """
+
     def execute_script(self, script:str, parameters:tuple|None =None):
         """
         Executes a pre-written SQL script.
-        
+
+        Outside of a `transaction` block the statement is committed on its own;
+        inside one it becomes part of the enclosing unit of work. Inside
+        `batched_writes` the batched inserts are buffered instead of executed, and any
+        other statement that depends on the buffered tables flushes the buffer first.
         """
+        batch = self.write_batch()
+        if batch is not None:
+            if script in batch.inserts:
+                batch.inserts[script].append(parameters)
+                batch.size += 1
+                if batch.size >= batch.chunk_size:
+                    self.flush_writes()
+                return []
+            if script not in batch_independent:
+                self.flush_writes()
+
         self.connect()
-        
 
         if parameters:
             self.cur.execute(script, parameters)
@@ -229,6 +1291,74 @@ Methods:
 
         return output
         
+    def schema_version(self) -> int:
+        """
+        Returns the schema version stored in the database file (0 for databases
+        created before versioning was introduced).
+        """
+        self.connect()
+        return self.cur.execute("PRAGMA user_version").fetchone()[0]
+
+    def table_names(self) -> set[str]:
+        """
+        Returns the names of the tables in the database.
+        """
+        self.connect()
+        rows = self.cur.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+        self.close()
+        return {name for name, in rows}
+
+    def page_usage(self) -> tuple[int, int]:
+        """
+        Returns the number of pages in the database file and how many of them are free.
+        """
+        self.connect()
+        page_count = self.cur.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.cur.execute("PRAGMA freelist_count").fetchone()[0]
+        self.close()
+        return page_count, free_pages
+
+    def release_free_pages(self):
+        """
+        Gives the free pages of the database back to the file system, if the database was
+        created with incremental auto vacuum; otherwise they stay free for later inserts.
+
+        Must be called outside of a `transaction` block, since the vacuum commits on its own.
+        """
+        self._acquire(self.lock.acquire_write)
+        try:
+            self.connect()
+            # executescript steps the PRAGMA to completion, execute would free a single page
+            self.cur.executescript("PRAGMA incremental_vacuum;")
+            self.close()
+        finally:
+            self.lock.release_write()
+
+    def migrate_schema(self) -> int:
+        """
+        Brings the database up to SCHEMA_VERSION by running every pending migration
+        in `schema_migrations`.
+
+        All migrations run inside one unit of work, so a failure leaves the database
+        at its original version.
+
+        Returns:
+            int: The number of migrations that were applied.
+        """
+        current = self.schema_version()
+        pending = [version for version in sorted(schema_migrations) if version > current]
+        if not pending:
+            return 0
+
+        with self.transaction():
+            for version in pending:
+                for statement in schema_migrations[version]:
+                    self.cur.execute(statement)
+            # PRAGMA values cannot be bound as parameters
+            self.cur.execute(f"PRAGMA user_version = {pending[-1]}")
+
+        return len(pending)
+
     def check_if_value_exists(self, table_name:str, column_name:str, value) -> bool:
         """
         Checks if a specific value exists in a given table and column.
@@ -245,8 +1375,14 @@ Methods:
         Returns:
             bool: True if the value exists in the specified column of the table, False otherwise.
             """
+        name = f"exists_{table_name}_{column_name}"
+        statement = statements.get(name)
+        if statement is None:
+            if not (table_name.isidentifier() and column_name.isidentifier()):
+                raise ValueError(f"invalid table or column name {table_name!r}, {column_name!r}")
+            statement = register_statement(name, f"SELECT 1 FROM {table_name} WHERE {column_name}=? LIMIT 1;")
         self.connect()
-        self.cur.execute(f"SELECT 1 FROM {table_name} WHERE {column_name}=?",(value,))
+        self.cur.execute(statement, (value,))
         result = self.cur.fetchone()
         self.close()
         return result is not None
@@ -266,11 +1402,9 @@ Methods:
             The account information if the account is active; otherwise, False.
         """
         self.connect()
-        try:
-            active=self.cur.execute(f"SELECT * from user_data WHERE account_id='{account_id}'")
-        except:
-            return False
-        return active
+        row = self.cur.execute(account_row, (account_id,)).fetchone()
+        self.close()
+        return row if row is not None and row[2] else False
     """
     The following functions are used to automate running scripts in the `db_scr` folder.
     These will update the database for the appropriate tables while only having to enter the input parameters
@@ -285,9 +1419,11 @@ Methods:
         merge_date,
         account_balance):
         """
-        insert_user_data: Inserts a new user into the database.
+        insert_user_data: Inserts a new user into the database, giving the account a new
+        surrogate key first.
         """
-        
+        self.execute_script(register_account, (account_id,))
+
         entered_data = (
             account_id,
             creation_date,
@@ -305,19 +1441,23 @@ Methods:
         amount,
         date_of_transaction,
         type_of_transaction,
-        payment_number = None,
+        payment_id = None,
         cashback_date = None
     ):
         """
         Records a transaction in the database.
+
+        Args:
+            type_of_transaction (str): One of the names in `transaction_types`.
+            payment_id (int | None): The number of a payment, see `format_payment`.
         """
         
         entered_data = (
             account_id,
             amount,
             date_of_transaction,
-            type_of_transaction,
-            payment_number,
+            transaction_types[type_of_transaction],
+            payment_id,
             cashback_date
         )
         
@@ -335,20 +1475,23 @@ Methods:
     def update_account_info(self, column, value, account_id):
         """
          Updates an account's information in the database.
+
+        Raises:
+            ValueError: If `column` is not a user_data column.
         """
-        self.connect()
+        if column not in update_account_columns:
+            raise ValueError(f"unknown user_data column {column!r}")
         entered_data = (value, account_id)
-        update_account=f"""
-        UPDATE user_data
-        SET {column}=?
-        WHERE account_id=?;
-        """
-        self.execute_script(update_account, entered_data)
+        self.execute_script(update_account_columns[column], entered_data)
 
     def new_balance(self, account_id, amount, timestamp):
         """
          Inserts a new balance into the database.
         """
+        batch = self.write_batch()
+        if batch is not None:
+            self.buffer_balance(batch, account_id, amount, timestamp)
+            return
 
         entered_data = (account_id, amount, timestamp)
         self.execute_script(new_balance, entered_data)
@@ -357,28 +1500,53 @@ Methods:
         """
         Updates an account's balance in the database.
         """
+        batch = self.write_batch()
+        if batch is not None:
+            self.buffer_balance(batch, account_id, amount, account_date)
+            return
+
         entered_data = (amount, account_date, account_id)
         self.execute_script(update_balance, entered_data)
 
-    def update_transaction_id(self, account_id_1, account_id_2):
+    def buffer_balance(self, batch, account_id, amount, account_date):
         """
-        Updates a transaction's ID in the database.
+        Keeps the latest balance of an account in the write batch until it is flushed.
         """
-        entered_data = (account_id_1, account_id_2)
-        self.execute_script(update_transaction_id, entered_data)
+        if account_id not in batch.balances:
+            batch.size += 1
+        batch.balances[account_id] = (amount, account_date)
+        if batch.size >= batch.chunk_size:
+            self.flush_writes()
 
     def get_account_balance(self, account_id):
         """
-        Retrieves an account's balance from the database.
+        Retrieves an account's balance from the database, or from the write batch if
+        it holds a newer one.
+
+        Returns:
+            int | None: The balance, or None if the account does not exist.
         """
+        batch = self.write_batch()
+        if batch is not None and account_id in batch.balances:
+            return batch.balances[account_id][0]
         self.connect()
-        self.cur.execute(
-            f"SELECT amount FROM balances WHERE account_id='{account_id}';"
-        )
+        self.cur.execute(balance_of, (account_id,))
         result = self.cur.fetchone()
         self.close()
-        return result[0]
+        return None if result is None else result[0]
     
+    def next_sequence_value(self, name):
+        """
+        Advances the named counter in the sequences table and returns its new value.
+
+        Both statements are primary key lookups, so the cost does not grow with the number
+        of rows the counter is numbering. Call it inside a unit of work so the increment is
+        committed together with the row that uses it.
+        """
+        entered_data = (name,)
+        self.execute_script(advance_sequence, entered_data)
+        return self.execute_script(sequence_value, entered_data)[0][0]
+
     def delete_account(self, account_id):
         """
         Deletes an account from the database.
@@ -387,61 +1555,27 @@ Methods:
         self.execute_script(delete_account, entered_data)
         self.execute_script(delete_balance, entered_data)
 
-    def add_merge_date(self, timestamp, account_id):
+    def account_key(self, account_id):
         """
-        Adds a merge date to an account in the database.
+        Returns the surrogate key of the latest account created with `account_id`, or
+        None if it was never created.
         """
-        
-        entered_data=(timestamp, account_id)
-        self.execute_script(add_merge_date, entered_data)
+        return self.execute_script(current_account_key, (account_id,))[0][0]
 
-    def check_cashbacks(self, account_id, timestamp):
-        """
-        Checks if an account has any cashbacks.
-        """
-        try:
-            self.connect()
-            entered_data = (account_id, timestamp)
-            self.cur.execute(check_cashbacks, entered_data)
-            result=self.cur.fetchone()[0]
-            if result is None:
-                return 0
-            else:
-                return math.floor(-result*0.02)
-        except:
-            return 0
-        
-    def merge_cashbacks(self,account_id, timestamp):
-        """
-        Calculates cashbacks individually for an account.
+    def link_accounts(self, account_id_1, account_id_2):
         """
-        try:
-            self.connect()
-            entered_data = (account_id, timestamp)
-            self.cur.execute(merge_cashbacks, entered_data)
-            result=self.cur.fetchall()
-            if result is None:
-                return 0
-            else:
-                sum = 0
-                for i in result:
-                    sum += math.floor(-i[0]*0.02)
-                return sum
-        except:
-            return 0
-        
-    def check_transactions(self,account_id, timestamp):
-        """
-        Checks the number of payment transactions for an account.
+        Records that `account_id_2` was merged into `account_id_1`.
+
+        Only the merged away account's row in the accounts table changes; its transactions
+        and balance history keep its key and are resolved to the surviving account through
+        the link, so the cost does not depend on how much history either account has.
+
+        Returns:
+            tuple[int, int]: The surrogate keys of the surviving and the merged away account.
         """
-        try:
-            self.connect()
-            entered_data = (account_id, timestamp)
-            self.cur.execute(merge_cashbacks, entered_data)
-            result=self.cur.fetchall()
-            return len(result)
-        except:
-            return 0
+        survivor, absorbed = self.account_key(account_id_1), self.account_key(account_id_2)
+        self.execute_script(link_account, (survivor, absorbed))
+        return survivor, absorbed
 
 
 class BankingSystemImpl(BankingSystem, Query):
@@ -457,27 +1591,295 @@ class BankingSystemImpl(BankingSystem, Query):
 
     Attributes:
         db_name (str): The name of the SQLite database file.
-        conn (sqlite3.Connection): The connection object for the SQLite database.
-        cur (sqlite3.Cursor): The cursor object for executing SQL commands.
+        connections (ConnectionManager): The pool of long-lived connections to the database.
+        conn (sqlite3.Connection): The calling thread's connection to the SQLite database.
+        cur (sqlite3.Cursor): The calling thread's cursor for executing SQL commands.
+        leaderboard (SpenderLeaderboard): Outgoing totals per account, loaded from the database on first use.
+        cashback_queue (CashbackQueue): Ids of payments waiting for their cashback, by refund date.
+        balance_index (BalanceIndex): Point-in-time balances per account, mirrored from balance_history.
+        aliases (AccountAliases): The account that owns the rows of each merged away account.
     """
 
-    def __init__(self):
+    def __init__(self, db_path=DEFAULT_DB_PATH, durability="strict", pool_size=8, reset=True,
+                 account_cache_size=100_000, balance_index_size=None):
         """
         Initializes a new instance of the BankingSystemImpl class.
 
         This constructor checks if the database file already exists. If it does, it deletes the 
         existing database file to start fresh. It then establishes a connection to the new 
         database and creates the necessary tables for the banking system.
+
+        With `reset=False` an existing database is opened instead, see `open_existing`, and
+        the tables are only created if the database is empty.
+
+        Args:
+            db_path (str): Where to keep the database. A file path, ":memory:" to keep
+                everything in RAM behind a single connection, or a "file:" URI such as
+                "file:bank?mode=memory&cache=shared" for an in-memory database that a pool
+                of connections can share. In-memory databases never touch the disk.
+            durability (str): "strict", "balanced" or "throughput", see `durability_profiles`.
+            pool_size (int): The maximum number of connections checked out at once.
+            reset (bool): Whether to start from an empty database, deleting any existing one.
+            account_cache_size (int): The most accounts whose balance is kept in the account
+                cache; 0 turns it off.
+            balance_index_size (int | None): The most account histories kept in the balance
+                index, the others being read from the database when needed, or None to keep
+                every history in memory.
+
+        Raises:
+            ValueError: If `reset` is False and the existing database is not a banking
+            database this version can open.
         """
-        # super().__init__()
-        # Delete database if it exists already.
-        if os.path.exists("chem_274B_fp.db"):
-            os.remove("chem_274B_fp.db")
+        # Delete database (and its write-ahead log) if it exists already.
+        if reset and db_path != ":memory:" and not db_path.startswith("file:"):
+            for path in (db_path, db_path + "-wal", db_path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
         
-        self.db_name = "chem_274B_fp.db"
-        self.conn = sqlite3.connect(self.db_name)
-        self.cur = self.conn.cursor()
+        super().__init__(db_path, pool_size, durability)
+        self.account_cache = AccountCache(account_cache_size)
+        self.balance_index_size = balance_index_size
+        if not reset and self.table_names():
+            self.open_existing()
+            return
         self.create_tables()
+        # The database is empty, so there is nothing to load.
+        self._leaderboard = SpenderLeaderboard()
+        self._cashback_queue = CashbackQueue()
+        self._balance_index = BalanceIndex() if balance_index_size is None else None
+        self._aliases = AccountAliases()
+
+    def open_existing(self):
+        """
+        Gets an existing database ready for use without rebuilding anything.
+
+        The checks only read the schema version and the table list, and pending migrations
+        are applied, so start up time does not depend on the size of the database. The
+        leaderboard, cashback queue, balance index and account aliases start out unloaded and are filled
+        from the tables the first time they are needed, the balance index one account at a
+        time. Payment numbers continue from the `sequences` table.
+
+        Raises:
+            ValueError: If the database was written by a newer version or is missing tables.
+        """
+        version = self.schema_version()
+        if version > SCHEMA_VERSION:
+            raise ValueError(
+                f"{self.db_name} has schema version {version}, newer than the supported {SCHEMA_VERSION}"
+            )
+        if version < SCHEMA_VERSION:
+            # The migrations expect the original tables, so an unrelated database has to be
+            # turned away before they run.
+            missing = legacy_tables - self.table_names()
+            if missing:
+                raise ValueError(f"{self.db_name} is not a banking database, missing tables {sorted(missing)}")
+        self.migrate_schema()
+        missing = required_tables - self.table_names()
+        if missing:
+            raise ValueError(f"{self.db_name} is not a banking database, missing tables {sorted(missing)}")
+        self.discard_caches()
+
+    @property
+    def leaderboard(self):
+        """
+        The top spenders leaderboard, loaded from the `transactions` table when needed.
+
+        The outgoing totals of a merged away account count towards the account that
+        absorbed it.
+        """
+        if self._leaderboard is None:
+            keys = dict(self.execute_script(live_account_keys))
+            accounts = {key: account_id for account_id, key in keys.items()}
+            totals = dict.fromkeys(keys, 0)
+            for key, total in self.execute_script(outgoing_totals):
+                account_id = accounts.get(self.aliases.owner(key))
+                if account_id is not None:
+                    totals[account_id] += total
+            self._leaderboard = SpenderLeaderboard(totals)
+        return self._leaderboard
+
+    @property
+    def cashback_queue(self):
+        """
+        The pending cashback refunds, loaded from the `transactions` table when needed.
+        """
+        if self._cashback_queue is None:
+            self._cashback_queue = CashbackQueue(self.execute_script(pending_cashbacks))
+        return self._cashback_queue
+
+    @property
+    def aliases(self):
+        """
+        The account aliases, loaded from the merge links in the `accounts` table when needed.
+        """
+        if self._aliases is None:
+            self._aliases = AccountAliases(self.execute_script(account_links))
+        return self._aliases
+
+    @property
+    def balance_index(self):
+        """
+        The point-in-time balance index. After a rollback it is rebuilt empty and loads each
+        account's history from the `balance_history` table the first time it is read, keeping
+        at most `balance_index_size` of them.
+        """
+        if self._balance_index is None:
+            self._balance_index = BalanceIndex(self.load_balance_history, self.balance_index_size)
+        return self._balance_index
+
+    def load_balance_history(self, account_id):
+        """
+        Reads the (timestamp, balance) history of an account in timestamp order.
+        """
+        return self.execute_script(balance_history_of, (account_id,))
+
+    def discard_caches(self):
+        """
+        Drops the leaderboard, cashback queue, balance index and account aliases so they are
+        reloaded from the database on next use.
+        """
+        self._leaderboard = None
+        self._cashback_queue = None
+        self._balance_index = None
+        self._aliases = None
+        self.account_cache.clear()
+
+    def compact_balance_history(self, timestamp, horizon, granularity=CHECKPOINT_INTERVAL, batch_size=500):
+        """
+        Collapses the balance history older than `horizon` into checkpoint rows, a batch of
+        accounts at a time.
+
+        History from before the start of the `granularity` period containing
+        `timestamp - horizon` keeps only the last row of each account and period, so
+        `get_balance` stays exact for any time from that point on and for the end of
+        every older period, and within an older period answers with the balance at the
+        latest checkpoint. Merge markers are kept, so merged away accounts still read as
+        not existing.
+
+        This is a generator: each batch of `batch_size` account keys is compacted in its own
+        short unit of work, and the running totals are yielded after it, so the caller can
+        pace the work and other operations run between batches. Once a batch removed rows
+        the balance index is dropped and reloads the compacted histories on next use. Free
+        pages are given back to the file system after each batch when the database
+        supports it, see `release_free_pages`, unless the caller holds a unit of work open.
+
+        Args:
+            timestamp (int): The current time.
+            horizon (int): How far back from `timestamp` the full history is kept.
+            granularity (int): The length of the periods older history is collapsed to.
+            batch_size (int): The number of account keys compacted per unit of work.
+
+        Yields:
+            dict: The totals so far: "accounts" processed, "rows_removed",
+            "pages_reclaimed" (pages no longer in use) and "pages_released" (pages
+            removed from the file). Page counts include the writes of other threads.
+        """
+        cutoff = timestamp - horizon
+        cutoff -= cutoff % granularity
+        report = {"accounts": 0, "rows_removed": 0, "pages_reclaimed": 0, "pages_released": 0}
+        last_key = 0
+        while True:
+            pages, free_pages = self.page_usage()
+            with self.transaction():
+                accounts, high = self.execute_script(compaction_key_range, (last_key, batch_size))[0]
+                if not accounts:
+                    return
+                removed = len(self.execute_script(collapse_balance_history, (granularity, last_key + 1, high, cutoff)))
+                if removed:
+                    self._balance_index = None
+            last_key = high
+            if removed and not self.in_transaction():
+                self.release_free_pages()
+            pages_after, free_pages_after = self.page_usage()
+            report["accounts"] += accounts
+            report["rows_removed"] += removed
+            report["pages_reclaimed"] += (pages - free_pages) - (pages_after - free_pages_after)
+            report["pages_released"] += pages - pages_after
+            yield dict(report)
+
+    def get_account_balance(self, account_id):
+        """
+        Returns an account's balance, or None if it does not exist, from the account
+        cache when it is there and from the database otherwise.
+
+        This one lookup tells the operations both whether an account exists and what
+        its balance is.
+        """
+        found, balance = self.account_cache.get(account_id)
+        if not found:
+            balance = super().get_account_balance(account_id)
+            self.account_cache.put(account_id, balance)
+        return balance
+
+    def new_balance(self, account_id, amount, timestamp):
+        """
+        Inserts a new balance into the database and the account cache.
+        """
+        super().new_balance(account_id, amount, timestamp)
+        self.account_cache.put(account_id, amount)
+
+    def update_account_balance(self, amount, account_date, account_id):
+        """
+        Updates an account's balance in the database and the account cache.
+        """
+        super().update_account_balance(amount, account_date, account_id)
+        self.account_cache.put(account_id, amount)
+
+    def delete_account(self, account_id):
+        """
+        Deletes an account from the database and records in the account cache that it
+        no longer exists.
+        """
+        super().delete_account(account_id)
+        self.account_cache.put(account_id, None)
+
+    def record_balance(self, account_id, amount, timestamp, merge_date):
+        """
+        Records a balance in the database and mirrors it into the balance index.
+        """
+        super().record_balance(account_id, amount, timestamp, merge_date)
+        if self._balance_index is not None:
+            self._balance_index.record(account_id, timestamp, amount)
+
+    def link_accounts(self, account_id_1, account_id_2):
+        """
+        Records a merge in the database and mirrors it into the account aliases.
+        """
+        survivor, absorbed = super().link_accounts(account_id_1, account_id_2)
+        if self._aliases is not None:
+            self._aliases.merge(absorbed, survivor)
+        return survivor, absorbed
+
+    def settle_cashbacks(self, timestamp):
+        """
+        Refunds every cashback due at or before `timestamp`.
+
+        Every public method calls this first, so a refund is credited to the stored balance
+        exactly once, before any other operation at or after its refund date, and is recorded
+        in the balance history at the refund date. The refund goes to the account that owns
+        the payment at that time, which is the surviving account if the payer was merged.
+        Payments that are no longer pending here, such as those moved to another shard by
+        `banking_system_sharded`, are skipped. When nothing is due this is a single heap lookup.
+
+        Args:
+            timestamp (int): The timestamp of the operation about to be processed.
+        """
+        with self.reading():
+            due = self.cashback_queue.is_due(timestamp)
+        if not due:
+            return
+
+        with self.transaction():
+            for cashback_date, _, payment_id in self.cashback_queue.pop_due(timestamp):
+                payment = self.execute_script(cashback_payment, (payment_id,))
+                if not payment:
+                    continue
+                account_key, amount = payment[0]
+                account_id = self.execute_script(account_of_key, (self.aliases.owner(account_key),))[0][0]
+                balance = self.get_account_balance(account_id) + cashback_for(-amount)
+                self.update_account_balance(balance, cashback_date, account_id)
+                self.record_balance(account_id, balance, cashback_date, None)
+                self.execute_script(settle_cashback, (payment_id,))
 
     def create_tables(self):
         """
@@ -489,9 +1891,12 @@ class BankingSystemImpl(BankingSystem, Query):
         """
         self.connect()
         self.cur.executescript(create_tables)
+        # PRAGMA values cannot be bound as parameters
+        self.cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         self.close()
         
     
+    @instrumented
     def create_account(self, timestamp, account_id):
         """
         Creates a new user account in the banking system.
@@ -506,18 +1911,19 @@ class BankingSystemImpl(BankingSystem, Query):
         Returns:
             bool: True if the account was successfully created, False if the account already exists.
         """
-        
-        self.connect()
-
-        if self.check_if_value_exists("user_data", "account_id", account_id):
-            return False
-
-        self.insert_user_data(account_id, timestamp, 1, 1, 1, 1)
-        self.new_balance(account_id, 0, timestamp)
-        self.record_balance(account_id, 0, timestamp,None)
-        return True
-    
-            
+        with self.transaction():
+            self.settle_cashbacks(timestamp)
+            if self.get_account_balance(account_id) is not None:
+                return False
+
+            self.insert_user_data(account_id, timestamp, 1, 1, 1, 1)
+            self.new_balance(account_id, 0, timestamp)
+            self.record_balance(account_id, 0, timestamp,None)
+            if self._leaderboard is not None:
+                self._leaderboard.add_account(account_id)
+            return True
+
+    @instrumented
     def deposit(self, timestamp, account_id, amount):
         """
         Deposits a specified amount into the user's account.
@@ -533,24 +1939,25 @@ class BankingSystemImpl(BankingSystem, Query):
         Returns:
             int | None: The new balance after the deposit if successful, None otherwise.
         """
-       
-        if self.active(account_id) and self.check_if_value_exists('user_data', 'account_id', account_id):
+        with self.transaction():
+            self.settle_cashbacks(timestamp)
             old_balance = self.get_account_balance(account_id)
-            new_balance = old_balance + amount
-            self.update_account_balance(new_balance, timestamp, account_id)
-            self.record_transaction(
-                account_id,
-                amount,
-                timestamp,
-                "deposit",
-            )
-            self.record_balance(account_id, new_balance, timestamp, None)
-            return new_balance + self.check_cashbacks(account_id, timestamp)
-
-        else:  
-            return None
-        
+            if old_balance is not None:
+                new_balance = old_balance + amount
+                self.update_account_balance(new_balance, timestamp, account_id)
+                self.record_transaction(
+                    account_id,
+                    amount,
+                    timestamp,
+                    "deposit",
+                )
+                self.record_balance(account_id, new_balance, timestamp, None)
+                return new_balance
+
+            else:  
+                return None
 
+    @instrumented
     def transfer(self, timestamp, source_account_id, target_account_id, amount):
         """
         Transfers a specified amount from one account to another.
@@ -567,48 +1974,50 @@ class BankingSystemImpl(BankingSystem, Query):
         Returns:
             int | None: The new balance of the source account after the transfer if successful, None otherwise.
         """
-        if source_account_id == target_account_id:
-            return None
-        
-        valid_source = self.active(source_account_id) and self.check_if_value_exists('user_data', 'account_id', source_account_id)
-        valid_target = self.active(target_account_id) and self.check_if_value_exists('user_data', 'account_id', target_account_id)
+        with self.transaction():
+            self.settle_cashbacks(timestamp)
+            if source_account_id == target_account_id:
+                return None
 
-        if not valid_source or not valid_target:
-            return None
-        
+            source_balance = self.get_account_balance(source_account_id)
+            target_balance = self.get_account_balance(target_account_id)
 
-        source_result = self.get_account_balance(source_account_id)
-        source_balance = source_result
-        new_source_balance = source_balance - amount
+            if source_balance is None or target_balance is None:
+                return None
 
-        if source_balance < amount:
-            return None
-        
-        self.update_account_balance(new_source_balance, timestamp, source_account_id)
-        self.record_balance(source_account_id, new_source_balance, timestamp, None)
-
-        target_balance = self.get_account_balance(target_account_id)
-        new_target_balance = target_balance + amount
-        self.update_account_balance(new_target_balance, timestamp, target_account_id)
-        self.record_balance(target_account_id, new_target_balance, timestamp, None)
-      
-        self.record_transaction(
-            source_account_id,
-            -amount,
-            timestamp,
-            "transfer",
-            "None"
-        )
+            new_source_balance = source_balance - amount
 
-        return new_source_balance + self.check_cashbacks(source_account_id, timestamp)
-    
+            if source_balance < amount:
+                return None
+
+            self.update_account_balance(new_source_balance, timestamp, source_account_id)
+            self.record_balance(source_account_id, new_source_balance, timestamp, None)
+
+            new_target_balance = target_balance + amount
+            self.update_account_balance(new_target_balance, timestamp, target_account_id)
+            self.record_balance(target_account_id, new_target_balance, timestamp, None)
+
+            self.record_transaction(
+                source_account_id,
+                -amount,
+                timestamp,
+                "transfer",
+            )
+            if self._leaderboard is not None:
+                self._leaderboard.add_outgoing(source_account_id, amount)
+
+            return new_source_balance
+
+    @instrumented
     def top_spenders(self, timestamp: int, n:int) -> list[str]:
         """
     Retrieves the top n accounts based on outgoing transactions.
 
-    This method executes a SQL query to find the accounts with the highest total outgoing 
-    transactions. It returns a list of strings, that each represent an account ID and the 
-    total outgoing amount in the format "account_id(total_out)".
+    This method reads the accounts with the highest total outgoing transactions from the 
+    leaderboard, which is kept up to date by `transfer`, `pay` and `merge_accounts`, so the 
+    cost does not depend on the size of the transaction history. It returns a list of strings, 
+    that each represent an account ID and the total outgoing amount in the format 
+    "account_id(total_out)".
 
     Args:
         timestamp (int): The timestamp to consider for the transactions.
@@ -618,12 +2027,16 @@ class BankingSystemImpl(BankingSystem, Query):
         list[str]: A list of strings representing the top n accounts and their total outgoing 
         transaction amounts.
         """
+        self.settle_cashbacks(timestamp)
+
         # Create avariable which stores a tuple: (account id, sum(outgoing transactions)) 
-        output = self.execute_script(top_spenders, (n,)) 
+        with self.reading():
+            output = self.leaderboard.top(n)
 
         # Perform list comprehension to extract tuple from the output
         return [f"{account_id}({int(total_out)})" for account_id, total_out in output]
     
+    @instrumented
     def pay(self, timestamp:int, account_id:str, amount:int) -> str|None:
         """
     Processes a payment from the specified account.
@@ -641,25 +2054,27 @@ class BankingSystemImpl(BankingSystem, Query):
         str | None: The payment number if the payment is successful, None if the payment 
         cannot be processed (e.g., insufficient funds or inactive account).
         """
-
-        self.connect()
-        if self.active(account_id) and self.check_if_value_exists('user_data', 'account_id', account_id):
-            new_balance = self.get_account_balance(account_id) + self.check_cashbacks(account_id, timestamp) - amount
-            actual_balance = self.get_account_balance(account_id) - amount
-            if new_balance >= 0:
-                self.update_account_balance(actual_balance, timestamp, account_id)
-                cashback_date = timestamp + 86400000
-                self.connect()
-                count=self.cur.execute(f"SELECT COUNT(*) from transactions WHERE type_of_transaction = 'payment' ").fetchone()[0]
-                payment_number="payment" + str(count+1)
-                self.record_transaction(account_id, -amount, timestamp, "payment", payment_number, cashback_date)
-                self.record_balance(account_id, actual_balance, timestamp, None)
-                return payment_number
+        with self.transaction():
+            self.settle_cashbacks(timestamp)
+            balance = self.get_account_balance(account_id)
+            if balance is not None:
+                actual_balance = balance - amount
+                if actual_balance >= 0:
+                    self.update_account_balance(actual_balance, timestamp, account_id)
+                    cashback_date = timestamp + CASHBACK_DELAY
+                    payment_id = self.next_sequence_value("payment")
+                    self.record_transaction(account_id, -amount, timestamp, "payment", payment_id, cashback_date)
+                    self.cashback_queue.push(cashback_date, payment_id, payment_id)
+                    self.record_balance(account_id, actual_balance, timestamp, None)
+                    if self._leaderboard is not None:
+                        self._leaderboard.add_outgoing(account_id, amount)
+                    return format_payment(payment_id)
+                else:
+                    return None
             else:
                 return None
-        else:
-            return None
-        
+
+    @instrumented
     def get_payment_status(self, timestamp: int, account_id: str, payment: str) -> str | None:
         """
     This method retrieves the status of a specific payment.
@@ -677,27 +2092,37 @@ class BankingSystemImpl(BankingSystem, Query):
         str | None: "IN_PROGRESS" if the cashback date is in the future, "CASHBACK_RECEIVED" 
         if the cashback has been received, or None if the account is inactive or does not exist.
     """
-        self.connect()
-        if self.active(account_id) and self.check_if_value_exists('user_data', 'account_id', account_id):
-            try:
-                self.connect()
-                payment_date = self.cur.execute(f"SELECT cashback_date from transactions WHERE payment_number = '{payment}' AND account_id = '{account_id}' ;").fetchone()[0]
-                if payment_date > timestamp:
-                    return "IN_PROGRESS"
-                else:
-                    return "CASHBACK_RECEIVED"
-            except:
-                return None
-        else:
+        self.settle_cashbacks(timestamp)
+        payment_id = parse_payment(payment)
+        if payment_id is None:
             return None
+        with self.reading():
+            if self.get_account_balance(account_id) is not None:
+                try:
+                    self.flush_writes()
+                    self.connect()
+                    payer, payment_date = self.cur.execute(payment_record, (payment_id,)).fetchone()
+                    # Payments of a merged away account belong to the account that absorbed it
+                    if self.aliases.owner(payer) != self.account_key(account_id):
+                        return None
+                    if payment_date > timestamp:
+                        return "IN_PROGRESS"
+                    else:
+                        return "CASHBACK_RECEIVED"
+                except:
+                    return None
+            else:
+                return None
     
+    @instrumented
     def merge_accounts(self, timestamp: int, account_id_1: str, account_id_2: str) -> bool:
         """
     Merges two user accounts into one.
 
     This method checks if both accounts are valid and exist. If both accounts are valid and 
-    not the same, it combines their balances, then deletes the second account, and updates the 
-    transaction records to reflect the merge.
+    not the same, it combines their balances, then deletes the second account and links it to 
+    the first, so its transactions are attributed to the first account without being rewritten 
+    and the merge costs the same however much history either account has.
 
     Args:
         timestamp (int): The timestamp of the merge operation.
@@ -708,31 +2133,41 @@ class BankingSystemImpl(BankingSystem, Query):
         bool: True if the accounts were successfully merged, False if either account is invalid 
         or if both account IDs are the same.
     """
-        valid_source = self.check_if_value_exists('user_data', 'account_id', account_id_1)
-        valid_target = self.check_if_value_exists('user_data', 'account_id', account_id_2)
-
-        if not valid_source or not valid_target:
-            return False
-        if account_id_1 == account_id_2:
-            return False
-
-        self.connect()
-
-        merge_balance = self.get_account_balance(account_id_1) + self.get_account_balance(account_id_2)
-        self.update_account_balance(merge_balance, timestamp, account_id_1)
-        self.delete_account(account_id_2)
-        self.update_transaction_id(account_id_1, account_id_2)
-        self.record_balance(account_id_1, merge_balance, timestamp, None)
-        self.add_merge_date(timestamp, account_id_2)
-      
-        return True
-    
+        with self.transaction():
+            self.settle_cashbacks(timestamp)
+            balance_1 = self.get_account_balance(account_id_1)
+            balance_2 = self.get_account_balance(account_id_2)
+
+            if balance_1 is None or balance_2 is None:
+                return False
+            if account_id_1 == account_id_2:
+                return False
+
+            merge_balance = balance_1 + balance_2
+            self.update_account_balance(merge_balance, timestamp, account_id_1)
+            self.link_accounts(account_id_1, account_id_2)
+            self.delete_account(account_id_2)
+            self.record_balance(account_id_1, merge_balance, timestamp, None)
+            # A NULL balance marks account_id_2 as not existing from the merge on. It is
+            # flushed at once: its key is looked up by id, and an id created again later in
+            # the same batch would give it the new account's key.
+            self.record_balance(account_id_2, None, timestamp, timestamp)
+            self.flush_writes()
+            if self._leaderboard is not None:
+                self._leaderboard.merge(account_id_1, account_id_2)
+
+            return True
+
+    @instrumented
     def get_balance(self, timestamp: int, account_id: str, time_at: int) -> int | None:
         """
     Retrieves the balance of a specified account at a given time.
 
-    This method checks the account's balance history and calculates the balance at the specified 
-    timestamp. It considers any cashbacks and merges that may have occurred.
+    This method looks up the balance at the specified timestamp in the balance index, a 
+    binary search over the account's sorted balance history that does not touch the database 
+    once the history is loaded. Cashbacks are already part of the history, since they are 
+    recorded at their refund date when settled, and an account that was merged away has a 
+    marker at the merge date so it reads as not existing from then on.
 
     Args:
         timestamp (int): The current timestamp to compare against.
@@ -743,36 +2178,92 @@ class BankingSystemImpl(BankingSystem, Query):
         int | None: The balance of the account at the specified time if it exists, None if the 
         account has not been created or if the balance cannot be determined.
         """
-        self.connect()
-        
-        #Check if account hasn't been created yet
-        creation_date=self.cur.execute(f"SELECT MIN(balance_date) from balance_history WHERE account_id='{account_id}'").fetchone()[0]
-        if creation_date is None:
-            return None
-        
-        if time_at < creation_date:
-            return None
-        
-        #Check if account has been merged and recreated
-        try:
-            merge_date_value=self.cur.execute(f"SELECT merge_date from balance_history WHERE account_id='{account_id}'AND merge_date IS NOT NULL").fetchone()[0]
-        except:
-            merge_date_value=None
+        self.settle_cashbacks(timestamp)
+        with self.reading():
+            return self.balance_index.balance_at(account_id, time_at)
+
+    @instrumented
+    def apply_batch(self, operations, chunk_size=10_000):
+        """
+    Replays a sequence of banking operations as one unit of work.
 
-        maxdate=self.cur.execute(f"SELECT MAX(balance_date) from balance_history WHERE account_id='{account_id}' ").fetchone()[0]
+    Each operation is an (op, args) pair naming one of the `BankingSystem` methods, as
+    in a recorded call log, e.g. ("deposit", (3, "account1", 100)). Operations are checked
+    against the method's name and number of arguments before they run, and their inserts
+    and balance updates are written with `executemany` every `chunk_size` rows instead
+    of one statement per row, with a single commit at the end.
 
-        if merge_date_value != None and merge_date_value <= time_at and merge_date_value >= maxdate:
-            return None
-        
-        #Get account balance
-        balance=self.cur.execute(f"SELECT MAX(balance_date), amount from balance_history WHERE account_id='{account_id}' AND balance_date <= {time_at}").fetchone()[1]
+    Args:
+        operations (Iterable[tuple[str, tuple]]): The operations to apply, in order.
+        chunk_size (int): The number of buffered rows written per flush.
 
-        #Check number of transactions and apply correction to rounding if exceed a certain amount
-        n_transactions = self.check_transactions(account_id, time_at)
+    Returns:
+        list: The result of each operation, in order.
 
-        if n_transactions >=9:
-            return balance + self.merge_cashbacks(account_id, time_at)
-        
-        else:
-            return balance + self.check_cashbacks(account_id, time_at)
-        
\ No newline at end of file
+    Raises:
+        ValueError: If an operation is not a `BankingSystem` method or has the wrong number
+        of arguments. Nothing in the batch is applied in that case.
+        """
+        results = []
+        with self.batched_writes(chunk_size):
+            for op, args in operations:
+                if batch_operations.get(op) != len(args):
+                    raise ValueError(f"invalid operation {op!r} with arguments {args!r}")
+                results.append(getattr(self, op)(*args))
+        return results
+
+
+# Number of arguments taken by each operation accepted by `BankingSystemImpl.apply_batch`.
+batch_operations = {
+    name: len(inspect.signature(method).parameters) - 1
+    for name, method in vars(BankingSystem).items()
+    if inspect.isfunction(method) and not name.startswith("_")
+}
+
+
+def sharded_banking_system(**options):
+    """
+    Builds a `banking_system_sharded.ShardedBankingSystem`, which is imported here since
+    it builds on this module.
+    """
+    from banking_system_sharded import ShardedBankingSystem
+    return ShardedBankingSystem(**options)
+
+
+def journaled_banking_system(**options):
+    """
+    Builds a `banking_system_journal.JournaledBankingSystem`, which is imported here since
+    it builds on this module.
+    """
+    from banking_system_journal import JournaledBankingSystem
+    return JournaledBankingSystem(**options)
+
+
+ENGINES = {
+    "sqlite": BankingSystemImpl,
+    "memory": InMemoryBankingSystem,
+    "sharded": sharded_banking_system,
+    "journaled": journaled_banking_system,
+}
+
+
+def create_banking_system(engine: str = "sqlite", **options) -> BankingSystem:
+    """
+    Builds a banking system backed by the requested storage engine.
+
+    Args:
+        engine (str): "sqlite" for the persistent `BankingSystemImpl`, "memory" for the
+            dict-backed `InMemoryBankingSystem` used for replay and simulation workloads, or
+            "sharded" for a `ShardedBankingSystem` spreading accounts over several databases,
+            or "journaled" for a `JournaledBankingSystem` keeping state in memory behind a
+            snapshot and an append-only journal.
+        **options: Passed on to the engine's constructor.
+
+    Returns:
+        BankingSystem: A new, empty banking system.
+    """
+    try:
+        factory = ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {sorted(ENGINES)}") from None
+    return factory(**options)
@@ -0,0 +1,458 @@
+"""
+In-memory indexes shared by the banking system engines.
+
+SortedKeys: An ordered collection of keys split into bounded sublists, supporting
+    insertion, removal and in-order iteration in O(log n) plus a small constant.
+SpenderLeaderboard: Outgoing totals per account, kept ordered for `top_spenders`.
+CashbackQueue: Pending cashback refunds ordered by the date they are due.
+BalanceHistory: Sorted point-in-time balances of one account identifier.
+BalanceIndex: BalanceHistory per account identifier, answering `get_balance` by bisection.
+AccountCache: Least recently used cache of which accounts exist and their current balance.
+AccountAliases: Union-find over account keys, resolving a merged away account to the one that absorbed it.
+"""
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from itertools import islice
+
+
+class SortedKeys:
+    """
+    An ordered multiset of keys kept as a list of sorted sublists.
+
+    Each sublist holds at most `2 * load` keys, so inserting or removing a key costs a
+    binary search over the sublist maxima, a binary search inside one sublist and a
+    short list shift, while reading the first `n` keys in order costs O(n).
+    """
+
+    load = 256
+
+    def __init__(self, keys=()):
+        self._lists = []
+        self._maxes = []
+        self._len = 0
+        keys = sorted(keys)
+        for start in range(0, len(keys), self.load):
+            chunk = keys[start:start + self.load]
+            self._lists.append(chunk)
+            self._maxes.append(chunk[-1])
+        self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for sublist in self._lists:
+            yield from sublist
+
+    def add(self, key):
+        """
+        Inserts `key` in order.
+        """
+        self._len += 1
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            return
+
+        position = bisect_left(self._maxes, key)
+        if position == len(self._maxes):
+            position -= 1
+            self._lists[position].append(key)
+            self._maxes[position] = key
+        else:
+            insort(self._lists[position], key)
+
+        sublist = self._lists[position]
+        if len(sublist) > 2 * self.load:
+            self._lists.insert(position + 1, sublist[self.load:])
+            del sublist[self.load:]
+            self._maxes.insert(position, sublist[-1])
+
+    def remove(self, key):
+        """
+        Removes one occurrence of `key`; raises ValueError if it is not present.
+        """
+        position = bisect_left(self._maxes, key)
+        if position == len(self._maxes):
+            raise ValueError(f"{key!r} not in SortedKeys")
+        sublist = self._lists[position]
+        index = bisect_left(sublist, key)
+        if sublist[index] != key:
+            raise ValueError(f"{key!r} not in SortedKeys")
+
+        del sublist[index]
+        self._len -= 1
+        if sublist:
+            self._maxes[position] = sublist[-1]
+        else:
+            del self._lists[position]
+            del self._maxes[position]
+
+    def first(self, n):
+        """
+        Returns the `n` smallest keys in order.
+        """
+        return list(islice(self, n))
+
+
+class SpenderLeaderboard:
+    """
+    Incrementally maintained outgoing totals, ordered for `top_spenders`.
+
+    Totals are kept in a dict for O(1) lookups and mirrored as (-total, account_id) keys
+    in a `SortedKeys`, so the highest spenders (ties broken by account id) come first and
+    `top(n)` costs O(n) after O(log accounts) updates.
+    """
+
+    def __init__(self, totals=None):
+        """
+        Args:
+            totals (dict | None): Account id -> outgoing total to start from.
+        """
+        self._totals = dict(totals or {})
+        self._ranking = SortedKeys((-total, account_id) for account_id, total in self._totals.items())
+
+    def __contains__(self, account_id):
+        return account_id in self._totals
+
+    def __len__(self):
+        return len(self._totals)
+
+    def total(self, account_id):
+        """
+        Returns the outgoing total of `account_id`, or None if it is not ranked.
+        """
+        return self._totals.get(account_id)
+
+    def add_account(self, account_id, total=0):
+        """
+        Starts ranking a new account.
+        """
+        self._totals[account_id] = total
+        self._ranking.add((-total, account_id))
+
+    def remove_account(self, account_id):
+        """
+        Stops ranking `account_id` and returns its outgoing total.
+        """
+        total = self._totals.pop(account_id)
+        self._ranking.remove((-total, account_id))
+        return total
+
+    def add_outgoing(self, account_id, amount):
+        """
+        Adds a transfer or payment of `amount` to the total of `account_id`.
+        """
+        total = self._totals[account_id]
+        self._ranking.remove((-total, account_id))
+        total += amount
+        self._totals[account_id] = total
+        self._ranking.add((-total, account_id))
+
+    def merge(self, account_id_1, account_id_2):
+        """
+        Folds the total of `account_id_2` into `account_id_1` and drops `account_id_2`.
+        """
+        self.add_outgoing(account_id_1, self.remove_account(account_id_2))
+
+    def top(self, n):
+        """
+        Returns up to `n` (account_id, total) pairs, highest total first.
+        """
+        return [(account_id, -negated) for negated, account_id in self._ranking.first(n)]
+
+
+class CashbackQueue:
+    """
+    Pending cashback refunds in a heap keyed by their due date.
+
+    Each entry is (cashback_date, sequence, item): `sequence` orders refunds due at the
+    same timestamp by the order the payments were made, and `item` is whatever the engine
+    needs to credit the refund (a payment record or a payment number).
+    """
+
+    def __init__(self, entries=()):
+        self._heap = list(entries)
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, cashback_date, sequence, item):
+        """
+        Schedules a refund for `cashback_date`.
+        """
+        heapq.heappush(self._heap, (cashback_date, sequence, item))
+
+    def is_due(self, timestamp):
+        """
+        Returns True if at least one refund is due at or before `timestamp`, in O(1).
+        """
+        return bool(self._heap) and self._heap[0][0] <= timestamp
+
+    def pop_due(self, timestamp):
+        """
+        Removes and yields every (cashback_date, sequence, item) due at or before
+        `timestamp`, earliest first.
+        """
+        heap = self._heap
+        while heap and heap[0][0] <= timestamp:
+            yield heapq.heappop(heap)
+
+
+class BalanceHistory:
+    """
+    Sorted point-in-time balances for one account identifier.
+
+    `times` and `balances` are parallel arrays appended in timestamp order. A balance of
+    None marks the identifier as not existing from that time on (it was merged away),
+    which also lets an identifier be re-created later.
+    """
+    __slots__ = ("times", "balances")
+
+    def __init__(self, rows=()):
+        """
+        Args:
+            rows: (timestamp, balance) pairs in timestamp order to start from.
+        """
+        self.times = []
+        self.balances = []
+        for timestamp, balance in rows:
+            self.record(timestamp, balance)
+
+    def __len__(self):
+        return len(self.times)
+
+    def record(self, timestamp, balance):
+        """
+        Appends the balance after an operation at `timestamp`.
+        """
+        self.times.append(timestamp)
+        self.balances.append(balance)
+
+    def at(self, timestamp):
+        """
+        Returns the balance after every operation processed at or before `timestamp`,
+        or None if the identifier did not exist at that time.
+        """
+        index = bisect_right(self.times, timestamp) - 1
+        if index < 0:
+            return None
+        return self.balances[index]
+
+
+class BalanceIndex:
+    """
+    Point-in-time balances of every account identifier, answered in O(log h) by bisecting
+    the identifier's `BalanceHistory`.
+
+    Without a `loader` the index is assumed to hold every history, so an unknown
+    identifier simply never existed. With a `loader` histories are fetched on first use
+    (e.g. from the database after a restart or a rollback), and balance writes are only
+    mirrored into histories that are already loaded; the others pick them up when loaded.
+    A loaded index can also be given a `capacity`, past which the least recently used
+    history is dropped and loaded again when next needed.
+    """
+
+    def __init__(self, loader=None, capacity=None):
+        """
+        Args:
+            loader (callable | None): account_id -> iterable of (timestamp, balance) rows
+                in timestamp order, used to fill histories that are not loaded yet.
+            capacity (int | None): The most histories kept, or None for no limit. Only
+                taken with a `loader`, which is where dropped histories come back from.
+
+        Raises:
+            ValueError: If a `capacity` is given without a `loader`.
+        """
+        if capacity is not None and loader is None:
+            raise ValueError("a balance index without a loader has to keep every history")
+        self.capacity = capacity
+        self._histories = OrderedDict()
+        self._loader = loader
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._histories)
+
+    def __getstate__(self):
+        # Snapshots pickle the index; the lock is made again on load.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def history(self, account_id):
+        """
+        Returns the `BalanceHistory` of `account_id`, loading it if needed, or None if the
+        identifier is unknown and there is nothing to load it from.
+        """
+        history = self._histories.get(account_id)
+        if history is None and self._loader is not None:
+            history = BalanceHistory(self._loader(account_id))
+            # Reader threads may load histories at the same time.
+            with self._lock:
+                self._histories[account_id] = history
+                if self.capacity is not None and len(self._histories) > self.capacity:
+                    self._histories.popitem(last=False)
+        elif history is not None and self.capacity is not None:
+            with self._lock:
+                if account_id in self._histories:
+                    self._histories.move_to_end(account_id)
+        return history
+
+    def record(self, account_id, timestamp, balance):
+        """
+        Mirrors a balance write: the balance of `account_id` after an operation at
+        `timestamp`, or None if the identifier stops existing at that time.
+        """
+        history = self._histories.get(account_id)
+        if history is None:
+            if self._loader is not None:
+                return
+            history = self._histories[account_id] = BalanceHistory()
+        history.record(timestamp, balance)
+
+    def balance_at(self, account_id, timestamp):
+        """
+        Returns the balance of `account_id` at `timestamp`, or None if it did not exist then.
+        """
+        history = self.history(account_id)
+        if history is None:
+            return None
+        return history.at(timestamp)
+
+
+class AccountCache:
+    """
+    Current balances of recently used account identifiers, with None recorded for an
+    identifier known not to exist, evicting the least recently used entry once
+    `capacity` identifiers are cached.
+
+    The engine keeps it coherent by writing every balance change, account creation and
+    merge through it. Entries may be filled concurrently by reader threads, so updates
+    are made under a lock of its own.
+    """
+
+    def __init__(self, capacity=100_000):
+        """
+        Args:
+            capacity (int): The most identifiers kept; 0 turns the cache off.
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, account_id):
+        """
+        Returns (True, balance) if `account_id` is cached, where balance is None for an
+        identifier that does not exist, or (False, None) if it is not cached.
+        """
+        with self._lock:
+            try:
+                balance = self._entries[account_id]
+            except KeyError:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(account_id)
+            self.hits += 1
+            return True, balance
+
+    def put(self, account_id, balance):
+        """
+        Records the current balance of `account_id`, or None if it does not exist.
+        """
+        if not self.capacity:
+            return
+        with self._lock:
+            self._entries[account_id] = balance
+            self._entries.move_to_end(account_id)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Forgets every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class AccountAliases:
+    """
+    Which account now owns the rows of each account that was merged away.
+
+    A union-find (disjoint set) structure over account keys with union by rank and path
+    compression, so recording a merge and resolving a key both take O(α(n)) amortized
+    time however long the chain of merges behind a key is. Each set also remembers its
+    owner, the one key in it that has not been merged away. Only keys that took part in
+    a merge are stored; any other key is its own owner.
+
+    Keys may be resolved concurrently by reader threads, which compress paths as they
+    go, so updates are made under a lock of its own.
+    """
+
+    def __init__(self, links=()):
+        """
+        Args:
+            links: (absorbed key, surviving key) pairs of the merges made so far, in any order.
+        """
+        self._parent = {}
+        self._rank = {}
+        self._owner = {}
+        self._lock = threading.Lock()
+        for absorbed, survivor in links:
+            self.merge(absorbed, survivor)
+
+    def __len__(self):
+        return len(self._parent)
+
+    def _find(self, key):
+        parent = self._parent
+        root = key
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while key != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    def owner(self, key):
+        """
+        Returns the key of the account that owns the rows of `key`: `key` itself unless
+        it was merged away.
+        """
+        if key not in self._parent:
+            return key
+        with self._lock:
+            root = self._find(key)
+            return self._owner.get(root, root)
+
+    def merge(self, absorbed, survivor):
+        """
+        Records that the account `absorbed` was merged into the account `survivor`.
+        """
+        with self._lock:
+            absorbed_root = self._find(absorbed)
+            survivor_root = self._find(survivor)
+            if absorbed_root == survivor_root:
+                return
+            owner = self._owner.pop(survivor_root, survivor_root)
+            self._owner.pop(absorbed_root, None)
+            rank = self._rank
+            if rank.get(absorbed_root, 0) > rank.get(survivor_root, 0):
+                absorbed_root, survivor_root = survivor_root, absorbed_root
+            elif rank.get(absorbed_root, 0) == rank.get(survivor_root, 0):
+                rank[survivor_root] = rank.get(survivor_root, 0) + 1
+            self._parent[absorbed_root] = survivor_root
+            self._parent.setdefault(survivor_root, survivor_root)
+            self._owner[survivor_root] = owner
@@ -0,0 +1,357 @@
+"""
+In-memory banking with snapshot plus append-only journal persistence.
+
+`JournaledBankingSystem` keeps all account state in memory like `InMemoryBankingSystem`
+and makes it durable without a SQL commit per operation:
+
+- Journal: every successful create_account, deposit, transfer, pay and merge_accounts is
+  appended to "<db_path root>.<generation>.journal" as a compact binary record. Records
+  are buffered and written with one fsync per `sync_every` operations (group commit), so
+  a crash loses at most the last unsynced batch. Reads and operations that fail change
+  nothing and are not journaled. An operation is encoded before it is applied, so one
+  whose arguments do not fit a record raises ValueError without changing anything.
+- Snapshot: every `snapshot_every` journaled operations (or on `snapshot()`) the whole
+  state is pickled to "<db_path root>.snapshot" through a temporary file and an atomic
+  rename, and the journal starts over in the next generation.
+
+Opening with `reset=False` recovers by loading the snapshot and replaying only the
+journal of its generation. A torn record at the end of the journal, left by a crash in
+the middle of a write, is detected by its checksum and cut off.
+
+Each journal record is framed as (payload length, CRC-32 of the payload) followed by the
+payload: an operation code, the timestamp and the operation's arguments, with account ids
+as length-prefixed UTF-8 and amounts as 64-bit integers.
+"""
+import os
+import pickle
+import struct
+import zlib
+
+from banking_system_impl import DEFAULT_DB_PATH
+from banking_system_memory import InMemoryBankingSystem
+
+# Operation name -> (record code, argument layout after the timestamp): "s" is an account
+# id, "q" an amount.
+journaled_operations = {
+    "create_account": (1, "s"),
+    "deposit": (2, "sq"),
+    "transfer": (3, "ssq"),
+    "pay": (4, "sq"),
+    "merge_accounts": (5, "ss"),
+}
+operation_codes = {code: (name, layout) for name, (code, layout) in journaled_operations.items()}
+
+FRAME = struct.Struct("<II")
+CODE_AND_TIMESTAMP = struct.Struct("<Bq")
+ACCOUNT_LENGTH = struct.Struct("<H")
+AMOUNT = struct.Struct("<q")
+
+SNAPSHOT_MAGIC = b"BANKSNAP1\n"
+
+
+def encode_record(op, args):
+    """
+    Encodes a journaled operation as one framed journal record.
+
+    Args:
+        op (str): The name of an operation in `journaled_operations`.
+        args (tuple): Its arguments, timestamp first.
+
+    Returns:
+        bytes: The record, ready to be appended to the journal.
+
+    Raises:
+        ValueError: If an account id is longer than 65535 bytes in UTF-8 or an amount or
+        the timestamp does not fit in 64 bits.
+    """
+    code, layout = journaled_operations[op]
+    try:
+        parts = [CODE_AND_TIMESTAMP.pack(code, args[0])]
+        for kind, value in zip(layout, args[1:]):
+            if kind == "s":
+                encoded = value.encode("utf-8")
+                parts.append(ACCOUNT_LENGTH.pack(len(encoded)))
+                parts.append(encoded)
+            else:
+                parts.append(AMOUNT.pack(value))
+    except struct.error as error:
+        raise ValueError(f"{op}{tuple(args)!r} cannot be journaled: {error}") from None
+    payload = b"".join(parts)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_records(data):
+    """
+    Decodes journal records until the end of `data` or the first incomplete or corrupt one.
+
+    Args:
+        data (bytes): The contents of a journal file.
+
+    Yields:
+        tuple[str, tuple, int]: The operation name, its arguments and the offset just
+        past its record, i.e. how much of `data` is valid so far.
+    """
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, checksum = FRAME.unpack_from(data, offset)
+        start = offset + FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        code, timestamp = CODE_AND_TIMESTAMP.unpack_from(payload)
+        name, layout = operation_codes[code]
+        args = [timestamp]
+        position = CODE_AND_TIMESTAMP.size
+        for kind in layout:
+            if kind == "s":
+                (size,) = ACCOUNT_LENGTH.unpack_from(payload, position)
+                position += ACCOUNT_LENGTH.size
+                args.append(payload[position:position + size].decode("utf-8"))
+                position += size
+            else:
+                args.append(AMOUNT.unpack_from(payload, position)[0])
+                position += AMOUNT.size
+        offset = start + length
+        yield name, tuple(args), offset
+
+
+def sync_directory(path):
+    """
+    Flushes a directory entry so a file created or renamed in it survives a crash.
+    """
+    descriptor = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class JournaledBankingSystem(InMemoryBankingSystem):
+    """
+    An `InMemoryBankingSystem` persisted through periodic snapshots and a binary journal.
+
+    Attributes:
+        generation (int): The number of snapshots taken so far; names the current journal.
+        journaled (int): The number of operations in the current journal.
+        recovered (int): The number of journal records replayed when the system was opened.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, sync_every=1000, snapshot_every=1_000_000, reset=True):
+        """
+        Opens a journaled banking system.
+
+        Args:
+            db_path (str): Where to keep the data; the snapshot and journals are named after
+                it without its extension. ":memory:" keeps nothing on disk.
+            sync_every (int): How many operations are written per fsync; 1 makes every
+                operation durable before it returns.
+            snapshot_every (int | None): How many journaled operations trigger a snapshot,
+                or None to only take them on `snapshot()`.
+            reset (bool): Whether to start from an empty system, deleting any existing
+                snapshot and journals, rather than recovering from them.
+
+        Raises:
+            ValueError: If `sync_every` is less than 1 or the snapshot is not one written
+            by this class.
+        """
+        if sync_every < 1:
+            raise ValueError(f"sync_every must be at least 1, got {sync_every}")
+        super().__init__()
+        self.sync_every = sync_every
+        self.snapshot_every = snapshot_every
+        self.generation = 0
+        self.journaled = 0
+        self.recovered = 0
+        self._buffer = bytearray()
+        self._unsynced = 0
+        self._journal = None
+        self._root = None
+        if db_path == ":memory:":
+            return
+
+        self._root = os.path.splitext(db_path)[0]
+        if reset:
+            for path in self._stale_files(keep=None):
+                os.remove(path)
+        else:
+            self._recover()
+        self._journal = open(self.journal_path(self.generation), "ab")
+
+    def journal_path(self, generation):
+        """
+        Returns the path of the journal written after snapshot `generation`.
+        """
+        return f"{self._root}.{generation}.journal"
+
+    @property
+    def snapshot_path(self):
+        """
+        The path of the latest snapshot.
+        """
+        return f"{self._root}.snapshot"
+
+    def _stale_files(self, keep):
+        """
+        Lists this system's snapshot and journal files, except the journal of generation
+        `keep` and, if `keep` is not None, the snapshot.
+        """
+        directory = os.path.dirname(os.path.abspath(self._root))
+        prefix = os.path.basename(self._root) + "."
+        paths = []
+        for name in os.listdir(directory):
+            if not name.startswith(prefix):
+                continue
+            suffix = name[len(prefix):]
+            generation, _, extension = suffix.partition(".")
+            if extension == "journal" and generation.isdigit() and int(generation) != keep:
+                paths.append(os.path.join(directory, name))
+            elif suffix in ("snapshot", "snapshot.tmp") and (keep is None or suffix == "snapshot.tmp"):
+                paths.append(os.path.join(directory, name))
+        return paths
+
+    def _state(self):
+        """
+        Returns everything a snapshot has to hold, in the order `_recover` unpacks it.
+        """
+        return (self.accounts, self.balance_index, self.leaderboard, self.payment_count, self._pending_cashbacks)
+
+    def _recover(self):
+        """
+        Loads the latest snapshot, replays the journal written after it and cuts off a
+        torn record at its end.
+        """
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as file:
+                if file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                    raise ValueError(f"{self.snapshot_path} is not a banking system snapshot")
+                self.generation, state = pickle.load(file)
+            (self.accounts, self.balance_index, self.leaderboard, self.payment_count,
+             self._pending_cashbacks) = state
+
+        path = self.journal_path(self.generation)
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                data = file.read()
+            valid = 0
+            for op, args, valid in decode_records(data):
+                getattr(InMemoryBankingSystem, op)(self, *args)
+                self.recovered += 1
+            if valid < len(data):
+                with open(path, "r+b") as file:
+                    file.truncate(valid)
+        self.journaled = self.recovered
+        for stale in self._stale_files(keep=self.generation):
+            os.remove(stale)
+
+    def _append(self, record):
+        """
+        Journals the record of a successful operation, syncing the journal every
+        `sync_every` operations and taking a snapshot every `snapshot_every`.
+        """
+        if self._journal is None:
+            return
+        self._buffer += record
+        self._unsynced += 1
+        self.journaled += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        if self.snapshot_every is not None and self.journaled >= self.snapshot_every:
+            self.snapshot()
+
+    def sync(self):
+        """
+        Writes the buffered journal records and waits for them to reach the disk.
+        """
+        if self._journal is None or not self._buffer:
+            return
+        self._journal.write(self._buffer)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._buffer.clear()
+        self._unsynced = 0
+
+    def snapshot(self):
+        """
+        Writes the whole state as the new snapshot and starts the next journal generation.
+
+        The snapshot replaces the previous one atomically, and the old journal is only
+        deleted once the new snapshot is on disk, so a crash at any point leaves either the
+        old snapshot with its journal or the new one.
+        """
+        if self._journal is None:
+            return
+        self.sync()
+        generation = self.generation + 1
+        temporary = self.snapshot_path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(SNAPSHOT_MAGIC)
+            pickle.dump((generation, self._state()), file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.snapshot_path)
+        sync_directory(self.snapshot_path)
+
+        self._journal.close()
+        os.remove(self.journal_path(self.generation))
+        self.generation = generation
+        self.journaled = 0
+        self._journal = open(self.journal_path(generation), "ab")
+
+    def disconnect(self):
+        """
+        Syncs and closes the journal.
+        """
+        if self._journal is not None:
+            self.sync()
+            self._journal.close()
+            self._journal = None
+
+    def create_account(self, timestamp, account_id):
+        """
+        Creates an account, journaling it if it was created.
+        """
+        record = encode_record("create_account", (timestamp, account_id))
+        result = super().create_account(timestamp, account_id)
+        if result:
+            self._append(record)
+        return result
+
+    def deposit(self, timestamp, account_id, amount):
+        """
+        Deposits into an account, journaling the deposit if it succeeded.
+        """
+        record = encode_record("deposit", (timestamp, account_id, amount))
+        result = super().deposit(timestamp, account_id, amount)
+        if result is not None:
+            self._append(record)
+        return result
+
+    def transfer(self, timestamp, source_account_id, target_account_id, amount):
+        """
+        Transfers between accounts, journaling the transfer if it succeeded.
+        """
+        record = encode_record("transfer", (timestamp, source_account_id, target_account_id, amount))
+        result = super().transfer(timestamp, source_account_id, target_account_id, amount)
+        if result is not None:
+            self._append(record)
+        return result
+
+    def pay(self, timestamp, account_id, amount):
+        """
+        Makes a payment, journaling it if it succeeded.
+        """
+        record = encode_record("pay", (timestamp, account_id, amount))
+        result = super().pay(timestamp, account_id, amount)
+        if result is not None:
+            self._append(record)
+        return result
+
+    def merge_accounts(self, timestamp, account_id_1, account_id_2):
+        """
+        Merges two accounts, journaling the merge if it succeeded.
+        """
+        record = encode_record("merge_accounts", (timestamp, account_id_1, account_id_2))
+        result = super().merge_accounts(timestamp, account_id_1, account_id_2)
+        if result:
+            self._append(record)
+        return result
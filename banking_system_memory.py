@@ -0,0 +1,202 @@
+from banking_system import BankingSystem
+from banking_system_indexes import BalanceIndex, CashbackQueue, SpenderLeaderboard
+
+
+# 24 hours in milliseconds, the waiting period before a payment's cashback is refunded.
+CASHBACK_DELAY = 86400000
+
+
+def cashback_for(amount):
+    """
+    Returns the 2% cashback of a payment of `amount`, rounded down.
+    """
+    return amount * 2 // 100
+
+
+class Account:
+    """
+    State of a live account.
+
+    Attributes:
+        account_id (str): The unique identifier for the account.
+        balance (int): The current balance, including every cashback already refunded.
+        payments (dict): Payment number -> `Payment` for every payment the account owns.
+    """
+    __slots__ = ("account_id", "balance", "payments")
+
+    def __init__(self, account_id):
+        self.account_id = account_id
+        self.balance = 0
+        self.payments = {}
+
+
+class Payment:
+    """
+    A payment waiting for (or having received) its 2% cashback.
+
+    Attributes:
+        number (str): The payment identifier, e.g. "payment1".
+        owner (Account): The account the cashback is refunded to; updated on merges.
+        cashback (int): The amount refunded at `cashback_date`.
+        cashback_date (int): The timestamp at which the cashback is refunded.
+    """
+    __slots__ = ("number", "owner", "cashback", "cashback_date")
+
+    def __init__(self, number, owner, cashback, cashback_date):
+        self.number = number
+        self.owner = owner
+        self.cashback = cashback
+        self.cashback_date = cashback_date
+
+
+class InMemoryBankingSystem(BankingSystem):
+    """
+    A `BankingSystem` that keeps all state in Python objects instead of SQLite.
+
+    It is meant for replay and simulation workloads where nothing has to be persisted.
+    Cashbacks are kept in a heap ordered by refund date and credited exactly once, as
+    soon as an operation at or after that date is processed, so every read is a plain
+    lookup.
+
+    Attributes:
+        accounts (dict): Account id -> `Account` for every live account.
+        balance_index (BalanceIndex): Point-in-time balances, kept for merged accounts too.
+        leaderboard (SpenderLeaderboard): Outgoing totals of the live accounts.
+        payment_count (int): The number of successful payments across all accounts.
+    """
+
+    def __init__(self):
+        self.accounts = {}
+        self.balance_index = BalanceIndex()
+        self.leaderboard = SpenderLeaderboard()
+        self.payment_count = 0
+        self._pending_cashbacks = CashbackQueue()
+
+    def _settle_cashbacks(self, timestamp):
+        """
+        Refunds every cashback due at or before `timestamp` to the account that owns
+        the payment now, recording the new balance at the refund date.
+        """
+        for cashback_date, _, payment in self._pending_cashbacks.pop_due(timestamp):
+            owner = payment.owner
+            owner.balance += payment.cashback
+            self.balance_index.record(owner.account_id, cashback_date, owner.balance)
+
+    def create_account(self, timestamp, account_id):
+        """
+        Creates a new account; returns False if `account_id` already exists.
+        """
+        self._settle_cashbacks(timestamp)
+        if account_id in self.accounts:
+            return False
+
+        self.accounts[account_id] = Account(account_id)
+        self.leaderboard.add_account(account_id)
+        self.balance_index.record(account_id, timestamp, 0)
+        return True
+
+    def deposit(self, timestamp, account_id, amount):
+        """
+        Deposits `amount` and returns the new balance, or None if the account does not exist.
+        """
+        self._settle_cashbacks(timestamp)
+        account = self.accounts.get(account_id)
+        if account is None:
+            return None
+
+        account.balance += amount
+        self.balance_index.record(account_id, timestamp, account.balance)
+        return account.balance
+
+    def transfer(self, timestamp, source_account_id, target_account_id, amount):
+        """
+        Moves `amount` between two different accounts and returns the source balance,
+        or None if either account is missing or the source cannot cover the amount.
+        """
+        self._settle_cashbacks(timestamp)
+        if source_account_id == target_account_id:
+            return None
+        source = self.accounts.get(source_account_id)
+        target = self.accounts.get(target_account_id)
+        if source is None or target is None or source.balance < amount:
+            return None
+
+        source.balance -= amount
+        self.leaderboard.add_outgoing(source_account_id, amount)
+        target.balance += amount
+        self.balance_index.record(source_account_id, timestamp, source.balance)
+        self.balance_index.record(target_account_id, timestamp, target.balance)
+        return source.balance
+
+    def top_spenders(self, timestamp, n):
+        """
+        Returns the `n` accounts with the highest outgoing totals as "account_id(total)".
+        """
+        self._settle_cashbacks(timestamp)
+        return [f"{account_id}({total})" for account_id, total in self.leaderboard.top(n)]
+
+    def pay(self, timestamp, account_id, amount):
+        """
+        Withdraws `amount`, schedules its 2% cashback and returns the payment number,
+        or None if the account is missing or cannot cover the amount.
+        """
+        self._settle_cashbacks(timestamp)
+        account = self.accounts.get(account_id)
+        if account is None or account.balance < amount:
+            return None
+
+        account.balance -= amount
+        self.leaderboard.add_outgoing(account_id, amount)
+        self.balance_index.record(account_id, timestamp, account.balance)
+
+        self.payment_count += 1
+        payment = Payment(
+            f"payment{self.payment_count}", account, cashback_for(amount), timestamp + CASHBACK_DELAY
+        )
+        account.payments[payment.number] = payment
+        self._pending_cashbacks.push(payment.cashback_date, self.payment_count, payment)
+        return payment.number
+
+    def get_payment_status(self, timestamp, account_id, payment):
+        """
+        Returns "IN_PROGRESS" or "CASHBACK_RECEIVED" for a payment owned by `account_id`,
+        or None if the account or the payment does not exist.
+        """
+        self._settle_cashbacks(timestamp)
+        account = self.accounts.get(account_id)
+        if account is None or payment not in account.payments:
+            return None
+        if account.payments[payment].cashback_date > timestamp:
+            return "IN_PROGRESS"
+        return "CASHBACK_RECEIVED"
+
+    def merge_accounts(self, timestamp, account_id_1, account_id_2):
+        """
+        Merges `account_id_2` into `account_id_1`, moving its balance, outgoing total and
+        pending cashbacks, then removes `account_id_2`.
+        """
+        self._settle_cashbacks(timestamp)
+        if account_id_1 == account_id_2:
+            return False
+        kept = self.accounts.get(account_id_1)
+        removed = self.accounts.get(account_id_2)
+        if kept is None or removed is None:
+            return False
+
+        kept.balance += removed.balance
+        self.leaderboard.merge(account_id_1, account_id_2)
+        for payment in removed.payments.values():
+            payment.owner = kept
+        kept.payments.update(removed.payments)
+        del self.accounts[account_id_2]
+
+        self.balance_index.record(account_id_1, timestamp, kept.balance)
+        self.balance_index.record(account_id_2, timestamp, None)
+        return True
+
+    def get_balance(self, timestamp, account_id, time_at):
+        """
+        Returns the balance of `account_id` at `time_at`, or None if it did not exist then.
+        """
+        self._settle_cashbacks(timestamp)
+        return self.balance_index.balance_at(account_id, time_at)
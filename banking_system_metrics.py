@@ -0,0 +1,259 @@
+"""
+Optional instrumentation for the SQLite banking system.
+
+Metrics: Counts calls, wall time, SQL statements, rows and connections opened per public
+    method, and executions, wall time and rows per SQL statement template.
+InstrumentedCursor: Wraps a cursor so every statement it runs is recorded in a Metrics.
+instrumented: Decorator that records a public method's calls in its system's Metrics.
+
+Metrics start disabled. While disabled a decorated method costs one attribute check on
+top of the call and cursors are handed out unwrapped, so there is nothing else to pay for.
+"""
+import functools
+import re
+import threading
+import time
+
+_literals = re.compile(r"'[^']*'|\b\d+\b")
+
+
+def normalize_statement(sql):
+    """
+    Names an ad hoc SQL statement by its text with whitespace collapsed and literal
+    values replaced by ?, so calls that differ only in their values share one template.
+    """
+    return _literals.sub("?", " ".join(sql.split()))
+
+
+class Metrics:
+    """
+    Counters for the methods and SQL statements of one banking system.
+
+    Attributes:
+        enabled (bool): Whether anything is recorded.
+        names (dict): Maps the text of known SQL statements to their template name.
+        connections (ConnectionManager | None): The pool whose counters are included
+            in snapshots.
+        methods (dict): {method: {"calls", "seconds", "statements", "rows", "connections_opened"}}.
+        statements (dict): {template: {"executions", "seconds", "rows"}}.
+    """
+
+    method_fields = ("calls", "seconds", "statements", "rows", "connections_opened")
+    statement_fields = ("executions", "seconds", "rows")
+
+    def __init__(self, names=None, connections=None, enabled=False):
+        self.enabled = enabled
+        self.names = names or {}
+        self.connections = connections
+        self.methods = {}
+        self.statements = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self):
+        """
+        Starts recording.
+        """
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stops recording; the counters collected so far are kept.
+        """
+        self.enabled = False
+
+    def reset(self):
+        """
+        Clears every counter.
+        """
+        with self._lock:
+            self.methods = {}
+            self.statements = {}
+
+    def statement_name(self, sql):
+        """
+        Returns the template name of a SQL statement.
+        """
+        name = self.names.get(sql)
+        return name if name is not None else normalize_statement(sql)
+
+    def _opened(self):
+        return self.connections.counters["opened"] if self.connections is not None else 0
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def call(self, name, method, *args):
+        """
+        Runs `method(*args)` and records it as one call of the public method `name`.
+
+        Statements run during the call are counted against the innermost recorded method,
+        so an `apply_batch` call shows the statements of each operation it replays.
+        """
+        counts = {"statements": 0, "rows": 0}
+        stack = self._stack()
+        stack.append(counts)
+        opened = self._opened()
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                totals = self.methods.get(name)
+                if totals is None:
+                    totals = self.methods[name] = dict.fromkeys(self.method_fields, 0)
+                totals["calls"] += 1
+                totals["seconds"] += seconds
+                totals["statements"] += counts["statements"]
+                totals["rows"] += counts["rows"]
+                totals["connections_opened"] += self._opened() - opened
+
+    def record_statement(self, name, seconds, rows, executions=1):
+        """
+        Records executions of a SQL statement template.
+        """
+        with self._lock:
+            totals = self.statements.get(name)
+            if totals is None:
+                totals = self.statements[name] = dict.fromkeys(self.statement_fields, 0)
+            totals["executions"] += executions
+            totals["seconds"] += seconds
+            totals["rows"] += rows
+        stack = self._stack()
+        if stack:
+            stack[-1]["statements"] += executions
+            stack[-1]["rows"] += rows
+
+    def record_rows(self, name, rows):
+        """
+        Adds rows fetched from the result of a SQL statement template.
+        """
+        with self._lock:
+            totals = self.statements.get(name)
+            if totals is not None:
+                totals["rows"] += rows
+        stack = self._stack()
+        if stack:
+            stack[-1]["rows"] += rows
+
+    def snapshot(self):
+        """
+        Returns a copy of every counter.
+
+        Returns:
+            dict: {"methods": ..., "statements": ..., "connections": ...}, where
+            "connections" is the pool's `stats()` if a pool is attached.
+        """
+        with self._lock:
+            snapshot = {
+                "methods": {name: dict(totals) for name, totals in self.methods.items()},
+                "statements": {name: dict(totals) for name, totals in self.statements.items()},
+            }
+        snapshot["connections"] = self.connections.stats() if self.connections is not None else {}
+        return snapshot
+
+    def prometheus(self, prefix="banking"):
+        """
+        Renders the counters in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        def family(metric, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for label, key, value in samples:
+                escaped = str(key).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                lines.append(f'{prefix}_{metric}{{{label}="{escaped}"}} {value}')
+
+        methods = sorted(snapshot["methods"].items())
+        statements = sorted(snapshot["statements"].items())
+        family("method_calls_total", "counter", "Calls of each public method.",
+               [("method", name, totals["calls"]) for name, totals in methods])
+        family("method_seconds_total", "counter", "Wall time spent in each public method.",
+               [("method", name, totals["seconds"]) for name, totals in methods])
+        family("method_statements_total", "counter", "SQL statements run by each public method.",
+               [("method", name, totals["statements"]) for name, totals in methods])
+        family("method_rows_total", "counter", "Rows returned or changed by each public method.",
+               [("method", name, totals["rows"]) for name, totals in methods])
+        family("method_connections_opened_total", "counter", "Connections opened during each public method.",
+               [("method", name, totals["connections_opened"]) for name, totals in methods])
+        family("statement_executions_total", "counter", "Executions of each SQL statement template.",
+               [("statement", name, totals["executions"]) for name, totals in statements])
+        family("statement_seconds_total", "counter", "Wall time spent in each SQL statement template.",
+               [("statement", name, totals["seconds"]) for name, totals in statements])
+        family("statement_rows_total", "counter", "Rows returned or changed by each SQL statement template.",
+               [("statement", name, totals["rows"]) for name, totals in statements])
+        family("connection_events_total", "counter", "Connection pool events.",
+               [("event", name, value) for name, value in sorted(snapshot["connections"].items())])
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedCursor:
+    """
+    A cursor wrapper that records each statement it runs, and the rows it returns or
+    changes, in a Metrics. Anything else is passed through to the wrapped cursor.
+    """
+    __slots__ = ("cursor", "metrics", "statement")
+
+    def __init__(self, cursor, metrics):
+        self.cursor = cursor
+        self.metrics = metrics
+        self.statement = None
+
+    def execute(self, sql, parameters=()):
+        self.statement = self.metrics.statement_name(sql)
+        start = time.perf_counter()
+        self.cursor.execute(sql, parameters)
+        self.metrics.record_statement(self.statement, time.perf_counter() - start, max(self.cursor.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.statement = self.metrics.statement_name(sql)
+        rows = list(seq_of_parameters)
+        start = time.perf_counter()
+        self.cursor.executemany(sql, rows)
+        self.metrics.record_statement(
+            self.statement, time.perf_counter() - start, max(self.cursor.rowcount, 0), len(rows)
+        )
+        return self
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.metrics.record_rows(self.statement, 1)
+        return row
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.metrics.record_rows(self.statement, len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.metrics.record_rows(self.statement, 1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def instrumented(method):
+    """
+    Records every call of a public banking method in `self.metrics` while it is enabled.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return method(self, *args, **kwargs)
+        return metrics.call(name, functools.partial(method, self, *args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,441 @@
+"""
+Streams a JSONL operation log through a banking system and writes the results as JSONL.
+
+Each input line is one operation, in the shape of the calls made by the tests:
+
+    {"op": "deposit", "args": [3, "account1", 100]}
+
+and each output line holds the operation and its result:
+
+    {"op": "deposit", "result": 100}
+
+The log is read, applied and written one chunk at a time through a pipeline of
+generators, so the log itself is never held in memory. By default the SQLite engines replay
+into a database in a temporary directory that is removed afterwards, or into the file
+named by `--db-path`, replacing it, and keep at most `BALANCE_INDEX_SIZE` account balance
+histories in memory, reading the others back from the database for `get_balance`. What
+they still keep in memory grows with the number of accounts, not operations: the spending
+totals behind `top_spenders` and the links left by merges. The memory and journaled
+engines keep their whole state, every balance history included, in memory. With the
+SQLite engine each chunk is applied with `BankingSystemImpl.apply_batch`. Throughput is
+reported on stderr when the replay finishes.
+
+With `--workers N` the log is instead read whole and split into account-disjoint
+partitions: accounts joined by a `transfer` or `merge_accounts` always share one, so each
+partition can be replayed into its own banking system in a separate process. The
+coordinator then stitches the results back into log order, renumbering payments to the
+order a single system would have issued them, merging the per-partition `top_spenders`
+rankings and resolving `get_payment_status` against the global payment numbers. The
+output is identical to a serial replay.
+
+Usage:
+    python banking_system_replay.py operations.jsonl --output results.jsonl
+    python banking_system_replay.py operations.jsonl --workers 4 --output results.jsonl
+    zcat operations.jsonl.gz | python banking_system_replay.py - > results.jsonl
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from banking_system_impl import ENGINES, batch_operations, create_banking_system, format_payment, parse_payment
+from banking_system_sharded import shard_path
+
+# The most account balance histories the SQLite engines keep in memory during a replay.
+BALANCE_INDEX_SIZE = 10_000
+
+
+def read_operations(lines):
+    """
+    Parses JSONL lines into (op, args) pairs, skipping blank lines.
+
+    Args:
+        lines (Iterable[str]): The lines of the operation log.
+
+    Yields:
+        tuple[str, tuple]: The operation name and its arguments.
+
+    Raises:
+        ValueError: If a line is not valid JSON or does not name a `BankingSystem` method
+        with the right number of arguments.
+    """
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            op, args = record["op"], tuple(record["args"])
+        except (ValueError, KeyError, TypeError) as error:
+            raise ValueError(f"line {line_number}: malformed operation ({error})") from None
+        if batch_operations.get(op) != len(args):
+            raise ValueError(f"line {line_number}: invalid operation {op!r} with arguments {list(args)!r}")
+        yield op, args
+
+
+def chunked(operations, chunk_size):
+    """
+    Groups an iterator of operations into lists of at most `chunk_size` items.
+    """
+    operations = iter(operations)
+    while chunk := list(itertools.islice(operations, chunk_size)):
+        yield chunk
+
+
+def apply_operations(system, operations, chunk_size=10_000):
+    """
+    Applies operations to a banking system one chunk at a time.
+
+    Engines with an `apply_batch` method get each chunk as one batch; any other engine
+    has its methods called one by one.
+
+    Yields:
+        tuple[str, object]: Each operation name with its result, in order.
+    """
+    apply_batch = getattr(system, "apply_batch", None)
+    for chunk in chunked(operations, chunk_size):
+        if apply_batch is not None:
+            results = apply_batch(chunk, chunk_size)
+        else:
+            results = [getattr(system, op)(*args) for op, args in chunk]
+        for (op, _), result in zip(chunk, results):
+            yield op, result
+
+
+def write_results(results, output):
+    """
+    Writes (op, result) pairs as JSONL.
+
+    Returns:
+        int: The number of results written.
+    """
+    count = 0
+    for op, result in results:
+        output.write(json.dumps({"op": op, "result": result}))
+        output.write("\n")
+        count += 1
+    return count
+
+
+def account_groups(operations):
+    """
+    Finds which accounts must be replayed together: those linked, directly or through
+    other accounts, by a `transfer` or `merge_accounts` somewhere in the log.
+
+    Args:
+        operations (list[tuple[str, tuple]]): The (op, args) pairs of the log.
+
+    Returns:
+        dict[str, str]: Each account id mentioned in the log -> a representative account
+        id, shared by every account of its group.
+    """
+    parent = {}
+
+    def find(account_id):
+        root = parent.setdefault(account_id, account_id)
+        while root != parent[root]:
+            root = parent[root]
+        while account_id != root:
+            parent[account_id], account_id = root, parent[account_id]
+        return root
+
+    for op, args in operations:
+        if op in ("transfer", "merge_accounts"):
+            first, second = find(args[1]), find(args[2])
+            if first != second:
+                parent[second] = first
+        elif op != "top_spenders":
+            find(args[1])
+    return {account_id: find(account_id) for account_id in parent}
+
+
+def partition_operations(operations, partitions):
+    """
+    Splits a log into account-disjoint partitions of roughly equal size.
+
+    Whole account groups (see `account_groups`) are assigned to partitions largest first,
+    each to the partition with the fewest operations so far. Every `top_spenders` is
+    sent to every partition, since its result depends on all accounts.
+
+    Args:
+        operations (list[tuple[str, tuple]]): The (op, args) pairs of the log.
+        partitions (int): The number of partitions wanted; fewer are returned when the
+            log has fewer account groups.
+
+    Returns:
+        tuple[list[int | None], list[list[int]]]: For each operation the partition it
+        belongs to, None for `top_spenders`, and for each partition the positions of its
+        operations in the log, in order.
+
+    Raises:
+        ValueError: If an operation is not a `BankingSystem` method with the right
+        number of arguments, or `partitions` is less than 1.
+    """
+    if partitions < 1:
+        raise ValueError(f"partitions must be at least 1, got {partitions}")
+    for position, (op, args) in enumerate(operations):
+        if batch_operations.get(op) != len(args):
+            raise ValueError(f"operation {position}: invalid operation {op!r} with arguments {list(args)!r}")
+
+    groups = account_groups(operations)
+    sizes = {}
+    for op, args in operations:
+        if op != "top_spenders":
+            root = groups[args[1]]
+            sizes[root] = sizes.get(root, 0) + 1
+
+    loads = [(0, index) for index in range(min(partitions, len(sizes)) or 1)]
+    assignment = {}
+    for root in sorted(sizes, key=lambda root: (-sizes[root], root)):
+        load, index = heapq.heappop(loads)
+        assignment[root] = index
+        heapq.heappush(loads, (load + sizes[root], index))
+
+    owners = []
+    positions = [[] for _ in loads]
+    for position, (op, args) in enumerate(operations):
+        if op == "top_spenders":
+            owners.append(None)
+            for partition in positions:
+                partition.append(position)
+        else:
+            owner = assignment[groups[args[1]]]
+            owners.append(owner)
+            positions[owner].append(position)
+    return owners, positions
+
+
+def replay_partition(engine, options, operations, chunk_size=10_000):
+    """
+    Replays one partition into a new banking system; run in a worker process.
+
+    Payment numbers in the results are local to the partition. A `get_payment_status`
+    cannot be answered here, since the payment it names is numbered across all
+    partitions, so its result is instead every payment of this partition the account
+    could have been asked about at that point, as {local payment number: status}.
+    Candidates are the payments made by the account and by the accounts merged into it;
+    the banking system decides the status of each.
+
+    Args:
+        engine (str): The storage engine passed to `create_banking_system`.
+        options (dict): Passed on to the engine's constructor.
+        operations (list[tuple[str, tuple]]): The partition's (op, args) pairs, in order.
+        chunk_size (int): The number of operations applied per batch.
+
+    Returns:
+        list: The result of each operation, in order.
+    """
+    system = create_banking_system(engine, **options)
+    candidates = {}
+    results = []
+
+    def track(chunk, outcomes):
+        for (op, args), result in zip(chunk, outcomes):
+            if op == "pay" and result is not None:
+                candidates.setdefault(args[1], set()).add(parse_payment(result))
+            elif op == "merge_accounts" and result:
+                # The merged away id is gone: if it is created again it starts without
+                # payments, so its set moves to the survivor instead of being shared.
+                absorbed = candidates.pop(args[2], set())
+                survivor = candidates.setdefault(args[1], set())
+                if len(survivor) < len(absorbed):
+                    survivor, absorbed = absorbed, survivor
+                    candidates[args[1]] = survivor
+                survivor |= absorbed
+        results.extend(outcomes)
+
+    def replay_pending(pending):
+        outcomes = [result for _, result in apply_operations(system, pending, chunk_size)]
+        track(pending, outcomes)
+
+    pending = []
+    for op, args in operations:
+        if op != "get_payment_status":
+            pending.append((op, args))
+            continue
+        replay_pending(pending)
+        pending = []
+        timestamp, account_id, _ = args
+        statuses = {}
+        for number in sorted(candidates.get(account_id, ())):
+            status = system.get_payment_status(timestamp, account_id, format_payment(number))
+            if status is not None:
+                statuses[number] = status
+        results.append(statuses)
+    replay_pending(pending)
+
+    disconnect = getattr(system, "disconnect", None)
+    if disconnect is not None:
+        disconnect()
+    return results
+
+
+def partition_options(engine, options, index):
+    """
+    Returns the engine options for partition `index`: each partition gets its own
+    database, under `shard_path(db_path, index)` if a `db_path` was given and in memory
+    otherwise.
+    """
+    options = dict(options)
+    if "db_path" in options:
+        options["db_path"] = shard_path(options["db_path"], index)
+    elif engine != "memory":
+        options["db_path"] = ":memory:"
+    return options
+
+
+def parallel_replay(operations, workers, engine="sqlite", chunk_size=10_000, **options):
+    """
+    Replays an operation log over `workers` processes, each running its own banking
+    system on an account-disjoint partition of the log.
+
+    Args:
+        operations (list[tuple[str, tuple]]): The (op, args) pairs of the log.
+        workers (int): The number of partitions and worker processes.
+        engine (str): The storage engine passed to `create_banking_system`.
+        chunk_size (int): The number of operations applied per batch.
+        **options: Passed on to each partition's engine, see `partition_options`.
+
+    Returns:
+        list: The result of each operation, in order, identical to replaying the log
+        into a single banking system.
+
+    Raises:
+        ValueError: If an operation is not a `BankingSystem` method with the right
+        number of arguments, or `workers` is less than 1.
+    """
+    operations = list(operations)
+    owners, positions = partition_operations(operations, workers)
+    with ProcessPoolExecutor(max_workers=len(positions)) as executor:
+        futures = [
+            executor.submit(
+                replay_partition,
+                engine,
+                partition_options(engine, options, index),
+                [operations[position] for position in partition],
+                chunk_size,
+            )
+            for index, partition in enumerate(positions)
+        ]
+        outputs = [iter(future.result()) for future in futures]
+
+    payments = []
+    results = []
+    for (op, args), owner in zip(operations, owners):
+        if op == "top_spenders":
+            rankings = []
+            for output in outputs:
+                ranking = []
+                for entry in next(output):
+                    account_id, _, total = entry.rpartition("(")
+                    ranking.append((account_id, int(total[:-1])))
+                rankings.append(ranking)
+            ranked = heapq.merge(*rankings, key=lambda pair: (-pair[1], pair[0]))
+            results.append([f"{account_id}({total})" for account_id, total in itertools.islice(ranked, args[1])])
+            continue
+
+        result = next(outputs[owner])
+        if op == "pay" and result is not None:
+            payments.append((owner, parse_payment(result)))
+            result = format_payment(len(payments))
+        elif op == "get_payment_status":
+            number = parse_payment(args[2])
+            if number is None or not 0 < number <= len(payments):
+                result = None
+            else:
+                partition, local = payments[number - 1]
+                result = result.get(local) if partition == owner else None
+        results.append(result)
+    return results
+
+
+def replay(lines, output, engine="sqlite", chunk_size=10_000, workers=1, db_path=None):
+    """
+    Replays an operation log into a new banking system.
+
+    Args:
+        lines (Iterable[str]): The JSONL lines of the operation log.
+        output (TextIO): Where the JSONL results are written.
+        engine (str): The storage engine passed to `create_banking_system`.
+        chunk_size (int): The number of operations applied per batch.
+        workers (int): With more than 1, the whole log is read and replayed by
+            `parallel_replay` over this many processes.
+        db_path (str | None): Where the engine keeps its data, replacing whatever is there,
+            or None for a temporary directory removed once the replay is done; ignored by
+            the memory engine.
+
+    Returns:
+        tuple[int, float]: The number of operations replayed and the seconds it took.
+    """
+    if engine == "memory":
+        return replay_into(lines, output, engine, chunk_size, workers, {})
+    if db_path is not None:
+        return replay_into(lines, output, engine, chunk_size, workers, engine_options(engine, db_path))
+    with tempfile.TemporaryDirectory() as directory:
+        options = engine_options(engine, os.path.join(directory, "replay.db"))
+        return replay_into(lines, output, engine, chunk_size, workers, options)
+
+
+def engine_options(engine, db_path):
+    """
+    Returns the `create_banking_system` options of a replay into `db_path`, bounding the
+    balance index of the SQLite engines.
+    """
+    if engine == "journaled":
+        return {"db_path": db_path}
+    return {"db_path": db_path, "balance_index_size": BALANCE_INDEX_SIZE}
+
+
+def replay_into(lines, output, engine, chunk_size, workers, options):
+    """
+    Body of `replay` once the engine's options are known.
+    """
+    if workers > 1:
+        start = time.perf_counter()
+        operations = list(read_operations(lines))
+        results = parallel_replay(operations, workers, engine, chunk_size, **options)
+        count = write_results(zip((op for op, _ in operations), results), output)
+        return count, time.perf_counter() - start
+
+    system = create_banking_system(engine, **options)
+    start = time.perf_counter()
+    try:
+        count = write_results(apply_operations(system, read_operations(lines), chunk_size), output)
+    finally:
+        if hasattr(system, "disconnect"):
+            system.disconnect()
+    return count, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("log", help="JSONL operation log, or - for stdin")
+    parser.add_argument("--output", default="-", help="where to write the JSONL results, - for stdout")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="sqlite")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=1, help="replay in parallel over this many processes")
+    parser.add_argument("--db-path", help="database file to replay into, replacing it; a temporary file by default")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.log == "-" else open(args.log, encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        count, seconds = replay(source, output, args.engine, args.chunk_size, args.workers, args.db_path)
+    except ValueError as error:
+        parser.exit(1, f"{parser.prog}: {error}\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    rate = count / seconds if seconds else float("inf")
+    print(f"replayed {count} operations in {seconds:.2f}s ({rate:,.0f} ops/sec)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""
+Hash-sharded storage: accounts spread over several SQLite databases.
+
+Each account lives on the shard picked by the CRC-32 of its id, and every shard is a full
+`BankingSystemImpl` with its own file, connection pool and write lock, so writes to
+different shards commit in parallel instead of queueing on a single writer.
+
+create_account, deposit, pay, get_payment_status and get_balance only touch the shard of
+their account. top_spenders asks every shard and merges the rankings. transfer and
+merge_accounts between accounts on different shards run a local two-phase protocol:
+
+1. Prepare: both shards' write locks are taken, in shard order so that two cross-shard
+   operations can never wait for each other, and a unit of work is opened on each. The
+   operation is checked and applied on both sides while nothing else can write to either.
+2. Commit: the sending shard (the source of a transfer, the merged away account of a
+   merge) commits first. Alongside its own changes it commits an `outbox` row holding
+   everything the receiving shard needs, which is the commit record. The receiving shard
+   then commits its changes together with an `inbox` row naming that message.
+
+If anything fails before the sending shard commits, both sides roll back. If the process
+stops after it, `ShardedBankingSystem.recover` (run whenever the shards are opened) hands
+every outbox row to its receiving shard again, and the inbox makes sure each message is
+applied only once.
+
+SQL Statements Documentation
+
+shard_tables: Creates the shard's identity, outbox and inbox tables.
+drop_shard_tables: Drops the shard's identity, outbox and inbox tables, used when a shard is reset.
+shard_identity: Retrieves which shard of how many a database is.
+record_shard_identity: Records which shard of how many a database is.
+send_message: Adds a message for another shard to the outbox and returns its id.
+pending_messages: Retrieves every message in the outbox, oldest first.
+forget_message: Removes a delivered message from the outbox.
+message_received: Checks whether a message from another shard was already applied.
+receive_message: Records that a message from another shard was applied.
+store_sequence: Sets a named counter in the sequences table.
+owned_outgoing: Retrieves the outgoing transactions of an account, including those of the accounts merged into it.
+drop_transaction: Deletes a transaction handed over to another shard.
+copy_transaction: Records a transaction handed over by another shard, keeping its type code and cashback state.
+"""
+import heapq
+import json
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from itertools import islice
+
+from banking_system import BankingSystem
+from banking_system_impl import CHECKPOINT_INTERVAL, DEFAULT_DB_PATH, BankingSystemImpl, sequence_value, transaction_types
+
+
+shard_tables = """
+CREATE TABLE IF NOT EXISTS shard_identity (
+    shard INT NOT NULL,
+    shards INT NOT NULL
+);
+
+-- AUTOINCREMENT, since the inbox of the receiving shard remembers every txid it applied
+-- and the outbox is emptied after each delivery
+CREATE TABLE IF NOT EXISTS outbox (
+    txid INTEGER PRIMARY KEY AUTOINCREMENT,
+    target INT NOT NULL,
+    payload TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS inbox (
+    source INT,
+    txid INT,
+    PRIMARY KEY (source, txid)
+);
+"""
+
+drop_shard_tables = """
+DROP TABLE IF EXISTS shard_identity;
+DROP TABLE IF EXISTS outbox;
+DROP TABLE IF EXISTS inbox;
+"""
+
+shard_identity = """
+SELECT shard, shards
+FROM shard_identity;
+"""
+
+record_shard_identity = """
+INSERT INTO shard_identity
+VALUES (?, ?);
+"""
+
+send_message = """
+INSERT INTO outbox (target, payload)
+VALUES (?, ?)
+RETURNING txid;
+"""
+
+pending_messages = """
+SELECT txid, target, payload
+FROM outbox
+ORDER BY txid;
+"""
+
+forget_message = """
+DELETE FROM outbox
+WHERE txid=?;
+"""
+
+message_received = """
+SELECT 1
+FROM inbox
+WHERE source=? AND txid=?;
+"""
+
+receive_message = """
+INSERT INTO inbox
+VALUES (?, ?);
+"""
+
+store_sequence = """
+UPDATE sequences
+SET value=?
+WHERE name=?;
+"""
+
+owned_outgoing = """
+WITH RECURSIVE owned(account_key) AS (
+    SELECT MAX(account_key) FROM accounts WHERE account_id=?
+    UNION
+    SELECT A.account_key FROM accounts A JOIN owned O ON A.merged_into = O.account_key
+)
+SELECT rowid, amount, date_of_transaction, type_of_transaction, payment_id, cashback_date, cashback_settled
+FROM transactions
+WHERE account_key IN owned AND amount < 0
+ORDER BY rowid;
+"""
+
+drop_transaction = """
+DELETE FROM transactions
+WHERE rowid=?;
+"""
+
+copy_transaction = """
+INSERT INTO transactions
+VALUES ((SELECT MAX(account_key) FROM accounts WHERE account_id=?), ?, ?, ?, ?, ?, ?);
+"""
+
+
+def shard_path(db_path, index):
+    """
+    Returns where shard `index` of a sharded system at `db_path` keeps its data, e.g.
+    "bank.shard0.db" for "bank.db". Every shard of ":memory:" gets its own private database.
+    """
+    if db_path == ":memory:":
+        return db_path
+    if db_path.startswith("file:"):
+        name, separator, query = db_path.partition("?")
+        return f"{name}.shard{index}{separator}{query}"
+    root, extension = os.path.splitext(db_path)
+    return f"{root}.shard{index}{extension}"
+
+
+class Shard(BankingSystemImpl):
+    """
+    One shard of a `ShardedBankingSystem`: a `BankingSystemImpl` that takes its payment
+    numbers from the sharded system, plus each side of the cross-shard operations and
+    the messages between them.
+
+    Attributes:
+        index (int): The position of the shard in `ShardedBankingSystem.shards`.
+        coordinator (ShardedBankingSystem): The system the shard belongs to.
+    """
+
+    def __init__(self, coordinator, index, shards, db_path, reset=True, **options):
+        """
+        Args:
+            coordinator (ShardedBankingSystem): The system the shard belongs to.
+            index (int): The position of the shard.
+            shards (int): The number of shards in the system.
+            db_path (str): Where the shard keeps its data.
+            reset (bool): Whether to start from an empty database.
+            **options: Passed on to `BankingSystemImpl`.
+
+        Raises:
+            ValueError: If the database belongs to a different shard or a system with a
+            different number of shards.
+        """
+        self.coordinator = coordinator
+        self.index = index
+        super().__init__(db_path, reset=reset, **options)
+        self.connect()
+        if reset:
+            self.cur.executescript(drop_shard_tables)
+        self.cur.executescript(shard_tables)
+        self.close()
+        identity = self.execute_script(shard_identity)
+        if not identity:
+            self.execute_script(record_shard_identity, (index, shards))
+        elif identity[0] != (index, shards):
+            raise ValueError(
+                f"{db_path} is shard {identity[0][0]} of {identity[0][1]}, not shard {index} of {shards}"
+            )
+
+    def next_sequence_value(self, name):
+        """
+        Takes payment numbers from the sharded system, so they are numbered in the order
+        payments are made across every shard, and remembers the latest one used here.
+        A payment rolled back after taking its number leaves a gap in the numbering.
+        """
+        if name != "payment":
+            return super().next_sequence_value(name)
+        value = self.coordinator.next_payment_id()
+        self.execute_script(store_sequence, (value, name))
+        return value
+
+    def sequence(self, name):
+        """
+        Returns the current value of a named counter.
+        """
+        return self.execute_script(sequence_value, (name,))[0][0]
+
+    def debit(self, timestamp, account_id, amount):
+        """
+        The sending side of a cross-shard transfer: takes `amount` from `account_id`,
+        which must have enough money, and records the transfer.
+
+        Returns:
+            int: The new balance of `account_id`.
+        """
+        with self.transaction():
+            balance = self.get_account_balance(account_id) - amount
+            self.update_account_balance(balance, timestamp, account_id)
+            self.record_balance(account_id, balance, timestamp, None)
+            self.record_transaction(account_id, -amount, timestamp, "transfer")
+            if self._leaderboard is not None:
+                self._leaderboard.add_outgoing(account_id, amount)
+            return balance
+
+    def credit(self, timestamp, account_id, amount):
+        """
+        The receiving side of a cross-shard transfer: adds `amount` to `account_id`.
+        """
+        with self.transaction():
+            balance = self.get_account_balance(account_id) + amount
+            self.update_account_balance(balance, timestamp, account_id)
+            self.record_balance(account_id, balance, timestamp, None)
+
+    def release(self, timestamp, account_id):
+        """
+        The sending side of a cross-shard merge: deletes `account_id` and moves out its
+        balance and outgoing transactions, including those of accounts merged into it
+        earlier. The receiving shard reports and refunds its payments from now on, so a
+        later merge can move them back here without clashing with the old rows.
+
+        Returns:
+            tuple[int, list]: The balance and the outgoing transaction rows of `account_id`.
+        """
+        with self.transaction():
+            balance = self.get_account_balance(account_id)
+            rows = []
+            for rowid, *row in self.execute_script(owned_outgoing, (account_id,)):
+                self.execute_script(drop_transaction, (rowid,))
+                rows.append(row)
+            self.delete_account(account_id)
+            # A NULL balance marks account_id as not existing from the merge on
+            self.record_balance(account_id, None, timestamp, timestamp)
+            if self._leaderboard is not None:
+                self._leaderboard.remove_account(account_id)
+            return balance, rows
+
+    def absorb(self, timestamp, account_id, balance, rows):
+        """
+        The receiving side of a cross-shard merge: adds the merged away account's
+        balance and outgoing transactions to `account_id`.
+        """
+        with self.transaction():
+            merged = self.get_account_balance(account_id) + balance
+            self.update_account_balance(merged, timestamp, account_id)
+            self.record_balance(account_id, merged, timestamp, None)
+            outgoing = 0
+            for amount, date, type_of_transaction, payment_id, cashback_date, settled in rows:
+                self.execute_script(
+                    copy_transaction, (account_id, amount, date, type_of_transaction, payment_id, cashback_date, settled)
+                )
+                outgoing -= amount
+                if type_of_transaction == transaction_types["payment"] and not settled:
+                    if self._cashback_queue is not None:
+                        self._cashback_queue.push(cashback_date, payment_id, payment_id)
+            if self._leaderboard is not None:
+                self._leaderboard.add_outgoing(account_id, outgoing)
+
+    def send(self, target, payload):
+        """
+        Adds a message for shard `target` to the outbox, as part of the current unit of work.
+
+        Returns:
+            int: The id of the message.
+        """
+        return self.execute_script(send_message, (target, json.dumps(payload)))[0][0]
+
+    def receive(self, source, txid, payload):
+        """
+        Applies message `txid` from shard `source` unless it was applied already.
+        `payload` names the method to call ("credit" or "absorb") and its arguments.
+        """
+        with self.transaction():
+            if self.execute_script(message_received, (source, txid)):
+                return
+            self.execute_script(receive_message, (source, txid))
+            arguments = dict(payload)
+            getattr(self, arguments.pop("op"))(**arguments)
+
+    def forget(self, txid):
+        """
+        Removes a message from the outbox once its receiving shard has committed it.
+        """
+        self.execute_script(forget_message, (txid,))
+
+
+class ShardedBankingSystem(BankingSystem):
+    """
+    A banking system whose accounts are partitioned over `shards` SQLite databases by
+    the hash of their account id.
+
+    Attributes:
+        shards (list[Shard]): The shards, indexed by `shard_of`.
+        payment_count (int): The number of the latest payment made on any shard.
+    """
+
+    def __init__(self, shards=4, db_path=DEFAULT_DB_PATH, reset=True, **options):
+        """
+        Args:
+            shards (int): The number of databases to spread the accounts over.
+            db_path (str): Where to keep the data; shard i uses `shard_path(db_path, i)`.
+            reset (bool): Whether to start from empty databases, deleting any existing ones.
+            **options: Passed on to every shard's `BankingSystemImpl`, e.g. durability.
+
+        Raises:
+            ValueError: If `reset` is False and the existing databases were written with a
+            different number of shards.
+        """
+        self._payments = threading.Lock()
+        self.payment_count = 0
+        self.shards = [
+            Shard(self, index, shards, shard_path(db_path, index), reset=reset, **options)
+            for index in range(shards)
+        ]
+        self.payment_count = max(shard.sequence("payment") for shard in self.shards)
+        self.recover()
+
+    def shard_of(self, account_id):
+        """
+        Returns the shard that owns `account_id`.
+        """
+        return self.shards[zlib.crc32(account_id.encode()) % len(self.shards)]
+
+    def next_payment_id(self):
+        """
+        Returns the number of a new payment.
+        """
+        with self._payments:
+            self.payment_count += 1
+            return self.payment_count
+
+    def recover(self):
+        """
+        Delivers every cross-shard message whose sending shard committed but whose
+        receiving shard may not have, e.g. because the process stopped in between.
+
+        Returns:
+            int: The number of messages delivered.
+        """
+        delivered = 0
+        for source in self.shards:
+            for txid, target, payload in source.execute_script(pending_messages):
+                self.shards[target].receive(source.index, txid, json.loads(payload))
+                source.forget(txid)
+                delivered += 1
+        return delivered
+
+    @contextmanager
+    def two_phase(self, sender, receiver):
+        """
+        Runs the block as the prepare phase of an operation on two shards.
+
+        Both write locks are taken in shard order and a unit of work is opened on each.
+        When the block ends the sender commits first, then the receiver; if the block
+        raises, both roll back.
+        """
+        first, second = sorted((sender, receiver), key=lambda shard: shard.index)
+        first._acquire(first.lock.acquire_write)
+        try:
+            second._acquire(second.lock.acquire_write)
+            try:
+                with receiver.transaction(), sender.transaction():
+                    yield
+            finally:
+                second.lock.release_write()
+        finally:
+            first.lock.release_write()
+
+    def deliver(self, sender, receiver, payload):
+        """
+        Queues a message in the sender's outbox and applies it on the receiver, both
+        inside the units of work opened by `two_phase`.
+
+        Returns:
+            int: The id of the message, to `forget` once both shards have committed.
+        """
+        txid = sender.send(receiver.index, payload)
+        receiver.receive(sender.index, txid, payload)
+        return txid
+
+    def create_account(self, timestamp, account_id):
+        return self.shard_of(account_id).create_account(timestamp, account_id)
+
+    def deposit(self, timestamp, account_id, amount):
+        return self.shard_of(account_id).deposit(timestamp, account_id, amount)
+
+    def pay(self, timestamp, account_id, amount):
+        return self.shard_of(account_id).pay(timestamp, account_id, amount)
+
+    def get_payment_status(self, timestamp, account_id, payment):
+        return self.shard_of(account_id).get_payment_status(timestamp, account_id, payment)
+
+    def get_balance(self, timestamp, account_id, time_at):
+        return self.shard_of(account_id).get_balance(timestamp, account_id, time_at)
+
+    def top_spenders(self, timestamp, n):
+        """
+        Merges the top `n` spenders of every shard, highest total first and ties broken by
+        account id as on a single database.
+        """
+        rankings = []
+        for shard in self.shards:
+            shard.settle_cashbacks(timestamp)
+            with shard.reading():
+                rankings.append(shard.leaderboard.top(n))
+        ranked = heapq.merge(*rankings, key=lambda pair: (-pair[1], pair[0]))
+        return [f"{account_id}({int(total)})" for account_id, total in islice(ranked, n)]
+
+    def transfer(self, timestamp, source_account_id, target_account_id, amount):
+        """
+        Transfers between accounts on one shard with that shard's `transfer`, and between
+        accounts on different shards with the two-phase protocol.
+        """
+        source, target = self.shard_of(source_account_id), self.shard_of(target_account_id)
+        if source is target:
+            return source.transfer(timestamp, source_account_id, target_account_id, amount)
+
+        with self.two_phase(source, target):
+            source.settle_cashbacks(timestamp)
+            target.settle_cashbacks(timestamp)
+            source_balance = source.get_account_balance(source_account_id)
+            if source_balance is None or target.get_account_balance(target_account_id) is None:
+                return None
+            if source_balance < amount:
+                return None
+            balance = source.debit(timestamp, source_account_id, amount)
+            txid = self.deliver(
+                source, target,
+                {"op": "credit", "timestamp": timestamp, "account_id": target_account_id, "amount": amount},
+            )
+        source.forget(txid)
+        return balance
+
+    def merge_accounts(self, timestamp, account_id_1, account_id_2):
+        """
+        Merges accounts on one shard with that shard's `merge_accounts`. Across shards
+        the merged away account's balance and outgoing transactions move to the shard of
+        `account_id_1` with the two-phase protocol, so its payments keep being refunded
+        to, and reported for, the surviving account.
+        """
+        keep, absorbed = self.shard_of(account_id_1), self.shard_of(account_id_2)
+        if keep is absorbed:
+            return keep.merge_accounts(timestamp, account_id_1, account_id_2)
+
+        with self.two_phase(absorbed, keep):
+            keep.settle_cashbacks(timestamp)
+            absorbed.settle_cashbacks(timestamp)
+            if keep.get_account_balance(account_id_1) is None or absorbed.get_account_balance(account_id_2) is None:
+                return False
+            balance, rows = absorbed.release(timestamp, account_id_2)
+            txid = self.deliver(
+                absorbed, keep,
+                {"op": "absorb", "timestamp": timestamp, "account_id": account_id_1, "balance": balance, "rows": rows},
+            )
+        absorbed.forget(txid)
+        return True
+
+    def compact_balance_history(self, timestamp, horizon, granularity=CHECKPOINT_INTERVAL, batch_size=500):
+        """
+        Compacts the balance history of every shard in turn, see
+        `BankingSystemImpl.compact_balance_history`, yielding the totals over all shards
+        after each batch.
+        """
+        done = {"accounts": 0, "rows_removed": 0, "pages_reclaimed": 0, "pages_released": 0}
+        for shard in self.shards:
+            report = dict.fromkeys(done, 0)
+            for report in shard.compact_balance_history(timestamp, horizon, granularity, batch_size):
+                yield {name: total + report[name] for name, total in done.items()}
+            done = {name: total + report[name] for name, total in done.items()}
+
+    def disconnect(self):
+        """
+        Closes every shard's connections.
+        """
+        for shard in self.shards:
+            shard.disconnect()
@@ -0,0 +1,14 @@
+"""
+Benchmarks for the banking system.
+
+Each module can be run from the repository root, e.g.:
+
+    python -m benchmarks.index_lookups
+    python -m benchmarks.scaling --accounts 1000 10000 --output results.json
+    python -m benchmarks.concurrency --threads 1 2 4 8 16 32
+    python -m benchmarks.statement_cache --lookups 100000
+    python -m benchmarks.sharding --shards 1 2 4 8 --threads 8
+    python -m benchmarks.parallel_replay --workers 1 2 4 8
+    python -m benchmarks.journal_recovery --operations 1000000 10000000
+    python -m benchmarks.history_compaction --days 90 --horizon 7
+"""
@@ -0,0 +1,68 @@
+"""
+Throughput of one BankingSystemImpl shared by a growing number of threads.
+
+Each thread replays its own slice of a deposit/transfer/get_balance/top_spenders mix
+against a common set of accounts. Writes are serialized (SQLite allows one writer at a
+time), so the interesting numbers are how little throughput is lost as threads are
+added and how reads keep going alongside the writes.
+
+Usage:
+    python -m benchmarks.concurrency --threads 1 2 4 8 16 32
+"""
+import argparse
+import threading
+import time
+
+from banking_system_impl import BankingSystemImpl, durability_profiles
+from benchmarks.workload import operation_mix, parse_mix, setup_stream
+
+DEFAULT_MIX = "deposit=30,transfer=30,get_balance=35,top_spenders=5"
+
+
+def run(threads, accounts, operations, mix, durability):
+    """
+    Splits `operations` calls over `threads` threads and returns the ops/sec achieved.
+    """
+    system = BankingSystemImpl(durability=durability)
+    system.connections.pool_size = max(system.connections.pool_size, threads)
+    system.apply_batch(setup_stream(accounts))
+    per_thread = operations // threads
+    streams = [list(operation_mix(accounts, per_thread, mix, seed=seed)) for seed in range(threads)]
+    ready = threading.Barrier(threads + 1)
+
+    def worker(stream):
+        ready.wait()
+        for method, args in stream:
+            getattr(system, method)(*args)
+
+    workers = [threading.Thread(target=worker, args=(stream,)) for stream in streams]
+    for thread in workers:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - start
+    system.disconnect()
+    return per_thread * threads / seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--accounts", type=int, default=1_000)
+    parser.add_argument("--operations", type=int, default=6_400)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--durability", choices=sorted(durability_profiles), default="balanced")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    print(f"{'threads':>7} {'ops/sec':>10} {'vs 1 thread':>12}")
+    for threads in args.threads:
+        rate = run(threads, args.accounts, args.operations, args.mix, args.durability)
+        baseline = baseline or rate
+        print(f"{threads:>7} {rate:>10,.0f} {rate / baseline:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Replays the same random operation stream through the SQLite and in-memory engines.
+
+The results of the two engines are compared before the timings are printed, and any
+operation they answer differently is reported with a non-zero exit status.
+
+Usage:
+    python -m benchmarks.engine_comparison --accounts 200 --operations 5000
+"""
+import argparse
+import sys
+import time
+
+from banking_system_impl import create_banking_system
+from benchmarks.workload import operation_mix, setup_stream
+
+
+def operation_stream(accounts, operations, seed=0):
+    """
+    Builds a list of (method name, args) tuples: account creation followed by the
+    default operation mix of `benchmarks.workload`.
+    """
+    return list(setup_stream(accounts)) + list(operation_mix(accounts, operations, seed=seed))
+
+
+def replay(engine, stream):
+    """
+    Runs the stream through a fresh system and returns (seconds, results).
+    """
+    system = create_banking_system(engine)
+    start = time.perf_counter()
+    results = [getattr(system, method)(*args) for method, args in stream]
+    return time.perf_counter() - start, results
+
+
+def mismatches(stream, first, second):
+    """
+    Returns (position, method name, args, first result, second result) for every
+    operation of the stream whose two results differ.
+    """
+    return [
+        (position, method, args, a, b)
+        for position, ((method, args), a, b) in enumerate(zip(stream, first, second))
+        if a != b
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--operations", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    stream = operation_stream(args.accounts, args.operations, args.seed)
+    sqlite_seconds, sqlite_results = replay("sqlite", stream)
+    memory_seconds, memory_results = replay("memory", stream)
+    differences = mismatches(stream, sqlite_results, memory_results)
+    for position, method, args, sqlite_result, memory_result in differences[:10]:
+        print(f"#{position} {method}{args}: sqlite {sqlite_result!r}, memory {memory_result!r}")
+    if differences:
+        sys.exit(f"{len(differences)} of {len(stream)} results differ between the engines")
+    print(f"{len(stream)} operations")
+    print(f"sqlite: {sqlite_seconds:.3f}s ({len(stream) / sqlite_seconds:,.0f} ops/s)")
+    print(f"memory: {memory_seconds:.3f}s ({len(stream) / memory_seconds:,.0f} ops/s)")
+    print(f"speedup: {sqlite_seconds / memory_seconds:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
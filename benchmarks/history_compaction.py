@@ -0,0 +1,76 @@
+"""
+Size of the balance history and cold `get_balance` cost before and after compaction.
+
+A database is filled with a workload spread over `--days` days, then its balance history
+older than `--horizon` days is collapsed to one checkpoint per account and `--granularity`
+hours with `BankingSystemImpl.compact_balance_history`. Cold reads drop the balance
+index first, so every account's history is read back from the table, as after a restart.
+
+Usage:
+    python -m benchmarks.history_compaction --accounts 1000 --operations 200000 --days 90
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from banking_system_impl import BankingSystemImpl
+from benchmarks.workload import DAY, operation_mix, setup_stream
+
+HOUR = DAY // 24
+
+
+def cold_reads(system, accounts, timestamp):
+    """
+    Reads every account's balance at `timestamp` with an empty balance index and returns
+    the seconds it took.
+    """
+    system.discard_caches()
+    start = time.perf_counter()
+    for i in range(1, accounts + 1):
+        system.get_balance(timestamp, f"account{i}", timestamp // 2)
+    return time.perf_counter() - start
+
+
+def describe(label, system, accounts, timestamp):
+    rows = system.execute_script("SELECT COUNT(*) FROM balance_history")[0][0]
+    pages, free_pages = system.page_usage()
+    seconds = cold_reads(system, accounts, timestamp)
+    print(f"{label:>8} {rows:>12,} {pages:>8,} {free_pages:>6,} {seconds * 1000:>11.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1_000)
+    parser.add_argument("--operations", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--horizon", type=int, default=7, help="days of full history to keep")
+    parser.add_argument("--granularity", type=int, default=24, help="hours per checkpoint")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    max_gap = 2 * args.days * DAY // args.operations
+    stream = list(setup_stream(args.accounts))
+    stream += operation_mix(args.accounts, args.operations, max_gap=max_gap)
+    now = stream[-1][1][0]
+    with tempfile.TemporaryDirectory() as directory:
+        system = BankingSystemImpl(os.path.join(directory, "bank.db"), durability="throughput")
+        system.apply_batch(stream)
+        print(f"{'':>8} {'history rows':>12} {'pages':>8} {'free':>6} {'cold ms':>11}")
+        describe("before", system, args.accounts, now)
+
+        start = time.perf_counter()
+        report = {}
+        for report in system.compact_balance_history(now, args.horizon * DAY, args.granularity * HOUR,
+                                                     args.batch_size):
+            pass
+        seconds = time.perf_counter() - start
+        describe("after", system, args.accounts, now)
+        print(f"compacted {report.get('accounts', 0):,} accounts in {seconds:.2f}s: "
+              f"{report.get('rows_removed', 0):,} rows removed, {report.get('pages_reclaimed', 0):,} pages "
+              f"reclaimed, {report.get('pages_released', 0):,} released to the file system")
+        system.disconnect()
+
+
+if __name__ == "__main__":
+    main()
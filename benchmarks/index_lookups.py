@@ -0,0 +1,157 @@
+"""
+Lookup cost before and after the schema migration that adds primary keys and indexes.
+
+A version 0 database (heap tables, no keys) is filled with `rows` transactions and
+balance_history rows, the hot-path lookups are timed, the database is migrated with
+`Query.migrate_schema` and the same lookups are timed again. With the indexes in place the
+per-lookup cost stays roughly flat as the table grows (O(log n)) instead of growing linearly.
+
+Usage:
+    python -m benchmarks.index_lookups --rows 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from banking_system_impl import Query
+
+
+legacy_tables = """
+CREATE TABLE user_data (
+    account_id VARCHAR(255),
+    create_date TIMESTAMP,
+    active BOOLEAN DEFAULT True,
+    merge_id VARCHAR(255),
+    merge_date TIMESTAMP,
+    account_balance INT DEFAULT 0
+);
+CREATE TABLE balances (account_id VARCHAR(255), amount INT, account_date TIMESTAMP);
+CREATE TABLE transactions (
+    account_id VARCHAR(255),
+    amount INT,
+    date_of_transaction TIMESTAMP,
+    type_of_transaction VARCHAR(255),
+    payment_number VARCHAR(255),
+    cashback_date TIMESTAMP
+);
+CREATE TABLE balance_history (account_id VARCHAR(255), amount INT, balance_date TIMESTAMP, merge_date TIMESTAMP);
+"""
+
+cashbacks_due = """
+SELECT SUM(amount) FROM transactions
+WHERE account_id=? AND type_of_transaction='payment' AND cashback_date <= ?;
+"""
+
+balance_at = """
+SELECT MAX(balance_date), amount FROM balance_history
+WHERE account_id=? AND balance_date <= ?;
+"""
+
+# The same lookups once the migration has moved the logs to integer account keys.
+cashbacks_due_keyed = """
+SELECT SUM(amount) FROM transactions
+WHERE account_key=(SELECT account_key FROM accounts WHERE account_id=?)
+AND type_of_transaction=3 AND cashback_date <= ?;
+"""
+
+balance_at_keyed = """
+SELECT MAX(balance_date), amount FROM balance_history
+WHERE account_key=(SELECT account_key FROM accounts WHERE account_id=?) AND balance_date <= ?;
+"""
+
+
+def build_legacy_database(path, rows, rows_per_account=10):
+    """
+    Creates a version 0 database holding `rows` transactions and `rows` balance_history rows.
+
+    Returns:
+        list[str]: The account ids that were created.
+    """
+    accounts = [f"account{i}" for i in range(max(1, rows // rows_per_account))]
+    query = Query(path)
+    query.cur.executescript(legacy_tables)
+    with query.transaction():
+        query.cur.executemany(
+            "INSERT INTO user_data VALUES (?, 0, 1, 1, 1, 1)",
+            ((account_id,) for account_id in accounts),
+        )
+        query.cur.executemany(
+            "INSERT INTO balances VALUES (?, ?, 0)",
+            ((account_id, 1000) for account_id in accounts),
+        )
+        query.cur.executemany(
+            "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (accounts[i % len(accounts)], -10, i, "payment", f"payment{i + 1}", i + 86400000)
+                if i % 3 == 0 else
+                (accounts[i % len(accounts)], 10, i, "deposit", None, None)
+                for i in range(rows)
+            ),
+        )
+        query.cur.executemany(
+            "INSERT INTO balance_history VALUES (?, ?, ?, NULL)",
+            ((accounts[i % len(accounts)], i, i) for i in range(rows)),
+        )
+    return accounts
+
+
+def time_lookups(query, accounts, rows, lookups):
+    """
+    Times the lookups issued by deposit/transfer/pay/get_balance.
+
+    Returns:
+        dict: Mean microseconds per call for each lookup.
+    """
+    sample = [random.choice(accounts) for _ in range(lookups)]
+    if query.schema_version() == 0:
+        cashbacks, balance = cashbacks_due, balance_at
+    else:
+        cashbacks, balance = cashbacks_due_keyed, balance_at_keyed
+    cases = {
+        "check_if_value_exists": lambda account_id: query.check_if_value_exists("user_data", "account_id", account_id),
+        "get_account_balance": query.get_account_balance,
+        "cashbacks_due": lambda account_id: query.cur.execute(cashbacks, (account_id, rows)).fetchone(),
+        "balance_at": lambda account_id: query.cur.execute(balance, (account_id, rows // 2)).fetchone(),
+    }
+    results = {}
+    for name, lookup in cases.items():
+        start = time.perf_counter()
+        for account_id in sample:
+            lookup(account_id)
+        results[name] = (time.perf_counter() - start) / lookups * 1e6
+    return results
+
+
+def run(rows, lookups):
+    """
+    Builds, measures, migrates and re-measures one database of the given size.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index_lookups.db")
+        accounts = build_legacy_database(path, rows)
+        query = Query(path)
+        # Heap scans get expensive quickly, so keep the unindexed sample small.
+        before = time_lookups(query, accounts, rows, max(5, min(lookups, 10_000_000 // rows)))
+        query.migrate_schema()
+        after = time_lookups(query, accounts, rows, lookups)
+        query.disconnect()
+    return before, after
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=2_000)
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>10} {'lookup':>22} {'heap (us)':>12} {'indexed (us)':>13}")
+    for rows in args.rows:
+        before, after = run(rows, args.lookups)
+        for name in before:
+            print(f"{rows:>10} {name:>22} {before[name]:>12.1f} {after[name]:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
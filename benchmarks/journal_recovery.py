@@ -0,0 +1,86 @@
+"""
+Write throughput and recovery time of the journaled engine for long histories.
+
+For each history length a `JournaledBankingSystem` is built twice from the same stream:
+once with the whole history in its journal, and once with a snapshot taken so that only
+the last `--tail` fraction of the history is left in the journal. Each is then reopened
+with `reset=False`, which replays the full journal in the first case and loads the
+snapshot before replaying the tail in the second.
+
+Usage:
+    python -m benchmarks.journal_recovery --operations 1000000 10000000 --tail 0.05
+"""
+import argparse
+import os
+import tempfile
+import time
+from itertools import chain, islice
+
+from banking_system_journal import JournaledBankingSystem
+from benchmarks.workload import operation_mix, parse_mix, setup_stream
+
+DEFAULT_MIX = "deposit=40,transfer=25,pay=20,get_balance=14,merge_accounts=1"
+
+
+def build(path, stream, operations, snapshot_at, sync_every):
+    """
+    Applies the first `operations` calls of `stream` to a new journaled system at `path`,
+    taking a snapshot after `snapshot_at` of them unless it is None, and returns the
+    seconds it took.
+    """
+    system = JournaledBankingSystem(path, sync_every=sync_every, snapshot_every=None)
+    start = time.perf_counter()
+    for position, (method, args) in enumerate(islice(stream, operations)):
+        if position == snapshot_at:
+            system.snapshot()
+        getattr(system, method)(*args)
+    system.disconnect()
+    return time.perf_counter() - start
+
+
+def recover(path):
+    """
+    Reopens the system at `path` and returns (seconds, journal records replayed).
+    """
+    start = time.perf_counter()
+    system = JournaledBankingSystem(path, snapshot_every=None, reset=False)
+    seconds = time.perf_counter() - start
+    system.disconnect()
+    return seconds, system.recovered
+
+
+def size_mb(*paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path)) / 2 ** 20
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--operations", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--tail", type=float, default=0.05, help="fraction of the history after the snapshot")
+    parser.add_argument("--sync-every", type=int, default=1000)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    args = parser.parse_args(argv)
+
+    print(f"{'operations':>11} {'ops/sec':>9} {'journal MB':>11} {'replay all':>11} "
+          f"{'snapshot MB':>12} {'snap+tail':>10} {'tail records':>13}")
+    for operations in args.operations:
+        def stream():
+            return chain(setup_stream(args.accounts), operation_mix(args.accounts, operations, args.mix))
+
+        total = args.accounts + operations
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bank.db")
+            seconds = build(path, stream(), total, None, args.sync_every)
+            journal = size_mb(os.path.join(directory, "bank.0.journal"))
+            replay_seconds, _ = recover(path)
+
+            build(path, stream(), total, int(total * (1 - args.tail)), args.sync_every)
+            snapshot = size_mb(os.path.join(directory, "bank.snapshot"))
+            tail_seconds, tail_records = recover(path)
+        print(f"{total:>11,} {total / seconds:>9,.0f} {journal:>11.1f} {replay_seconds:>10.2f}s "
+              f"{snapshot:>12.1f} {tail_seconds:>9.2f}s {tail_records:>13,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Times a serial replay against a parallel one over a growing number of worker processes.
+
+The parallel runs use `banking_system_replay.parallel_replay`. Accounts joined by a
+transfer or merge have to be replayed by the same worker, so the speedup depends on how
+connected the log is: with uniformly random transfers a few per account are enough to
+put every account in one group. The default mix keeps transfers rare; raise them with
+`--mix` to see the partitions collapse. The share of operations in the largest partition
+is printed next to each timing.
+
+Usage:
+    python -m benchmarks.parallel_replay --workers 1 2 4 8 --engine sqlite
+"""
+import argparse
+import time
+
+from banking_system_impl import ENGINES, create_banking_system
+from banking_system_replay import apply_operations, parallel_replay, partition_operations
+from benchmarks.workload import operation_mix, parse_mix, setup_stream
+
+DEFAULT_MIX = "deposit=45,pay=30,get_balance=20,top_spenders=1,transfer=2,merge_accounts=2"
+
+
+def serial(engine, operations):
+    """
+    Replays `operations` into one in-memory system and returns (seconds, results).
+    """
+    options = {} if engine == "memory" else {"db_path": ":memory:"}
+    system = create_banking_system(engine, **options)
+    start = time.perf_counter()
+    results = [result for _, result in apply_operations(system, operations)]
+    return time.perf_counter() - start, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="sqlite")
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--operations", type=int, default=100_000)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    operations = list(setup_stream(args.accounts))
+    operations += operation_mix(args.accounts, args.operations, args.mix, seed=args.seed)
+    baseline, expected = serial(args.engine, operations)
+    print(f"{'workers':>7} {'seconds':>8} {'speedup':>8} {'largest':>8}")
+    print(f"{'serial':>7} {baseline:>8.2f} {1:>7.2f}x {1:>8.0%}")
+    for workers in args.workers:
+        _, positions = partition_operations(operations, workers)
+        start = time.perf_counter()
+        results = parallel_replay(operations, workers, args.engine)
+        seconds = time.perf_counter() - start
+        if results != expected:
+            raise AssertionError(f"parallel replay over {workers} workers differs from serial replay")
+        largest = max(map(len, positions)) / len(operations)
+        print(f"{workers:>7} {seconds:>8.2f} {baseline / seconds:>7.2f}x {largest:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Measures how the banking system scales with the number of accounts.
+
+For each account count a fresh system is opened with `accounts` create_account calls
+(applied as one batch where the engine supports it, and not timed), then a synthetic
+operation mix from `benchmarks.workload` is replayed one call at a time. Each run reports
+ops/sec, p50/p99 latency per method and the size of the database files. Results can be
+saved as JSON and compared against an earlier run to catch regressions.
+
+Usage:
+    python -m benchmarks.scaling --accounts 1000 10000 100000 1000000 --output results.json
+    python -m benchmarks.scaling --accounts 1000 10000 --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+
+from banking_system_impl import DEFAULT_DB_PATH, ENGINES, create_banking_system, durability_profiles
+from benchmarks.workload import DEFAULT_MIX, TIMESTAMP_GAPS, operation_mix, parse_mix, setup_stream
+
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def database_bytes(system):
+    """
+    Returns the total size of a system's database files (one per shard for the sharded
+    engine) and their journal files, or None for engines that do not keep one.
+    """
+    names = [getattr(shard, "db_name", None) for shard in getattr(system, "shards", [system])]
+    if None in names:
+        return None
+    paths = [name + suffix for name in names for suffix in ("", "-wal", "-journal")]
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def engine_options(engine, db_path, durability):
+    """
+    Returns the `create_banking_system` options of `engine`: the memory engine takes
+    none, the journaled engine only a `db_path`, and the SQLite engines both.
+    """
+    if engine == "memory":
+        return {}
+    if engine == "journaled":
+        return {"db_path": db_path}
+    return {"db_path": db_path, "durability": durability}
+
+
+def run(engine, accounts, operations, mix=None, timestamps="uniform", seed=0, options=None):
+    """
+    Opens `accounts` accounts on a new system and times `operations` calls on it.
+    `options` are passed on to `create_banking_system`.
+
+    Returns:
+        dict: The run's parameters, setup time, ops/sec, per-method latency percentiles
+        in microseconds and database size in bytes.
+    """
+    options = options or {}
+    system = create_banking_system(engine, **options)
+    start = time.perf_counter()
+    if hasattr(system, "apply_batch"):
+        system.apply_batch(setup_stream(accounts))
+    else:
+        for method, args in setup_stream(accounts):
+            getattr(system, method)(*args)
+    setup_seconds = time.perf_counter() - start
+
+    latencies = {}
+    clock = time.perf_counter_ns
+    start = time.perf_counter()
+    for method, args in operation_mix(accounts, operations, mix, timestamps, seed=seed):
+        call = getattr(system, method)
+        began = clock()
+        call(*args)
+        latencies.setdefault(method, []).append(clock() - began)
+    seconds = time.perf_counter() - start
+
+    methods = {}
+    for method, values in sorted(latencies.items()):
+        values.sort()
+        methods[method] = {
+            "count": len(values),
+            "p50_us": percentile(values, 0.50) / 1000,
+            "p99_us": percentile(values, 0.99) / 1000,
+        }
+    result = {
+        "engine": engine,
+        "accounts": accounts,
+        "operations": operations,
+        "options": options,
+        "setup_seconds": setup_seconds,
+        "seconds": seconds,
+        "ops_per_sec": operations / seconds if seconds else None,
+        "methods": methods,
+        "db_bytes": database_bytes(system),
+    }
+    if hasattr(system, "disconnect"):
+        system.disconnect()
+    return result
+
+
+def compare(runs, baseline, tolerance):
+    """
+    Prints the change in throughput and p99 latency against a baseline report.
+
+    Returns:
+        int: The number of runs whose throughput fell by more than `tolerance`.
+    """
+    previous = {(run["engine"], run["accounts"]): run for run in baseline["runs"]}
+    regressions = 0
+    for run in runs:
+        old = previous.get((run["engine"], run["accounts"]))
+        if old is None or not old["ops_per_sec"] or not run["ops_per_sec"]:
+            continue
+        change = run["ops_per_sec"] / old["ops_per_sec"] - 1
+        flag = ""
+        if change < -tolerance:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{run['engine']:>7} {run['accounts']:>9} accounts: {change:+.1%} ops/sec{flag}")
+        for method, stats in run["methods"].items():
+            if method in old["methods"]:
+                p99_change = stats["p99_us"] / old["methods"][method]["p99_us"] - 1
+                print(f"{'':>27} {method:>18} p99 {p99_change:+.1%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(ENGINES), nargs="+", default=["sqlite"])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--operations", type=int, default=10_000)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="comma separated method=weight pairs, e.g. deposit=50,pay=50")
+    parser.add_argument("--timestamps", choices=sorted(TIMESTAMP_GAPS), default="uniform")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--durability", choices=sorted(durability_profiles), default="strict",
+                        help="durability profile of the sqlite and sharded engines")
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH,
+                        help="database of the sqlite, sharded and journaled engines, e.g. :memory: to leave the disk out")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="compare against results saved by an earlier --output")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="fractional ops/sec drop reported as a regression")
+    args = parser.parse_args(argv)
+
+    runs = []
+    print(f"{'engine':>7} {'accounts':>9} {'ops/sec':>10} {'db MB':>8}  p50/p99 us per method")
+    for engine in args.engine:
+        for accounts in args.accounts:
+            options = engine_options(engine, args.db_path, args.durability)
+            result = run(engine, accounts, args.operations, args.mix, args.timestamps, args.seed, options)
+            runs.append(result)
+            size = "-" if result["db_bytes"] is None else f"{result['db_bytes'] / 1e6:.1f}"
+            latency = ", ".join(
+                f"{method} {stats['p50_us']:.0f}/{stats['p99_us']:.0f}" for method, stats in result["methods"].items()
+            )
+            print(f"{engine:>7} {accounts:>9} {result['ops_per_sec']:>10,.0f} {size:>8}  {latency}")
+
+    report = {
+        "benchmark": "scaling",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "operations": args.operations,
+        "mix": args.mix,
+        "timestamps": args.timestamps,
+        "seed": args.seed,
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(runs, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Write throughput of the sharded engine as the number of shards grows.
+
+A fixed number of threads replays a deposit/pay/transfer mix against a
+`ShardedBankingSystem` on disk. Every shard has its own write lock, so writes to
+different shards commit in parallel, while a single shard queues them all behind one
+writer. Transfers between accounts on different shards use the two-phase protocol and
+hold two shards at once, so `--mix` can be used to see what cross-shard traffic costs.
+
+Usage:
+    python -m benchmarks.sharding --shards 1 2 4 8 --threads 8
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from banking_system_impl import durability_profiles
+from banking_system_sharded import ShardedBankingSystem
+from benchmarks.workload import operation_mix, parse_mix, setup_stream
+
+DEFAULT_MIX = "deposit=60,pay=20,transfer=20"
+
+
+def run(shards, threads, accounts, operations, mix, durability):
+    """
+    Splits `operations` calls over `threads` threads on a new system with `shards`
+    shards and returns the ops/sec achieved.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        system = ShardedBankingSystem(shards, os.path.join(directory, "bank.db"), durability=durability,
+                                      pool_size=threads + 1)
+        for shard in system.shards:
+            shard.apply_batch(
+                (method, args) for method, args in setup_stream(accounts) if system.shard_of(args[1]) is shard
+            )
+        per_thread = operations // threads
+        streams = [list(operation_mix(accounts, per_thread, mix, seed=seed)) for seed in range(threads)]
+        ready = threading.Barrier(threads + 1)
+
+        def worker(stream):
+            ready.wait()
+            for method, args in stream:
+                getattr(system, method)(*args)
+
+        workers = [threading.Thread(target=worker, args=(stream,)) for stream in streams]
+        for thread in workers:
+            thread.start()
+        ready.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        seconds = time.perf_counter() - start
+        system.disconnect()
+    return per_thread * threads / seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--accounts", type=int, default=1_000)
+    parser.add_argument("--operations", type=int, default=4_000)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--durability", choices=sorted(durability_profiles), default="strict")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    print(f"{'shards':>6} {'ops/sec':>10} {'vs 1 shard':>11}")
+    for shards in args.shards:
+        rate = run(shards, args.threads, args.accounts, args.operations, args.mix, args.durability)
+        baseline = baseline or rate
+        print(f"{shards:>6} {rate:>10,.0f} {rate / baseline:>10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
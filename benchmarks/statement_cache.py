@@ -0,0 +1,96 @@
+"""
+Cost of parsing SQL on every call versus reusing prepared statements.
+
+Each case looks up the payer and cashback date of a payment `lookups` times on one connection:
+
+    f-string: the values are interpolated into the SQL, so every call has new text to parse.
+    template, cache off: a fixed parameterized template on a connection with `cached_statements=0`.
+    template, cached: the same template served from the connection's prepared statement cache.
+
+The difference between the first two is the cost of building a new string per call; the
+difference between the last two is the parse time the statement cache removes.
+
+Usage:
+    python -m benchmarks.statement_cache --lookups 100000
+"""
+import argparse
+import time
+
+from banking_system_impl import BankingSystemImpl, ConnectionManager, payment_record
+
+
+def build_database(accounts):
+    """
+    Creates an in-memory database with one payment per account.
+
+    Returns:
+        BankingSystemImpl: The filled banking system.
+    """
+    system = BankingSystemImpl(":memory:")
+    for i in range(accounts):
+        system.create_account(i, f"account{i}")
+        system.deposit(i, f"account{i}", 100)
+        system.pay(i, f"account{i}", 10)
+    return system
+
+
+def time_case(lookup, payments):
+    """
+    Returns:
+        float: Mean microseconds per call.
+    """
+    start = time.perf_counter()
+    for payment in payments:
+        lookup(payment)
+    return (time.perf_counter() - start) / len(payments) * 1e6
+
+
+def run(accounts, lookups):
+    """
+    Times the three cases against one database.
+
+    Returns:
+        dict: Mean microseconds per call for each case.
+    """
+    system = build_database(accounts)
+    payments = [i % accounts + 1 for i in range(lookups)]
+    cached = system.cur
+    copy = ConnectionManager(":memory:", cached_statements=0)
+    # A second connection cannot see a private in-memory database, so copy it over.
+    system.conn.backup(copy.connection())
+    uncached = copy.cursor()
+
+    def interpolated(payment):
+        cached.execute(
+            f"SELECT account_key, cashback_date FROM transactions WHERE payment_id={payment};"
+        ).fetchone()
+
+    results = {
+        "f-string": time_case(interpolated, payments),
+        "template, cache off": time_case(
+            lambda payment: uncached.execute(payment_record, (payment,)).fetchone(),
+            payments,
+        ),
+        "template, cached": time_case(
+            lambda payment: cached.execute(payment_record, (payment,)).fetchone(),
+            payments,
+        ),
+    }
+    copy.close_all()
+    system.disconnect()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    print(f"{'case':>20} {'us/call':>9}")
+    for name, mean in run(args.accounts, args.lookups).items():
+        print(f"{name:>20} {mean:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
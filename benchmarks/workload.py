@@ -0,0 +1,121 @@
+"""
+Synthetic operation streams for benchmarking the banking system.
+
+A workload is `accounts` create_account calls followed by `operations` calls drawn from
+a weighted mix of the other `BankingSystem` methods, on accounts picked uniformly at
+random. The gap between consecutive timestamps follows one of `TIMESTAMP_GAPS`:
+
+    uniform: evenly spread gaps of up to `max_gap` milliseconds.
+    poisson: exponentially distributed gaps averaging `max_gap / 2`, as for
+             independent arrivals.
+    bursty:  mostly 1 millisecond gaps with an occasional idle period of up to a day,
+             so cashbacks fall due in large groups.
+"""
+import random
+
+DAY = 86400000
+
+DEFAULT_MIX = {
+    "deposit": 35,
+    "transfer": 25,
+    "pay": 20,
+    "get_balance": 17,
+    "top_spenders": 2,
+    "merge_accounts": 1,
+    "get_payment_status": 0,
+}
+
+
+def uniform_gaps(rng, max_gap):
+    while True:
+        yield rng.randint(1, max_gap)
+
+
+def poisson_gaps(rng, max_gap):
+    while True:
+        yield 1 + int(rng.expovariate(2 / max_gap))
+
+
+def bursty_gaps(rng, max_gap):
+    while True:
+        yield rng.randint(1, DAY) if rng.random() < 0.001 else 1
+
+
+TIMESTAMP_GAPS = {
+    "uniform": uniform_gaps,
+    "poisson": poisson_gaps,
+    "bursty": bursty_gaps,
+}
+
+
+def parse_mix(text):
+    """
+    Parses a mix such as "deposit=50,pay=50" into a {method: weight} dict.
+    """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"unknown operation {name.strip()!r}, expected one of {sorted(DEFAULT_MIX)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def account_ids(accounts):
+    """
+    Returns the ids of the accounts a workload creates.
+    """
+    return [f"account{i}" for i in range(accounts)]
+
+
+def setup_stream(accounts):
+    """
+    Yields the create_account calls that open every account of a workload, at timestamps
+    1 to `accounts`.
+    """
+    for timestamp, account_id in enumerate(account_ids(accounts), 1):
+        yield "create_account", (timestamp, account_id)
+
+
+def operation_mix(accounts, operations, mix=None, timestamps="uniform", max_gap=100_000, seed=0):
+    """
+    Yields `operations` (method name, args) tuples drawn from `mix`, after timestamp
+    `accounts`.
+
+    Args:
+        accounts (int): The number of accounts the operations pick from.
+        operations (int): The number of operations to generate.
+        mix (dict[str, float] | None): The relative weight of each method, DEFAULT_MIX if None.
+        timestamps (str): The name of the timestamp gap distribution in TIMESTAMP_GAPS.
+        max_gap (int): The scale of the timestamp gaps, in milliseconds.
+        seed (int): The random seed; the same arguments always give the same stream.
+    """
+    rng = random.Random(seed)
+    ids = account_ids(accounts)
+    mix = mix or DEFAULT_MIX
+    names = list(mix)
+    cumulative = []
+    total = 0
+    for name in names:
+        total += mix[name]
+        cumulative.append(total)
+    gaps = TIMESTAMP_GAPS[timestamps](rng, max_gap)
+
+    timestamp = accounts
+    for _ in range(operations):
+        timestamp += next(gaps)
+        name = rng.choices(names, cum_weights=cumulative)[0]
+        if name == "deposit":
+            yield name, (timestamp, rng.choice(ids), rng.randint(1, 1000))
+        elif name == "transfer":
+            yield name, (timestamp, rng.choice(ids), rng.choice(ids), rng.randint(1, 500))
+        elif name == "pay":
+            yield name, (timestamp, rng.choice(ids), rng.randint(1, 300))
+        elif name == "get_balance":
+            yield name, (timestamp, rng.choice(ids), rng.randint(1, timestamp))
+        elif name == "top_spenders":
+            yield name, (timestamp, rng.randint(1, 10))
+        elif name == "merge_accounts":
+            yield name, (timestamp, rng.choice(ids), rng.choice(ids))
+        elif name == "get_payment_status":
+            yield name, (timestamp, rng.choice(ids), f"payment{rng.randint(1, 1000)}")
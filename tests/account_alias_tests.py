@@ -0,0 +1,72 @@
+import unittest
+from banking_system_impl import BankingSystemImpl, create_banking_system
+from banking_system_indexes import AccountAliases
+from benchmarks.workload import operation_mix, parse_mix, setup_stream
+
+
+class AccountAliasTests(unittest.TestCase):
+    """
+    Tests for merges recorded as links between account keys instead of rewritten rows.
+    """
+
+    def test_chains_resolve_to_the_surviving_key(self):
+        links = [(2, 1), (1, 3), (4, 5), (5, 3), (6, 7)]
+        aliases = AccountAliases(links)
+        self.assertEqual([aliases.owner(key) for key in range(1, 9)], [3, 3, 3, 3, 3, 7, 7, 8])
+        self.assertEqual(
+            [AccountAliases(reversed(links)).owner(key) for key in range(1, 9)],
+            [aliases.owner(key) for key in range(1, 9)],
+        )
+
+    def test_merge_does_not_rewrite_history(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.create_account(2, 'account2')
+        for timestamp in range(3, 50):
+            system.deposit(timestamp, 'account2', 10)
+        statements = []
+        system.conn.set_trace_callback(statements.append)
+        self.assertTrue(system.merge_accounts(50, 'account1', 'account2'))
+        system.conn.set_trace_callback(None)
+        rewrites = [sql for sql in statements if 'UPDATE transactions' in sql or 'UPDATE balance_history' in sql]
+        self.assertEqual(rewrites, [])
+        self.assertEqual(system.top_spenders(51, 1), ['account1(0)'])
+        system.disconnect()
+
+    def test_payments_follow_merges_and_recreated_accounts_start_fresh(self):
+        system = BankingSystemImpl()
+        for timestamp, account_id in enumerate(('account1', 'account2', 'account3'), 1):
+            system.create_account(timestamp, account_id)
+            system.deposit(timestamp, account_id, 1000)
+        payment = system.pay(4, 'account2', 100)
+        self.assertTrue(system.merge_accounts(5, 'account1', 'account2'))
+        self.assertTrue(system.merge_accounts(6, 'account3', 'account1'))
+        self.assertTrue(system.create_account(7, 'account2'))
+        self.assertEqual(system.get_payment_status(8, 'account3', payment), 'IN_PROGRESS')
+        self.assertIsNone(system.get_payment_status(8, 'account2', payment))
+        self.assertEqual(system.top_spenders(9, 2), ['account3(100)', 'account2(0)'])
+        system.discard_caches()
+        self.assertEqual(system.top_spenders(10, 2), ['account3(100)', 'account2(0)'])
+        self.assertEqual(system.deposit(86400004, 'account3', 0), 2900 + 2)
+        self.assertEqual(system.get_balance(86400005, 'account2', 5), None)
+        self.assertEqual(system.get_balance(86400005, 'account2', 4), 900)
+        system.disconnect()
+
+    def test_merge_heavy_stream_matches_memory_engine(self):
+        mix = parse_mix('merge_accounts=10,pay=20,deposit=20,transfer=20,top_spenders=5,get_balance=10,get_payment_status=5')
+        stream = []
+        for start in range(0, 2000, 200):
+            # Opening every account again re-creates the ones merged away so far
+            stream += [(op, (start * 100_000 + timestamp, account_id)) for op, (timestamp, account_id) in setup_stream(20)]
+            stream += [
+                (op, (start * 100_000 + 100 + args[0],) + args[1:])
+                for op, args in operation_mix(20, 200, mix, max_gap=400, seed=start)
+            ]
+        memory = create_banking_system('memory')
+        expected = [getattr(memory, op)(*args) for op, args in stream]
+        system = BankingSystemImpl()
+        self.assertEqual([getattr(system, op)(*args) for op, args in stream], expected)
+        system.disconnect()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+from banking_system_indexes import AccountCache
+from benchmarks.engine_comparison import operation_stream
+
+
+class AccountCacheTests(unittest.TestCase):
+    """
+    Tests for the LRU account cache and its write-through from the banking operations.
+    """
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = AccountCache(capacity=2)
+        cache.put('account1', 10)
+        cache.put('account2', None)
+        self.assertEqual(cache.get('account1'), (True, 10))
+        cache.put('account3', 30)
+        self.assertEqual(cache.get('account2'), (False, None))
+        self.assertEqual(cache.get('account1'), (True, 10))
+        self.assertEqual(len(cache), 2)
+
+    def test_hot_accounts_are_served_without_lookups(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.create_account(2, 'account2')
+        statements = []
+        system.conn.set_trace_callback(statements.append)
+        system.deposit(3, 'account1', 100)
+        system.transfer(4, 'account1', 'account2', 40)
+        system.conn.set_trace_callback(None)
+        self.assertEqual([sql for sql in statements if sql.lstrip().upper().startswith('SELECT')], [])
+
+    def test_cache_follows_merges_and_rollbacks(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.create_account(2, 'account2')
+        system.deposit(3, 'account2', 70)
+        self.assertTrue(system.merge_accounts(4, 'account1', 'account2'))
+        self.assertEqual(system.account_cache.get('account2'), (True, None))
+        self.assertIsNone(system.deposit(5, 'account2', 1))
+        with self.assertRaises(RuntimeError):
+            with system.transaction():
+                system.deposit(6, 'account1', 1000)
+                raise RuntimeError('crash')
+        self.assertEqual(len(system.account_cache), 0)
+        self.assertEqual(system.deposit(7, 'account1', 0), 70)
+
+    def test_small_and_disabled_caches_give_same_results(self):
+        stream = operation_stream(accounts=30, operations=400, seed=9)
+        results = []
+        for size in (100_000, 5, 0):
+            system = BankingSystemImpl(account_cache_size=size)
+            results.append([getattr(system, op)(*args) for op, args in stream])
+            system.disconnect()
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(results[2], results[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+from benchmarks.engine_comparison import operation_stream
+from benchmarks.workload import DAY
+
+
+class ApplyBatchTests(unittest.TestCase):
+    """
+    Tests for `BankingSystemImpl.apply_batch` and the batched writes behind it.
+    """
+
+    def setUp(self):
+        self.stream = list(operation_stream(accounts=20, operations=600, seed=3))
+        # Every BankingSystemImpl starts over on the same file, so replay the expected
+        # results before creating the system under test.
+        reference = BankingSystemImpl()
+        self.expected = [getattr(reference, op)(*args) for op, args in self.stream]
+        self.expected_tail = [getattr(reference, op)(*args) for op, args in self.stream[-50:]]
+        reference.disconnect()
+        self.system = BankingSystemImpl()
+
+    def count(self, table):
+        return self.system.execute_script(f"SELECT COUNT(*) FROM {table}")[0][0]
+
+    def test_results_match_individual_calls(self):
+        self.assertEqual(self.system.apply_batch(self.stream, chunk_size=50), self.expected)
+        self.assertGreater(self.count('balance_history'), len(self.stream) // 2)
+
+    def test_rows_are_written_in_one_commit(self):
+        before = self.system.connections.stats()['commits']
+        self.system.apply_batch(self.stream, chunk_size=50)
+        self.assertEqual(self.system.connections.stats()['commits'] - before, 1)
+        self.system.discard_caches()
+        self.assertEqual(self.system.apply_batch(self.stream[-50:]), self.expected_tail)
+
+    def test_balances_are_flushed(self):
+        self.system.apply_batch([
+            ('create_account', (1, 'account1')),
+            ('deposit', (2, 'account1', 500)),
+            ('pay', (3, 'account1', 200)),
+        ])
+        self.assertEqual(self.system.get_account_balance('account1'), 300)
+        self.assertEqual(self.count('transactions'), 2)
+        self.assertEqual(self.system.get_payment_status(4, 'account1', 'payment1'), 'IN_PROGRESS')
+
+    def test_invalid_operation_rolls_back_whole_batch(self):
+        for bad in [('withdraw', (2, 'account1', 5)), ('deposit', (2, 'account1'))]:
+            with self.assertRaises(ValueError):
+                self.system.apply_batch([('create_account', (1, 'account1')), bad])
+            self.assertEqual(self.count('user_data'), 0)
+            self.assertEqual(self.count('balance_history'), 0)
+        self.assertTrue(self.system.create_account(3, 'account1'))
+
+    def test_merge_then_re_create_matches_individual_calls(self):
+        operations = [
+            ('create_account', (1, 'account1')),
+            ('create_account', (2, 'account2')),
+            ('deposit', (3, 'account2', 50)),
+            ('merge_accounts', (4, 'account1', 'account2')),
+            ('create_account', (5, 'account2')),
+            ('deposit', (6, 'account2', 7)),
+        ]
+
+        def outcome(system):
+            history = system.execute_script("SELECT * FROM balance_history ORDER BY rowid")
+            list(system.compact_balance_history(10 * DAY, DAY))
+            balances = [system.get_balance(10 * DAY, 'account2', time_at) for time_at in range(1, 8)]
+            return history, balances
+
+        self.system.disconnect()
+        reference = BankingSystemImpl()
+        for op, args in operations:
+            getattr(reference, op)(*args)
+        expected = outcome(reference)
+        reference.disconnect()
+        self.system = BankingSystemImpl()
+        self.system.apply_batch(operations)
+        self.assertEqual(outcome(self.system), expected)
+        self.assertIsNone(expected[1][3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+from banking_system_async import AsyncBankingSystem
+from banking_system_impl import BankingSystemImpl
+from benchmarks.engine_comparison import operation_stream
+
+
+class AsyncBankingSystemTests(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests for the asyncio front-end and its group commits.
+    """
+
+    async def asyncSetUp(self):
+        # The test loop runs in debug mode, which reports any step over 0.1s as slow;
+        # setting up a thousand calls at once takes longer than that.
+        asyncio.get_running_loop().slow_callback_duration = 1
+        self.bank = AsyncBankingSystem()
+        await self.bank.__aenter__()
+        self.assertTrue(await self.bank.create_account(1, 'account1'))
+
+    async def asyncTearDown(self):
+        await self.bank.close()
+
+    def commits(self):
+        return self.bank.system.connections.stats()['commits']
+
+    async def test_concurrent_writes_share_commits(self):
+        before = self.commits()
+        balances = await asyncio.gather(*(self.bank.deposit(t, 'account1', 1) for t in range(2, 1002)))
+        self.assertEqual(balances, list(range(1, 1001)))
+        self.assertLess(self.commits() - before, 20)
+        self.assertEqual(await self.bank.get_balance(1002, 'account1', 1001), 1000)
+
+    async def test_results_match_sequential_calls(self):
+        stream = operation_stream(accounts=10, operations=300, seed=11)
+        reference = BankingSystemImpl()
+        expected = [getattr(reference, op)(*args) for op, args in stream]
+        reference.disconnect()
+        await self.bank.close()
+
+        async with AsyncBankingSystem(max_batch=64) as bank:
+            results = await asyncio.gather(*(getattr(bank, op)(*args) for op, args in stream))
+        self.assertEqual(results, expected)
+        self.assertLess(bank.batches, len(stream))
+
+    async def test_failing_call_does_not_fail_its_group(self):
+        def broken_pay(*args):
+            raise RuntimeError('pay failed')
+
+        self.bank.system.pay = broken_pay
+        outcomes = await asyncio.gather(
+            self.bank.deposit(2, 'account1', 100),
+            self.bank.pay(3, 'account1', 10),
+            self.bank.deposit(4, 'account1', 100),
+            return_exceptions=True,
+        )
+        self.assertEqual(outcomes[0], 100)
+        self.assertIsInstance(outcomes[1], RuntimeError)
+        self.assertEqual(outcomes[2], 200)
+
+
+    async def test_failing_call_on_engine_without_batches(self):
+        await self.bank.close()
+        async with AsyncBankingSystem(engine='memory') as bank:
+            self.assertTrue(await bank.create_account(1, 'account1'))
+            self.assertTrue(await bank.create_account(2, 'account2'))
+            outcomes = await asyncio.gather(
+                bank.deposit(3, 'account1', 100),
+                bank.transfer(4, 'account1', 'account2', None),
+                bank.deposit(5, 'account1', 1),
+                return_exceptions=True,
+            )
+            self.assertEqual(outcomes[0], 100)
+            self.assertIsInstance(outcomes[1], TypeError)
+            self.assertEqual(outcomes[2], 101)
+            self.assertEqual(bank.system.accounts['account1'].balance, 101)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+from banking_system_indexes import BalanceIndex
+from benchmarks.workload import operation_mix, setup_stream
+
+
+class BalanceIndexTests(unittest.TestCase):
+
+    def test_latest_balance_at_or_before_timestamp(self):
+        index = BalanceIndex()
+        index.record('account1', 1, 0)
+        index.record('account1', 5, 100)
+        index.record('account1', 5, 150)
+        self.assertIsNone(index.balance_at('account1', 0))
+        self.assertEqual(index.balance_at('account1', 4), 0)
+        self.assertEqual(index.balance_at('account1', 5), 150)
+        self.assertIsNone(index.balance_at('account2', 5))
+
+    def test_merged_account_can_be_recreated(self):
+        index = BalanceIndex()
+        index.record('account2', 1, 50)
+        index.record('account2', 10, None)
+        index.record('account2', 20, 0)
+        self.assertEqual(index.balance_at('account2', 9), 50)
+        self.assertIsNone(index.balance_at('account2', 15))
+        self.assertEqual(index.balance_at('account2', 20), 0)
+
+    def test_loader_fills_histories_lazily(self):
+        loaded = []
+
+        def loader(account_id):
+            loaded.append(account_id)
+            return [(1, 0), (3, 30)]
+
+        index = BalanceIndex(loader)
+        index.record('account1', 5, 60)
+        self.assertEqual(loaded, [])
+        self.assertEqual(index.balance_at('account1', 4), 30)
+        index.record('account1', 5, 60)
+        self.assertEqual(index.balance_at('account1', 5), 60)
+        self.assertEqual(loaded, ['account1'])
+
+    def test_capacity_drops_least_recently_used_history(self):
+        loaded = []
+
+        def loader(account_id):
+            loaded.append(account_id)
+            return [(1, len(account_id))]
+
+        index = BalanceIndex(loader, capacity=2)
+        for account_id in ('a', 'bb', 'a', 'ccc', 'a', 'bb'):
+            self.assertEqual(index.balance_at(account_id, 1), len(account_id))
+        self.assertEqual(loaded, ['a', 'bb', 'ccc', 'bb'])
+        self.assertEqual(len(index), 2)
+        with self.assertRaises(ValueError):
+            BalanceIndex(capacity=2)
+
+
+class SqliteBalanceIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.system = BankingSystemImpl()
+        self.system.create_account(1, 'account1')
+        self.system.create_account(2, 'account2')
+        self.system.deposit(3, 'account1', 1000)
+        self.system.deposit(4, 'account2', 500)
+        self.system.merge_accounts(5, 'account1', 'account2')
+        self.system.create_account(6, 'account2')
+        self.system.deposit(7, 'account2', 20)
+
+    def answers(self):
+        return [
+            self.system.get_balance(10, account_id, time_at)
+            for account_id in ('account1', 'account2', 'account3')
+            for time_at in range(0, 9)
+        ]
+
+    def test_get_balance_does_not_touch_the_database(self):
+        statements = []
+        self.system.conn.set_trace_callback(statements.append)
+        self.assertEqual(self.system.get_balance(10, 'account2', 5), None)
+        self.assertEqual(self.system.get_balance(10, 'account1', 5), 1500)
+        self.system.conn.set_trace_callback(None)
+        self.assertEqual(statements, [])
+
+    def test_reloaded_index_gives_same_answers(self):
+        expected = self.answers()
+        self.system.discard_caches()
+        self.assertEqual(self.answers(), expected)
+        self.assertEqual(expected[9 + 4], 500)
+        self.assertIsNone(expected[9 + 5])
+        self.assertEqual(expected[9 + 7], 20)
+
+    def test_bounded_index_gives_same_answers_in_a_batch(self):
+        stream = list(setup_stream(8)) + list(operation_mix(8, 600, seed=4))
+        self.system.disconnect()
+        reference = BankingSystemImpl()
+        expected = [getattr(reference, op)(*args) for op, args in stream]
+        reference.disconnect()
+        self.system = BankingSystemImpl(balance_index_size=2)
+        self.assertEqual(self.system.apply_batch(stream, chunk_size=64), expected)
+        self.assertLessEqual(len(self.system.balance_index), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
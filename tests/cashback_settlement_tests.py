@@ -0,0 +1,57 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+DAY = 86400000
+
+
+class CashbackSettlementTests(unittest.TestCase):
+    """
+    Tests for the cashback queue that credits refunds into the stored balance.
+    """
+
+    def setUp(self):
+        self.system = BankingSystemImpl()
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        self.assertTrue(self.system.create_account(2, 'account2'))
+        self.assertEqual(self.system.deposit(3, 'account1', 1000), 1000)
+
+    def stored_balance(self, account_id):
+        return self.system.get_account_balance(account_id)
+
+    def test_refund_is_credited_once_into_stored_balance(self):
+        self.assertEqual(self.system.pay(4, 'account1', 500), 'payment1')
+        self.assertEqual(len(self.system.cashback_queue), 1)
+        self.assertEqual(self.system.deposit(DAY + 4, 'account1', 0), 510)
+        self.assertEqual(self.stored_balance('account1'), 510)
+        self.assertEqual(len(self.system.cashback_queue), 0)
+        self.assertEqual(self.system.deposit(DAY + 5, 'account1', 0), 510)
+
+    def test_refund_is_recorded_at_its_refund_date(self):
+        self.system.pay(4, 'account1', 500)
+        self.assertEqual(self.system.get_balance(3 * DAY, 'account1', DAY + 3), 500)
+        self.assertEqual(self.system.get_balance(3 * DAY, 'account1', DAY + 4), 510)
+
+    def test_each_payment_is_rounded_down_separately(self):
+        for timestamp in range(4, 14):
+            self.system.pay(timestamp, 'account1', 49)
+        self.assertEqual(self.system.deposit(DAY + 20, 'account1', 0), 510)
+
+    def test_refund_goes_to_surviving_account_after_merge(self):
+        self.system.deposit(4, 'account2', 1000)
+        self.system.pay(5, 'account2', 1000)
+        self.assertTrue(self.system.merge_accounts(6, 'account1', 'account2'))
+        self.assertEqual(self.system.deposit(DAY + 5, 'account1', 0), 1020)
+
+    def test_pending_refunds_are_reloaded_after_rollback(self):
+        self.system.pay(4, 'account1', 500)
+        with self.assertRaises(RuntimeError):
+            with self.system.transaction():
+                self.system.deposit(DAY + 4, 'account1', 1)
+                raise RuntimeError('crash')
+        self.assertEqual(self.stored_balance('account1'), 500)
+        self.assertEqual(self.system.deposit(DAY + 4, 'account1', 0), 510)
+
+
+if __name__ == '__main__':
+    unittest.main()
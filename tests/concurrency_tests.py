@@ -0,0 +1,101 @@
+import random
+import threading
+import unittest
+from banking_system_impl import BankingSystemImpl, ReadWriteLock
+
+
+class ReadWriteLockTests(unittest.TestCase):
+    """
+    Tests for the lock that serializes units of work and guards in-memory state.
+    """
+
+    def test_readers_share_and_writer_excludes(self):
+        lock = ReadWriteLock()
+        self.assertTrue(lock.acquire_read())
+        outcome = []
+        thread = threading.Thread(target=lambda: outcome.extend([
+            lock.acquire_read(blocking=False), lock.acquire_write(blocking=False),
+        ]))
+        thread.start()
+        thread.join()
+        self.assertEqual(outcome, [True, False])
+
+    def test_writer_may_reenter_and_read(self):
+        lock = ReadWriteLock()
+        lock.acquire_write()
+        self.assertTrue(lock.acquire_write(blocking=False))
+        self.assertTrue(lock.acquire_read(blocking=False))
+        lock.release_read()
+        lock.release_write()
+        lock.release_write()
+        outcome = []
+        thread = threading.Thread(target=lambda: outcome.append(lock.acquire_write(blocking=False)))
+        thread.start()
+        thread.join()
+        self.assertEqual(outcome, [True])
+
+
+class ConcurrentAccessTests(unittest.TestCase):
+    """
+    Stress test: many threads calling the public API of one `BankingSystemImpl` at once.
+    """
+
+    writers = 32
+    operations = 40
+    accounts = 16
+
+    def setUp(self):
+        # Fewer connections than threads, so threads also have to share the pool.
+        self.system = BankingSystemImpl()
+        self.system.connections.pool_size = 8
+        self.ids = [f"account{i}" for i in range(self.accounts)]
+        for timestamp, account_id in enumerate(self.ids, 1):
+            self.system.create_account(timestamp, account_id)
+            self.system.deposit(timestamp, account_id, 1000)
+
+    def worker(self, seed, deposited, errors):
+        rng = random.Random(seed)
+        try:
+            for _ in range(self.operations):
+                timestamp = 100 + rng.randint(1, 1000)
+                roll = rng.random()
+                if roll < 0.3:
+                    amount = rng.randint(1, 50)
+                    if self.system.deposit(timestamp, rng.choice(self.ids), amount) is not None:
+                        deposited.append(amount)
+                elif roll < 0.8:
+                    self.system.transfer(timestamp, rng.choice(self.ids), rng.choice(self.ids), rng.randint(1, 200))
+                elif roll < 0.9:
+                    self.system.get_balance(timestamp, rng.choice(self.ids), timestamp)
+                else:
+                    self.system.top_spenders(timestamp, 3)
+        except Exception as error:
+            errors.append(error)
+
+    def test_balances_stay_consistent(self):
+        deposited, errors = [], []
+        threads = [
+            threading.Thread(target=self.worker, args=(seed, deposited, errors))
+            for seed in range(self.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        balances = dict(self.system.execute_script("SELECT account_id, amount FROM balances"))
+        self.assertEqual(sum(balances.values()), 1000 * self.accounts + sum(deposited))
+        self.assertTrue(all(amount >= 0 for amount in balances.values()))
+        outgoing = dict(self.system.execute_script(
+            "SELECT A.account_id, -SUM(T.amount) FROM transactions T JOIN accounts A ON A.account_key = T.account_key "
+            "WHERE T.amount < 0 GROUP BY A.account_id"
+        ))
+        for account_id in self.ids:
+            self.assertEqual(self.system.leaderboard.total(account_id), outgoing.get(account_id, 0))
+            self.assertEqual(self.system.balance_index.history(account_id).balances[-1], balances[account_id])
+        self.assertLessEqual(self.system.connections.stats()['in_use'], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import threading
+import unittest
+from banking_system_impl import BankingSystemImpl, ConnectionManager
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    """
+    Tests for the pooled connection layer used by `Query`.
+    """
+
+    def setUp(self):
+        self.system = BankingSystemImpl()
+
+    def test_operations_reuse_one_connection(self):
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        self.assertTrue(self.system.create_account(2, 'account2'))
+        self.assertEqual(self.system.deposit(3, 'account1', 1000), 1000)
+        self.assertEqual(self.system.transfer(4, 'account1', 'account2', 400), 600)
+        stats = self.system.connections.stats()
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_each_thread_gets_its_own_connection(self):
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(self.system.conn))
+        thread.start()
+        thread.join()
+        self.assertIsNot(seen[0], self.system.conn)
+
+    def test_connection_of_finished_thread_is_reused(self):
+        manager = ConnectionManager(self.system.db_name, pool_size=1)
+        first = threading.Thread(target=manager.connection)
+        first.start()
+        first.join()
+        del first
+        second = threading.Thread(target=manager.connection)
+        second.start()
+        second.join()
+        self.assertEqual(manager.stats()['opened'], 1)
+        self.assertGreaterEqual(manager.stats()['reused'], 1)
+
+    def test_exhausted_pool_hands_over_connection_on_release(self):
+        manager = ConnectionManager(self.system.db_name, pool_size=1, timeout=5)
+        manager.connection()
+        acquired = threading.Event()
+
+        def waiter():
+            manager.connection()
+            acquired.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        self.assertFalse(acquired.wait(0.2))
+        manager.release()
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(manager.stats()['opened'], 1)
+
+    def test_counters_add_up_under_concurrent_use(self):
+        manager = ConnectionManager(self.system.db_name, pool_size=2, timeout=5)
+
+        def cycle():
+            for _ in range(200):
+                manager.connection()
+                manager.release(force=True)
+
+        threads = [threading.Thread(target=cycle) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = manager.stats()
+        self.assertEqual(stats['opened'] + stats['reused'], 1600)
+        self.assertEqual(stats['released'], 1600)
+        self.assertEqual(stats['health_checks'], stats['reused'] + stats['health_failures'])
+        manager.close_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
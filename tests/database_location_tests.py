@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+import unittest
+from banking_system_impl import BankingSystemImpl, Query
+from benchmarks.engine_comparison import operation_stream
+
+
+class DatabaseLocationTests(unittest.TestCase):
+    """
+    Tests for the `db_path` option: database files, ":memory:" and shared-cache URIs.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.stream = operation_stream(accounts=10, operations=200, seed=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def replay(self, system):
+        results = [getattr(system, op)(*args) for op, args in self.stream]
+        system.disconnect()
+        return results
+
+    def test_modes_give_same_results(self):
+        expected = self.replay(BankingSystemImpl(os.path.join(self.directory.name, 'bank.db')))
+        self.assertEqual(self.replay(BankingSystemImpl(':memory:')), expected)
+        self.assertEqual(self.replay(BankingSystemImpl('file:location_tests?mode=memory&cache=shared')), expected)
+
+    def test_instances_on_different_paths_coexist(self):
+        first = BankingSystemImpl(os.path.join(self.directory.name, 'first.db'))
+        second = BankingSystemImpl(os.path.join(self.directory.name, 'second.db'))
+        self.assertTrue(first.create_account(1, 'account1'))
+        self.assertTrue(second.create_account(1, 'account1'))
+        self.assertEqual(first.deposit(2, 'account1', 10), 10)
+        self.assertEqual(second.deposit(2, 'account1', 20), 20)
+        first.disconnect()
+        second.disconnect()
+
+    def test_memory_database_is_shared_by_threads(self):
+        before = set(os.listdir('.'))
+        system = BankingSystemImpl(':memory:')
+        thread = threading.Thread(target=system.create_account, args=(1, 'account1'))
+        thread.start()
+        thread.join()
+        self.assertEqual(system.deposit(2, 'account1', 50), 50)
+        self.assertEqual(system.connections.stats()['opened'], 1)
+        self.assertEqual(set(os.listdir('.')) - before, set())
+        system.disconnect()
+
+    def test_shared_cache_database_is_shared_by_pool(self):
+        uri = 'file:shared_pool_test?mode=memory&cache=shared'
+        system = BankingSystemImpl(uri)
+        system.create_account(1, 'account1')
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(Query.get_account_balance(system, 'account1')))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [0])
+        self.assertEqual(system.connections.stats()['opened'], 2)
+        system.disconnect()
+        reopened = BankingSystemImpl(uri)
+        self.assertTrue(reopened.create_account(1, 'account1'))
+        reopened.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
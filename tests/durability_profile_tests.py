@@ -0,0 +1,43 @@
+import threading
+import unittest
+from banking_system_impl import BankingSystemImpl, Query, create_banking_system
+
+
+class DurabilityProfileTests(unittest.TestCase):
+    """
+    Tests for the WAL journaling and durability profiles applied to each connection.
+    """
+
+    def pragma(self, system, name):
+        return system.cur.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def test_profiles_configure_connections(self):
+        expected = {'strict': 2, 'balanced': 1, 'throughput': 0}
+        for profile, synchronous in expected.items():
+            system = create_banking_system('sqlite', durability=profile)
+            self.assertEqual(self.pragma(system, 'journal_mode'), 'wal')
+            self.assertEqual(self.pragma(system, 'synchronous'), synchronous)
+            self.assertTrue(system.create_account(1, 'account1'))
+            system.disconnect()
+        self.assertEqual(self.pragma(BankingSystemImpl(), 'cache_size'), -2000)
+
+    def test_unknown_profile_is_rejected(self):
+        with self.assertRaises(ValueError):
+            BankingSystemImpl(durability='fast')
+
+    def test_readers_do_not_wait_for_open_write(self):
+        system = BankingSystemImpl(durability='balanced')
+        system.create_account(1, 'account1')
+        system.deposit(2, 'account1', 100)
+        seen = []
+        with system.transaction():
+            system.deposit(3, 'account1', 50)
+            reader = threading.Thread(target=lambda: seen.append(Query.get_account_balance(system, 'account1')))
+            reader.start()
+            reader.join(5)
+        self.assertEqual(seen, [100])
+        self.assertEqual(system.get_account_balance('account1'), 150)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl, create_banking_system
+from benchmarks.workload import DAY, operation_mix, setup_stream
+
+
+class HistoryCompactionTests(unittest.TestCase):
+    """
+    Tests for collapsing old balance history into checkpoint rows.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'bank.db')
+        self.stream = list(setup_stream(12)) + list(operation_mix(12, 1500, max_gap=DAY // 25, seed=3))
+        self.now = self.stream[-1][1][0]
+        self.cutoff = self.now - 5 * DAY - (self.now - 5 * DAY) % DAY
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def retained_times(self):
+        period_ends = range(DAY - 1, self.cutoff, DAY)
+        return list(period_ends) + list(range(self.cutoff, self.now, DAY // 10 + 3))
+
+    def balances(self, system, times):
+        return {(f'account{i}', time_at): system.get_balance(self.now, f'account{i}', time_at)
+                for i in range(1, 13) for time_at in times}
+
+    def history_rows(self, system):
+        return system.execute_script("SELECT COUNT(*) FROM balance_history")[0][0]
+
+    def test_retained_answers_stay_exact(self):
+        system = BankingSystemImpl(self.path)
+        for op, args in self.stream:
+            getattr(system, op)(*args)
+        times = self.retained_times()
+        expected = self.balances(system, times)
+        rows = self.history_rows(system)
+
+        reports = list(system.compact_balance_history(self.now, 5 * DAY, batch_size=5))
+        self.assertEqual([report['accounts'] for report in reports], [5, 10, 12])
+        self.assertEqual(rows - self.history_rows(system), reports[-1]['rows_removed'])
+        self.assertGreater(reports[-1]['rows_removed'], rows // 2)
+        self.assertGreater(reports[-1]['pages_released'], 0)
+        self.assertIsNone(system._balance_index)
+        self.assertEqual(self.balances(system, times), expected)
+        self.assertEqual(list(system.compact_balance_history(self.now, 5 * DAY))[-1]['rows_removed'], 0)
+        system.disconnect()
+
+        reopened = BankingSystemImpl(self.path, reset=False)
+        self.assertEqual(self.balances(reopened, times), expected)
+        reopened.disconnect()
+
+    def test_merge_markers_survive(self):
+        system = BankingSystemImpl(self.path)
+        system.create_account(1, 'account1')
+        system.create_account(2, 'account2')
+        system.deposit(3, 'account2', 50)
+        system.merge_accounts(4, 'account1', 'account2')
+        system.create_account(5, 'account3')
+        system.create_account(DAY + 1, 'account2')
+        system.deposit(DAY + 2, 'account2', 7)
+        list(system.compact_balance_history(3 * DAY, DAY))
+        self.assertIsNone(system.get_balance(3 * DAY, 'account2', DAY - 1))
+        self.assertEqual(system.get_balance(3 * DAY, 'account1', DAY - 1), 50)
+        self.assertEqual(system.get_balance(3 * DAY, 'account2', 2 * DAY - 1), 7)
+        self.assertEqual(self.history_rows(system), 4)
+        system.disconnect()
+
+    def test_sharded_system_compacts_every_shard(self):
+        system = create_banking_system('sharded', shards=3, db_path=self.path)
+        for op, args in self.stream:
+            getattr(system, op)(*args)
+        times = self.retained_times()
+        expected = self.balances(system, times)
+        reports = list(system.compact_balance_history(self.now, 5 * DAY, batch_size=100))
+        self.assertEqual(len(reports), 3)
+        self.assertGreater(reports[-1]['rows_removed'], 0)
+        self.assertEqual(self.balances(system, times), expected)
+        system.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Runs every level suite against the in-memory engine.
+"""
+import unittest
+import level_1_tests
+import level_2_tests
+import level_3_tests
+import level_4_tests
+from banking_system_impl import create_banking_system
+from banking_system_memory import InMemoryBankingSystem
+from benchmarks import engine_comparison
+
+
+class InMemoryLevel1Tests(level_1_tests.Level1Tests):
+
+    @classmethod
+    def setUp(cls):
+        cls.system = create_banking_system("memory")
+
+
+class InMemoryLevel2Tests(level_2_tests.Level2Tests):
+
+    @classmethod
+    def setUp(cls):
+        cls.system = create_banking_system("memory")
+
+
+class InMemoryLevel3Tests(level_3_tests.Level3Tests):
+
+    @classmethod
+    def setUp(cls):
+        cls.system = create_banking_system("memory")
+
+
+class InMemoryLevel4Tests(level_4_tests.Level4Tests):
+
+    @classmethod
+    def setUp(cls):
+        cls.system = create_banking_system("memory")
+
+
+class EngineSelectionTests(unittest.TestCase):
+
+    def test_memory_engine_is_selected(self):
+        self.assertIsInstance(create_banking_system("memory"), InMemoryBankingSystem)
+
+    def test_unknown_engine_is_rejected(self):
+        with self.assertRaises(ValueError):
+            create_banking_system("postgres")
+
+    def test_engines_agree_on_the_benchmark_stream(self):
+        stream = engine_comparison.operation_stream(20, 500, seed=1)
+        _, sqlite_results = engine_comparison.replay("sqlite", stream)
+        _, memory_results = engine_comparison.replay("memory", stream)
+        self.assertEqual(engine_comparison.mismatches(stream, sqlite_results, memory_results), [])
+        memory_results[-1] = object()
+        self.assertEqual(len(engine_comparison.mismatches(stream, sqlite_results, memory_results)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+from banking_system_metrics import normalize_statement
+
+
+class MetricsTests(unittest.TestCase):
+    """
+    Tests for the per-method and per-statement instrumentation.
+    """
+
+    def setUp(self):
+        self.system = BankingSystemImpl()
+        self.system.create_account(1, 'account1')
+        self.system.create_account(2, 'account2')
+        self.system.deposit(3, 'account1', 1000)
+
+    def test_disabled_metrics_record_nothing(self):
+        self.system.transfer(4, 'account1', 'account2', 100)
+        self.assertEqual(self.system.metrics.snapshot()['methods'], {})
+        self.assertEqual(self.system.metrics.snapshot()['statements'], {})
+
+    def test_counts_statements_per_method_and_template(self):
+        self.system.metrics.enable()
+        self.system.transfer(4, 'account1', 'account2', 100)
+        self.system.get_balance(5, 'account1', 4)
+        snapshot = self.system.metrics.snapshot()
+        transfer = snapshot['methods']['transfer']
+        self.assertEqual(transfer['calls'], 1)
+        self.assertGreater(transfer['statements'], 0)
+        self.assertGreater(transfer['seconds'], 0)
+        self.assertEqual(transfer['connections_opened'], 0)
+        self.assertEqual(snapshot['statements']['update_balance']['executions'], 2)
+        self.assertEqual(snapshot['statements']['record_balance']['rows'], 2)
+        self.assertEqual(snapshot['methods']['get_balance']['statements'], 0)
+        self.assertEqual(snapshot['connections']['opened'], 1)
+
+    def test_rows_fetched_by_select_templates(self):
+        self.system.metrics.enable()
+        self.system.account_cache.clear()
+        self.system.discard_caches()
+        self.system.deposit(4, 'account2', 5)
+        self.system.top_spenders(5, 2)
+        statements = self.system.metrics.snapshot()['statements']
+        self.assertEqual(statements['balance_of']['rows'], 1)
+        self.assertEqual(statements['live_account_keys']['rows'], 2)
+
+    def test_batch_statements_are_counted_per_operation(self):
+        self.system.metrics.enable()
+        self.system.apply_batch([('deposit', (4, 'account2', 5)), ('deposit', (5, 'account2', 5))])
+        methods = self.system.metrics.snapshot()['methods']
+        self.assertEqual(methods['deposit']['calls'], 2)
+        self.assertEqual(methods['apply_batch']['calls'], 1)
+
+    def test_prometheus_text(self):
+        self.system.metrics.enable()
+        self.system.deposit(4, 'account2', 5)
+        text = self.system.metrics.prometheus()
+        self.assertIn('# TYPE banking_method_calls_total counter', text)
+        self.assertIn('banking_method_calls_total{method="deposit"} 1', text)
+        self.assertIn('banking_statement_executions_total{statement="update_balance"} 1', text)
+        self.assertIn('banking_connection_events_total{event="opened"} 1', text)
+
+    def test_ad_hoc_statements_share_a_template(self):
+        self.assertEqual(
+            normalize_statement("SELECT amount FROM balances\n WHERE account_id='account7' AND x=12"),
+            "SELECT amount FROM balances WHERE account_id=? AND x=?",
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl, SCHEMA_VERSION
+from benchmarks.engine_comparison import operation_stream
+from tests.schema_migration_tests import legacy_tables
+
+
+class OpenExistingTests(unittest.TestCase):
+    """
+    Tests for reopening an existing database with `reset=False`.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'bank.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_restart_continues_where_it_stopped(self):
+        stream = operation_stream(accounts=10, operations=400, seed=4)
+        uninterrupted = BankingSystemImpl(os.path.join(self.directory.name, 'reference.db'))
+        expected = [getattr(uninterrupted, op)(*args) for op, args in stream]
+        uninterrupted.disconnect()
+
+        system = BankingSystemImpl(self.path)
+        results = [getattr(system, op)(*args) for op, args in stream[:200]]
+        system.disconnect()
+        system = BankingSystemImpl(self.path, reset=False)
+        self.assertIsNone(system._leaderboard)
+        self.assertIsNone(system._balance_index)
+        results += [getattr(system, op)(*args) for op, args in stream[200:]]
+        system.disconnect()
+        self.assertEqual(results, expected)
+
+    def test_empty_database_is_created(self):
+        system = BankingSystemImpl(self.path, reset=False)
+        self.assertEqual(system.schema_version(), SCHEMA_VERSION)
+        self.assertTrue(system.create_account(1, 'account1'))
+        system.disconnect()
+
+    def test_older_database_is_migrated(self):
+        conn = sqlite3.connect(self.path)
+        conn.executescript(legacy_tables)
+        conn.close()
+        system = BankingSystemImpl(self.path, reset=False)
+        self.assertEqual(system.schema_version(), SCHEMA_VERSION)
+        self.assertEqual(system.pay(5, 'account1', 100), 'payment2')
+        self.assertEqual(system.get_balance(6, 'account1', 1), 0)
+        system.disconnect()
+
+    def test_unknown_databases_are_rejected(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+        conn.execute("CREATE TABLE notes (text)")
+        conn.close()
+        with self.assertRaisesRegex(ValueError, 'newer'):
+            BankingSystemImpl(self.path, reset=False)
+        conn = sqlite3.connect(self.path)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.close()
+        with self.assertRaisesRegex(ValueError, 'missing tables'):
+            BankingSystemImpl(self.path, reset=False)
+
+    def test_unknown_unversioned_database_is_rejected(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE foo (x)")
+        conn.close()
+        with self.assertRaisesRegex(ValueError, 'missing tables'):
+            BankingSystemImpl(self.path, reset=False)
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], 0)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
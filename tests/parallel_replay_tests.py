@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+import banking_system_replay
+from banking_system_impl import create_banking_system
+from banking_system_replay import parallel_replay, partition_operations
+from benchmarks.workload import DAY, operation_mix, setup_stream
+from tests.replay_cli_tests import as_jsonl
+
+
+def serial_results(stream):
+    system = create_banking_system('memory')
+    return [getattr(system, op)(*args) for op, args in stream]
+
+
+class ParallelReplayTests(unittest.TestCase):
+    """
+    Tests for replaying account-disjoint partitions of a log in worker processes.
+    """
+
+    def setUp(self):
+        mix = {'deposit': 30, 'pay': 25, 'get_balance': 10, 'top_spenders': 5, 'transfer': 2, 'merge_accounts': 3}
+        base = list(setup_stream(40)) + list(operation_mix(40, 600, mix, max_gap=DAY // 100, seed=8))
+        payers = [(args[1], result) for (op, args), result in zip(base, serial_results(base))
+                  if op == 'pay' and result is not None]
+        self.stream = []
+        for position, (op, args) in enumerate(base):
+            self.stream.append((op, args))
+            if position % 3 == 0 and position >= 40:
+                account_id, payment = payers[position % len(payers)]
+                self.stream.append(('get_payment_status', (args[0], account_id, payment)))
+                self.stream.append(('get_payment_status', (args[0], f'account{position % 40}', payment)))
+
+    def test_results_match_serial_replay(self):
+        expected = serial_results(self.stream)
+        statuses = {result for (op, _), result in zip(self.stream, expected) if op == 'get_payment_status'}
+        self.assertEqual(statuses, {None, 'IN_PROGRESS', 'CASHBACK_RECEIVED'})
+        for engine in ('memory', 'sqlite'):
+            self.assertEqual(parallel_replay(self.stream, 3, engine), expected)
+
+    def test_linked_accounts_share_a_partition(self):
+        stream = [
+            ('create_account', (1, 'account1')),
+            ('create_account', (2, 'account2')),
+            ('create_account', (3, 'account3')),
+            ('create_account', (4, 'account4')),
+            ('transfer', (5, 'account1', 'account2', 0)),
+            ('merge_accounts', (6, 'account3', 'account2')),
+            ('top_spenders', (7, 2)),
+        ]
+        owners, positions = partition_operations(stream, 4)
+        self.assertEqual(len(positions), 2)
+        self.assertEqual(len({owners[0], owners[1], owners[2]}), 1)
+        self.assertNotEqual(owners[3], owners[0])
+        self.assertIsNone(owners[6])
+        self.assertTrue(all(partition[-1] == 6 for partition in positions))
+        with self.assertRaises(ValueError):
+            partition_operations([('withdraw', (1, 'account1', 5))], 2)
+
+    def test_repeated_merges_and_re_creations(self):
+        stream = [('create_account', (1, 'account1')), ('create_account', (2, 'account2')),
+                  ('create_account', (3, 'account3'))]
+        timestamp = 3
+        for _ in range(40):
+            for survivor, absorbed in (('account2', 'account1'), ('account1', 'account2')):
+                stream += [
+                    ('deposit', (timestamp + 1, absorbed, 100)),
+                    ('pay', (timestamp + 2, absorbed, 10)),
+                    ('merge_accounts', (timestamp + 3, survivor, absorbed)),
+                    ('create_account', (timestamp + 4, absorbed)),
+                    ('get_payment_status', (timestamp + 5, survivor, 'payment1')),
+                ]
+                timestamp += 5
+        stream.append(('deposit', (timestamp + 1, 'account3', 5)))
+        self.assertEqual(parallel_replay(stream, 2, 'memory'), serial_results(stream))
+
+    def test_command_line_workers_match_serial_output(self):
+        outputs = []
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, 'log.jsonl')
+            with open(log, 'w') as file:
+                file.writelines(as_jsonl(self.stream))
+            for workers in ('1', '4'):
+                results = os.path.join(directory, f'results{workers}.jsonl')
+                with redirect_stderr(io.StringIO()):
+                    banking_system_replay.main([log, '--output', results, '--workers', workers])
+                with open(results) as file:
+                    outputs.append([json.loads(line) for line in file])
+        self.assertEqual(outputs[1], outputs[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+import banking_system_replay
+from benchmarks.engine_comparison import operation_stream
+from benchmarks.workload import operation_mix, setup_stream
+
+
+def as_jsonl(stream):
+    return [json.dumps({"op": op, "args": list(args)}) + "\n" for op, args in stream]
+
+
+class ReplayCliTests(unittest.TestCase):
+    """
+    Tests for streaming a JSONL operation log through `banking_system_replay`.
+    """
+
+    def setUp(self):
+        self.stream = operation_stream(accounts=10, operations=300, seed=5)
+
+    def results(self, engine, chunk_size):
+        output = io.StringIO()
+        count, _ = banking_system_replay.replay(iter(as_jsonl(self.stream)), output, engine, chunk_size)
+        self.assertEqual(count, len(self.stream))
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_engines_and_chunk_sizes_agree(self):
+        expected = self.results('memory', 1)
+        self.assertEqual(self.results('sqlite', 64), expected)
+        self.assertEqual([result['op'] for result in expected], [op for op, _ in self.stream])
+
+    def test_bounded_balance_index_gives_same_results(self):
+        self.stream = list(setup_stream(10)) + list(operation_mix(10, 400, seed=2))
+        expected = self.results('memory', 1)
+        with mock.patch.object(banking_system_replay, 'BALANCE_INDEX_SIZE', 2):
+            self.assertEqual(self.results('sqlite', 50), expected)
+            self.assertEqual(self.results('sharded', 50), expected)
+
+    def test_operations_are_read_lazily(self):
+        lines = iter(as_jsonl(self.stream) + ['not json\n'])
+        operations = banking_system_replay.read_operations(lines)
+        self.assertEqual(next(operations), self.stream[0])
+        with self.assertRaisesRegex(ValueError, f'line {len(self.stream) + 1}'):
+            list(operations)
+
+    def test_invalid_operation_is_rejected(self):
+        with self.assertRaises(ValueError):
+            list(banking_system_replay.read_operations(['{"op": "withdraw", "args": [1, "account1", 5]}']))
+
+    def test_command_line_reports_throughput(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, 'log.jsonl')
+            results = os.path.join(directory, 'results.jsonl')
+            with open(log, 'w') as file:
+                file.writelines(as_jsonl(self.stream[:20]))
+            stderr = io.StringIO()
+            with redirect_stderr(stderr):
+                banking_system_replay.main([log, '--output', results])
+            with open(results) as file:
+                self.assertEqual(len(file.readlines()), 20)
+        self.assertIn('ops/sec', stderr.getvalue())
+
+    def test_database_is_only_written_where_asked(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, 'log.jsonl')
+            database = os.path.join(directory, 'replay.db')
+            with open(log, 'w') as file:
+                file.writelines(as_jsonl(self.stream[:20]))
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                with redirect_stderr(io.StringIO()):
+                    banking_system_replay.main([log, '--output', os.devnull])
+                self.assertEqual(sorted(os.listdir(directory)), ['log.jsonl'])
+                with redirect_stderr(io.StringIO()):
+                    banking_system_replay.main([log, '--output', os.devnull, '--db-path', database])
+                self.assertTrue(os.path.exists(database))
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
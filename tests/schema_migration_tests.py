@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl, Query, SCHEMA_VERSION, format_payment, parse_payment
+
+
+legacy_tables = """
+CREATE TABLE user_data (account_id VARCHAR(255), create_date TIMESTAMP, active BOOLEAN DEFAULT True,
+                        merge_id VARCHAR(255), merge_date TIMESTAMP, account_balance INT DEFAULT 0);
+CREATE TABLE balances (account_id VARCHAR(255), amount INT, account_date TIMESTAMP);
+CREATE TABLE transactions (account_id VARCHAR(255), amount INT, date_of_transaction TIMESTAMP,
+                           type_of_transaction VARCHAR(255), payment_number VARCHAR(255), cashback_date TIMESTAMP);
+CREATE TABLE balance_history (account_id VARCHAR(255), amount INT, balance_date TIMESTAMP, merge_date TIMESTAMP);
+INSERT INTO user_data VALUES ('account1', 1, 1, 1, 1, 1);
+INSERT INTO balances VALUES ('account1', 700, 3);
+INSERT INTO transactions VALUES ('account1', 500, 2, 'deposit', NULL, NULL);
+INSERT INTO transactions VALUES ('account1', -300, 3, 'payment', 'payment1', 86400003);
+INSERT INTO transactions VALUES ('account1', -100, 4, 'transfer', 'None', NULL);
+INSERT INTO balance_history VALUES ('account1', 0, 1, NULL);
+"""
+
+
+class SchemaMigrationTests(unittest.TestCase):
+    """
+    Tests for the versioned schema and its migrations.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'legacy.db')
+        self.query = Query(self.path)
+        self.query.cur.executescript(legacy_tables)
+
+    def tearDown(self):
+        self.query.disconnect()
+        self.directory.cleanup()
+
+    def index_names(self):
+        rows = self.query.cur.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+        return {name for name, in rows}
+
+    def test_new_database_is_at_current_version(self):
+        system = BankingSystemImpl()
+        self.assertEqual(system.schema_version(), SCHEMA_VERSION)
+        self.assertEqual(system.migrate_schema(), 0)
+
+    def test_migration_adds_keys_and_indexes_and_keeps_rows(self):
+        self.assertEqual(self.query.schema_version(), 0)
+        self.assertEqual(self.query.migrate_schema(), SCHEMA_VERSION)
+        self.assertEqual(self.query.schema_version(), SCHEMA_VERSION)
+        self.assertIn('balance_history_account_date', self.index_names())
+        self.assertIn('transactions_account_type_cashback', self.index_names())
+        self.assertIn('sqlite_autoindex_user_data_1', self.index_names())
+        self.assertEqual(self.query.get_account_balance('account1'), 700)
+        pending = self.query.cur.execute(
+            "SELECT payment_id FROM transactions WHERE type_of_transaction=3 AND cashback_settled=0"
+        ).fetchall()
+        self.assertEqual(pending, [(1,)])
+
+    def test_migration_stores_integer_keys_and_codes(self):
+        self.query.migrate_schema()
+        rows = self.query.cur.execute(
+            "SELECT account_key, type_of_transaction, payment_id FROM transactions ORDER BY rowid"
+        ).fetchall()
+        key, = self.query.cur.execute("SELECT account_key FROM accounts WHERE account_id='account1'").fetchone()
+        self.assertEqual(rows, [(key, 1, None), (key, 3, 1), (key, 2, None)])
+        self.assertEqual(self.query.cur.execute("SELECT account_key FROM balance_history").fetchall(), [(key,)])
+
+    def test_new_rows_store_integers(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.create_account(2, 'account2')
+        system.deposit(3, 'account1', 100)
+        system.transfer(4, 'account1', 'account2', 10)
+        self.assertEqual(system.pay(5, 'account1', 10), 'payment1')
+        types = system.execute_script(
+            "SELECT DISTINCT typeof(account_key), typeof(type_of_transaction), typeof(payment_id) FROM transactions"
+        )
+        self.assertEqual(sorted(types), [('integer', 'integer', 'integer'), ('integer', 'integer', 'null')])
+        self.assertIsNone(system.get_payment_status(6, 'account1', 'payment01'))
+        system.disconnect()
+
+    def test_payment_numbers_round_trip(self):
+        self.assertEqual(parse_payment(format_payment(12)), 12)
+        for payment in ('None', 'payment', 'payment05', 'payment-1', 'account1', None):
+            self.assertIsNone(parse_payment(payment))
+
+    def test_payment_sequence_continues_after_migration(self):
+        self.query.migrate_schema()
+        self.assertEqual(self.query.next_sequence_value('payment'), 2)
+
+    def test_lookups_use_indexes_after_migration(self):
+        self.query.migrate_schema()
+        plan = self.query.cur.execute(
+            "EXPLAIN QUERY PLAN SELECT amount FROM balance_history WHERE account_key=? AND balance_date <= ?",
+            (1, 5),
+        ).fetchall()
+        self.assertIn('USING INDEX balance_history_account_date', plan[0][-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from banking_system_impl import create_banking_system
+from banking_system_sharded import ShardedBankingSystem, shard_path
+from benchmarks.engine_comparison import operation_stream
+from benchmarks.workload import operation_mix, parse_mix, setup_stream
+
+
+class ShardedBankingSystemTests(unittest.TestCase):
+    """
+    Tests for the hash-sharded engine and its cross-shard two-phase protocol.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'bank.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def accounts_on_two_shards(self, system):
+        first = system.shard_of('account0')
+        other = next(f"account{i}" for i in range(1, 100) if system.shard_of(f"account{i}") is not first)
+        return 'account0', other
+
+    def test_results_match_memory_engine(self):
+        mix = parse_mix('merge_accounts=10,pay=20,deposit=20,transfer=20,top_spenders=5,get_balance=10,get_payment_status=5')
+        stream = []
+        for start in range(0, 1200, 200):
+            # Opening every account again re-creates the ones merged away so far
+            stream += [(op, (start * 100_000 + timestamp, account_id)) for op, (timestamp, account_id) in setup_stream(20)]
+            stream += [
+                (op, (start * 100_000 + 100 + args[0],) + args[1:])
+                for op, args in operation_mix(20, 200, mix, max_gap=400, seed=start)
+            ]
+        stream += operation_stream(accounts=30, operations=1000, seed=5)
+        memory = create_banking_system('memory')
+        expected = [getattr(memory, op)(*args) for op, args in stream]
+        system = create_banking_system('sharded', shards=3, db_path=':memory:')
+        self.assertEqual([getattr(system, op)(*args) for op, args in stream], expected)
+        system.disconnect()
+
+    def test_failed_receiver_rolls_back_both_shards(self):
+        system = ShardedBankingSystem(2, self.path)
+        source, target = self.accounts_on_two_shards(system)
+        system.create_account(1, source)
+        system.create_account(2, target)
+        system.deposit(3, source, 100)
+
+        def broken_credit(*args, **kwargs):
+            raise RuntimeError('receiver failed')
+
+        system.shard_of(target).credit = broken_credit
+        with self.assertRaises(RuntimeError):
+            system.transfer(4, source, target, 40)
+        del system.shard_of(target).credit
+        self.assertEqual(system.get_balance(5, source, 5), 100)
+        self.assertEqual(system.top_spenders(5, 1), [f"{source}(0)"])
+        self.assertEqual(system.recover(), 0)
+        self.assertEqual(system.transfer(6, source, target, 40), 60)
+        self.assertEqual(system.get_balance(7, target, 7), 40)
+        system.disconnect()
+
+    def test_committed_messages_are_delivered_once_on_reopen(self):
+        system = ShardedBankingSystem(2, self.path)
+        source, target = self.accounts_on_two_shards(system)
+        system.create_account(1, source)
+        system.create_account(2, target)
+        system.deposit(3, source, 100)
+        sender, receiver = system.shard_of(source), system.shard_of(target)
+        # Stop after the sender committed, as if the process died before the receiver did
+        payload = {"op": "credit", "timestamp": 4, "account_id": target, "amount": 40}
+        with sender.transaction():
+            sender.debit(4, source, 40)
+            txid = sender.send(receiver.index, payload)
+        system.disconnect()
+
+        system = ShardedBankingSystem(2, self.path, reset=False)
+        self.assertEqual(system.get_balance(5, target, 5), 40)
+        self.assertEqual(system.recover(), 0)
+        system.shard_of(target).receive(system.shard_of(source).index, txid, payload)
+        self.assertEqual(system.get_balance(5, target, 5), 40)
+        self.assertEqual(system.get_balance(5, source, 5), 60)
+        system.disconnect()
+
+    def test_payment_numbers_are_global_and_survive_reopening(self):
+        system = ShardedBankingSystem(4, self.path)
+        ids = [f"account{i}" for i in range(8)]
+        for timestamp, account_id in enumerate(ids, 1):
+            system.create_account(timestamp, account_id)
+            system.deposit(timestamp, account_id, 100)
+        self.assertEqual([system.pay(10 + i, account_id, 1) for i, account_id in enumerate(ids)],
+                         [f"payment{i}" for i in range(1, 9)])
+        system.disconnect()
+        system = ShardedBankingSystem(4, self.path, reset=False)
+        self.assertEqual(system.pay(20, 'account3', 1), 'payment9')
+        system.disconnect()
+        with self.assertRaisesRegex(ValueError, 'shard'):
+            ShardedBankingSystem(2, self.path, reset=False)
+
+    def test_shard_paths(self):
+        self.assertEqual(shard_path('bank.db', 1), 'bank.shard1.db')
+        self.assertEqual(shard_path(':memory:', 1), ':memory:')
+        self.assertEqual(shard_path('file:bank?mode=memory&cache=shared', 2), 'file:bank.shard2?mode=memory&cache=shared')
+
+
+if __name__ == '__main__':
+    unittest.main()
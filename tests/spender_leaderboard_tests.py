@@ -0,0 +1,61 @@
+import random
+import unittest
+from banking_system_impl import BankingSystemImpl
+from banking_system_indexes import SortedKeys, SpenderLeaderboard
+
+
+class SortedKeysTests(unittest.TestCase):
+
+    def test_matches_sorted_list_under_random_updates(self):
+        rng = random.Random(7)
+        keys = SortedKeys()
+        expected = []
+        for _ in range(5000):
+            if expected and rng.random() < 0.4:
+                key = rng.choice(expected)
+                keys.remove(key)
+                expected.remove(key)
+            else:
+                key = (rng.randint(-50, 0), f"account{rng.randint(0, 99)}")
+                keys.add(key)
+                expected.append(key)
+        expected.sort()
+        self.assertEqual(list(keys), expected)
+        self.assertEqual(keys.first(10), expected[:10])
+        self.assertEqual(len(keys), len(expected))
+
+    def test_missing_key_is_rejected(self):
+        keys = SortedKeys([(0, 'a')])
+        with self.assertRaises(ValueError):
+            keys.remove((0, 'b'))
+
+
+class SpenderLeaderboardTests(unittest.TestCase):
+
+    def test_orders_by_total_then_account_id(self):
+        leaderboard = SpenderLeaderboard({'b': 10, 'a': 10, 'c': 30})
+        leaderboard.add_outgoing('a', 5)
+        leaderboard.add_account('d')
+        self.assertEqual(leaderboard.top(3), [('c', 30), ('a', 15), ('b', 10)])
+
+    def test_merge_moves_total(self):
+        leaderboard = SpenderLeaderboard({'a': 1, 'b': 2})
+        leaderboard.merge('a', 'b')
+        self.assertEqual(leaderboard.top(5), [('a', 3)])
+        self.assertNotIn('b', leaderboard)
+
+    def test_leaderboard_is_reloaded_after_rollback(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.create_account(2, 'account2')
+        system.deposit(3, 'account1', 1000)
+        system.pay(4, 'account1', 100)
+        with self.assertRaises(RuntimeError):
+            with system.transaction():
+                system.transfer(5, 'account1', 'account2', 300)
+                raise RuntimeError('crash')
+        self.assertEqual(system.top_spenders(6, 2), ['account1(100)', 'account2(0)'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from banking_system_impl import BankingSystemImpl, statements
+from benchmarks.engine_comparison import operation_stream
+
+
+class StatementRegistryTests(unittest.TestCase):
+    """
+    Tests for the fixed statement registry and the per-connection prepared statement cache.
+    """
+
+    def test_operations_only_issue_registered_statements(self):
+        system = BankingSystemImpl()
+        system.metrics.enable()
+        for op, args in operation_stream(accounts=10, operations=300, seed=6):
+            getattr(system, op)(*args)
+        system.get_payment_status(1000, 'account1', 'payment1')
+        system.active('account1')
+        system.check_if_value_exists('user_data', 'account_id', 'account1')
+        system.update_account_info('active', True, 'account1')
+        # Anything outside the registry is reported under its normalized SQL text instead.
+        issued = set(system.metrics.snapshot()['statements'])
+        unregistered = [name for name in issued if name not in statements and ' ' in name]
+        self.assertEqual(unregistered, [])
+        self.assertIn('payment_record', issued)
+        self.assertIn('account_row', issued)
+        system.disconnect()
+
+    def test_unknown_columns_and_tables_are_rejected(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        with self.assertRaises(ValueError):
+            system.update_account_info("active=0 --", 1, 'account1')
+        with self.assertRaises(ValueError):
+            system.check_if_value_exists('user_data; DROP TABLE balances', 'account_id', 'account1')
+        self.assertIn('exists_user_data_account_id', statements)
+        system.disconnect()
+
+    def test_connections_cache_prepared_statements(self):
+        system = BankingSystemImpl()
+        self.assertEqual(system.connections.cached_statements, 256)
+        self.assertGreater(system.connections.cached_statements, len(statements))
+        system.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
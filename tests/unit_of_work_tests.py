@@ -0,0 +1,89 @@
+import sqlite3
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class UnitOfWorkTests(unittest.TestCase):
+    """
+    Tests for `Query.transaction` and the single-commit banking operations.
+    """
+
+    def setUp(self):
+        self.system = BankingSystemImpl()
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        self.assertTrue(self.system.create_account(2, 'account2'))
+        self.assertEqual(self.system.deposit(3, 'account1', 1000), 1000)
+
+    def commits(self):
+        return self.system.connections.stats()['commits']
+
+    def test_each_operation_commits_once(self):
+        before = self.commits()
+        self.assertEqual(self.system.transfer(4, 'account1', 'account2', 100), 900)
+        self.assertEqual(self.system.pay(5, 'account1', 100), 'payment1')
+        self.assertTrue(self.system.merge_accounts(6, 'account1', 'account2'))
+        self.assertEqual(self.commits() - before, 3)
+
+    def test_grouped_operations_share_one_commit(self):
+        before = self.commits()
+        with self.system.transaction():
+            for timestamp in range(4, 14):
+                self.system.deposit(timestamp, 'account2', 10)
+            self.assertEqual(self.system.transfer(14, 'account2', 'account1', 50), 50)
+        self.assertEqual(self.commits() - before, 1)
+        self.assertEqual(self.system.deposit(15, 'account1', 0), 1050)
+
+    def test_grouped_operations_are_invisible_until_commit(self):
+        other = sqlite3.connect(self.system.db_name)
+        with self.system.transaction():
+            self.system.deposit(4, 'account2', 500)
+            row = other.execute("SELECT amount FROM balances WHERE account_id='account2'").fetchone()
+            self.assertEqual(row[0], 0)
+        row = other.execute("SELECT amount FROM balances WHERE account_id='account2'").fetchone()
+        self.assertEqual(row[0], 500)
+        other.close()
+
+    def test_failure_rolls_back_whole_unit_of_work(self):
+        with self.assertRaises(RuntimeError):
+            with self.system.transaction():
+                self.system.transfer(4, 'account1', 'account2', 400)
+                raise RuntimeError('crash mid batch')
+        self.assertEqual(self.system.deposit(5, 'account1', 0), 1000)
+        self.assertEqual(self.system.deposit(6, 'account2', 0), 0)
+
+    def test_rolled_back_payment_does_not_use_up_its_number(self):
+        with self.assertRaises(RuntimeError):
+            with self.system.transaction():
+                self.assertEqual(self.system.pay(4, 'account1', 100), 'payment1')
+                raise RuntimeError('crash')
+        self.assertEqual(self.system.pay(5, 'account1', 100), 'payment1')
+
+    def test_nested_failure_only_undoes_inner_block(self):
+        with self.system.transaction():
+            self.system.deposit(4, 'account2', 100)
+            try:
+                with self.system.transaction():
+                    self.system.deposit(5, 'account2', 200)
+                    raise RuntimeError('inner failure')
+            except RuntimeError:
+                pass
+        self.assertEqual(self.system.deposit(6, 'account2', 0), 100)
+
+    def test_failed_commit_rolls_back(self):
+        def deny_commit(action, argument, *_):
+            if action == sqlite3.SQLITE_TRANSACTION and argument == 'COMMIT':
+                return sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_OK
+
+        with self.assertRaises(sqlite3.DatabaseError):
+            with self.system.transaction():
+                self.system.deposit(4, 'account2', 100)
+                self.system.conn.set_authorizer(deny_commit)
+        self.system.conn.set_authorizer(None)
+        self.assertFalse(self.system.conn.in_transaction)
+        self.assertEqual(self.system.deposit(5, 'account2', 0), 0)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
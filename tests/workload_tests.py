@@ -0,0 +1,51 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from banking_system_impl import ENGINES
+from benchmarks import scaling
+from benchmarks.workload import TIMESTAMP_GAPS, operation_mix, parse_mix
+
+
+class WorkloadTests(unittest.TestCase):
+    """
+    Tests for the benchmark workload generator and scaling report.
+    """
+
+    def test_same_seed_gives_same_stream(self):
+        first = list(operation_mix(50, 200, seed=7))
+        self.assertEqual(list(operation_mix(50, 200, seed=7)), first)
+        self.assertNotEqual(list(operation_mix(50, 200, seed=8)), first)
+
+    def test_mix_and_timestamps(self):
+        mix = parse_mix('deposit=3,pay=1')
+        for timestamps in TIMESTAMP_GAPS:
+            stream = list(operation_mix(10, 500, mix, timestamps))
+            self.assertEqual({name for name, _ in stream}, {'deposit', 'pay'})
+            times = [args[0] for _, args in stream]
+            self.assertEqual(times, sorted(set(times)))
+            self.assertGreater(times[0], 10)
+        with self.assertRaises(ValueError):
+            parse_mix('withdraw=1')
+
+    def test_report_has_latency_percentiles(self):
+        result = scaling.run('memory', 20, 300, seed=1)
+        self.assertEqual(sum(stats['count'] for stats in result['methods'].values()), 300)
+        for stats in result['methods'].values():
+            self.assertLessEqual(stats['p50_us'], stats['p99_us'])
+        self.assertIsNone(result['db_bytes'])
+        self.assertGreater(scaling.run('sqlite', 20, 50)['db_bytes'], 0)
+
+    def test_every_engine_runs_from_the_command_line(self):
+        with redirect_stdout(io.StringIO()) as output:
+            scaling.main(['--engine', *ENGINES, '--accounts', '10', '--operations', '20', '--db-path', ':memory:'])
+        self.assertEqual(len(output.getvalue().splitlines()), len(ENGINES) + 1)
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(scaling.percentile(values, 0.50), 50)
+        self.assertEqual(scaling.percentile(values, 0.99), 99)
+        self.assertEqual(scaling.percentile([5], 0.99), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()